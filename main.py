@@ -1,16 +1,28 @@
 import sys
 import os
+import io
 import random
 import threading
 import time
 import multiprocessing
 import queue
+import re
+import fnmatch
+import itertools
+import operator
+import unicodedata
+import bisect
+import mmap
+import struct
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque, Counter, OrderedDict
+from array import array
 
 # 尝试导入Windows API用于全局快捷键
 try:
     import win32api
     import win32con
-    import win32gui
     import ctypes
     from ctypes import wintypes
     GLOBAL_HOTKEY_AVAILABLE = True
@@ -18,53 +30,282 @@ except ImportError:
     GLOBAL_HOTKEY_AVAILABLE = False
     print("警告: 无法导入win32api，全局快捷键功能将不可用")
 
+# 尝试导入 NumPy 用于响度分析
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("警告: 无法导入numpy，响度均衡功能将不可用")
+
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
-                             QWidget, QPushButton, QLabel, QSlider, QListWidget, 
+                             QWidget, QPushButton, QLabel, QSlider, QListView, 
                              QFileDialog, QMessageBox, QSystemTrayIcon, QMenu, 
-                             QAction, QComboBox, QSplitter, QListWidgetItem, QShortcut,
+                             QAction, QComboBox, QSplitter, QAbstractItemView, QShortcut,
                              QLineEdit, QInputDialog, QDialog, QFormLayout, QKeySequenceEdit,
-                             QDialogButtonBox, QGroupBox)
-from PyQt5.QtCore import Qt, QTimer, QUrl, pyqtSignal, QSettings, QEvent
-from PyQt5.QtGui import QIcon, QPixmap, QFont, QKeySequence
+                             QDialogButtonBox, QGroupBox, QProgressBar, QCheckBox,
+                             QStyle, QStyleOptionSlider)
+from PyQt5.QtCore import (Qt, QTimer, QUrl, pyqtSignal, QSettings, QEvent, QObject,
+                          QAbstractListModel, QModelIndex)
+from PyQt5.QtGui import QIcon, QPixmap, QFont, QKeySequence, QBrush, QPainter, QColor, QPalette
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent, QMediaPlaylist
 import json
+import tempfile
+import sqlite3
 import pygame
 import mutagen
 from mutagen.mp3 import MP3
 from mutagen.id3 import ID3NoHeaderError
 
 
-# 自定义事件类
-class ShowWindowEvent(QEvent):
-    def __init__(self):
-        super().__init__(QEvent.User + 1)
+# 全局快捷键后端
+class HotkeyBackend:
+    """全局快捷键后端的共同接口（Win32HotkeyBackend 和测试用的 FakeHotkeyBackend）。
 
+    update_hotkeys() 和 stop() 可以从其他线程调用，负责唤醒阻塞中的 run()。
+    """
 
-class TogglePlayEvent(QEvent):
-    def __init__(self):
-        super().__init__(QEvent.User + 2)
+    ACTIONS = ('show_window', 'toggle_play', 'previous_song', 'next_song')
 
+    def run(self, hotkeys, on_hotkey, on_failed):
+        """在后端自己的线程中阻塞运行：先注册快捷键，然后阻塞等待按键，按下时调用 on_hotkey(动作名)，
+        注册失败时调用 on_failed([(动作名, 快捷键, 原因), ...])；stop() 之后返回"""
 
-class PreviousSongEvent(QEvent):
-    def __init__(self):
-        super().__init__(QEvent.User + 3)
+    def update_hotkeys(self, hotkeys):
+        """重新注册快捷键（{动作名: 快捷键字符串}）"""
 
+    def stop(self):
+        """让 run() 退出"""
 
-class NextSongEvent(QEvent):
-    def __init__(self):
-        super().__init__(QEvent.User + 4)
 
+class Win32HotkeyBackend(HotkeyBackend):
+    """用 RegisterHotKey 注册全局快捷键，用 GetMessageW 阻塞等待 WM_HOTKEY；
+    其他线程通过 PostThreadMessageW 唤醒消息循环（更新快捷键用 WM_APP，停止用 WM_QUIT）"""
+
+    WM_UPDATE_HOTKEYS = 0x8000      # WM_APP
+
+    # 命名按键到 Win32 虚拟键码的映射，必须与 HotkeyLineEdit 录入的字符串保持一致
+    NAMED_KEYS = {
+        'space': 'VK_SPACE', 'enter': 'VK_RETURN', 'return': 'VK_RETURN',
+        'left': 'VK_LEFT', 'right': 'VK_RIGHT', 'up': 'VK_UP', 'down': 'VK_DOWN',
+        'delete': 'VK_DELETE', 'del': 'VK_DELETE', 'backspace': 'VK_BACK', 'tab': 'VK_TAB',
+        'escape': 'VK_ESCAPE', 'esc': 'VK_ESCAPE', 'home': 'VK_HOME', 'end': 'VK_END',
+        'pgup': 'VK_PRIOR', 'pageup': 'VK_PRIOR', 'pgdown': 'VK_NEXT', 'pagedown': 'VK_NEXT',
+        'ins': 'VK_INSERT', 'insert': 'VK_INSERT',
+    }
 
-# 全局快捷键进程类
-class GlobalHotkeyProcess:
-    """独立进程的全局快捷键管理器"""
-    
     def __init__(self):
+        self._thread_id = None
+        self._ready = threading.Event()
+        self._pending = queue.Queue()   # 等待消息循环注册的新快捷键
+        self._registered = []
+
+    @classmethod
+    def parse_hotkey(cls, hotkey_str):
+        """解析快捷键字符串，返回 (修饰键, 虚拟键码)；无法解析时返回 None"""
+        if not hotkey_str:
+            return None
+
+        modifiers = 0
+        key = 0
+
+        for part in hotkey_str.split('+'):
+            part = part.strip().lower()
+            if part == 'ctrl':
+                modifiers |= win32con.MOD_CONTROL
+            elif part == 'alt':
+                modifiers |= win32con.MOD_ALT
+            elif part == 'shift':
+                modifiers |= win32con.MOD_SHIFT
+            elif part == 'win':
+                modifiers |= win32con.MOD_WIN
+            elif len(part) == 1:
+                # A-Z, 0-9
+                key = ord(part.upper())
+            elif part in cls.NAMED_KEYS:
+                key = getattr(win32con, cls.NAMED_KEYS[part])
+            elif part.startswith('f') and len(part) <= 3:
+                # F1-F12
+                try:
+                    f_num = int(part[1:])
+                    if 1 <= f_num <= 12:
+                        key = win32con.VK_F1 + f_num - 1
+                except ValueError:
+                    pass
+
+        return (modifiers, key) if key else None
+
+    def _unregister(self):
+        for hotkey_id in self._registered:
+            try:
+                ctypes.windll.user32.UnregisterHotKey(None, hotkey_id)  # 使用 NULL
+            except Exception:
+                pass
+        self._registered.clear()
+
+    def _register(self, hotkeys):
+        """注册热键（必须在消息循环所在的线程中调用），返回失败明细"""
+        self._unregister()
+        user32 = ctypes.windll.user32
+        kernel32 = ctypes.windll.kernel32
+        failed_items = []  # [(action, hotkey_str, reason), ...]
+        for action, hotkey_str in hotkeys.items():
+            if action not in self.ACTIONS:
+                continue
+            hotkey_id = self.ACTIONS.index(action) + 1
+
+            key_code = self.parse_hotkey(hotkey_str)
+            if not key_code:
+                failed_items.append((action, hotkey_str, "无法解析按键"))
+                continue
+
+            try:
+                kernel32.SetLastError(0)
+                if user32.RegisterHotKey(None, hotkey_id, key_code[0], key_code[1]):
+                    self._registered.append(hotkey_id)
+                else:
+                    # Windows 错误码 1409 = ERROR_HOTKEY_ALREADY_REGISTERED
+                    err = kernel32.GetLastError()
+                    if err == 1409:
+                        reason = "已被其他程序占用"
+                    else:
+                        reason = f"注册失败 (错误码 {err})"
+                    failed_items.append((action, hotkey_str, reason))
+            except Exception as e:
+                failed_items.append((action, hotkey_str, f"异常: {e}"))
+        return failed_items
+
+    def run(self, hotkeys, on_hotkey, on_failed):
+        user32 = ctypes.windll.user32
+        msg = wintypes.MSG()
+        # 先让这个线程拥有消息队列，之后 PostThreadMessageW 才能送达
+        user32.PeekMessageW(ctypes.byref(msg), None, win32con.WM_USER, win32con.WM_USER, win32con.PM_NOREMOVE)
+        self._thread_id = win32api.GetCurrentThreadId()
+        self._ready.set()
+        try:
+            failed_items = self._register(hotkeys)
+            if failed_items:
+                on_failed(failed_items)
+            # GetMessageW 阻塞到有消息为止，收到 WM_QUIT 时返回 0
+            while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+                if msg.message == win32con.WM_HOTKEY:
+                    # msg.wParam 包含 hotkey_id
+                    if 1 <= msg.wParam <= len(self.ACTIONS):
+                        on_hotkey(self.ACTIONS[msg.wParam - 1])
+                elif msg.message == self.WM_UPDATE_HOTKEYS:
+                    try:
+                        while True:
+                            hotkeys.update(self._pending.get_nowait())
+                    except queue.Empty:
+                        pass
+                    failed_items = self._register(hotkeys)
+                    if failed_items:
+                        on_failed(failed_items)
+        finally:
+            self._unregister()
+
+    def _post(self, message):
+        if self._ready.wait(2.0):
+            ctypes.windll.user32.PostThreadMessageW(self._thread_id, message, 0, 0)
+
+    def update_hotkeys(self, hotkeys):
+        self._pending.put(dict(hotkeys))
+        self._post(self.WM_UPDATE_HOTKEYS)
+
+    def stop(self):
+        self._post(win32con.WM_QUIT)
+
+
+class FakeHotkeyBackend(HotkeyBackend):
+    """进程内的假后端，用来在任何平台上测试快捷键的送达延迟和空闲时的唤醒次数。
+
+    press() 模拟按下一个快捷键；occupied 中的快捷键注册失败（模拟被其他程序占用）。
+    wakeups 记录阻塞等待被唤醒的次数。
+    """
+
+    def __init__(self, occupied=()):
+        self.occupied = {hotkey.lower() for hotkey in occupied}
+        self.hotkeys = {}
+        self.wakeups = 0
+        self._inbox = queue.Queue()
+
+    def _register(self, hotkeys, on_failed):
+        self.hotkeys = {action: hotkey for action, hotkey in hotkeys.items() if action in self.ACTIONS}
+        failed_items = [(action, hotkey, "已被其他程序占用") for action, hotkey in self.hotkeys.items()
+                        if hotkey.lower() in self.occupied]
+        if failed_items:
+            on_failed(failed_items)
+
+    def run(self, hotkeys, on_hotkey, on_failed):
+        self._register(dict(hotkeys), on_failed)
+        while True:
+            kind, value = self._inbox.get()
+            self.wakeups += 1
+            if kind == 'stop':
+                break
+            elif kind == 'update':
+                self._register(dict(self.hotkeys, **value), on_failed)
+            elif kind == 'press':
+                for action, hotkey in self.hotkeys.items():
+                    if hotkey.lower() == value.lower() and hotkey.lower() not in self.occupied:
+                        on_hotkey(action)
+
+    def press(self, hotkey_str):
+        self._inbox.put(('press', hotkey_str))
+
+    def update_hotkeys(self, hotkeys):
+        self._inbox.put(('update', dict(hotkeys)))
+
+    def stop(self):
+        self._inbox.put(('stop', None))
+
+
+def _serve_hotkeys(backend, hotkeys, command_queue, event_queue):
+    """运行快捷键后端：命令线程阻塞等待命令并转交给后端，后端阻塞等待按键，两边都不轮询"""
+    def forward_commands():
+        while True:
+            cmd = command_queue.get()
+            if cmd[0] == 'stop':
+                backend.stop()
+                break
+            elif cmd[0] == 'update_hotkeys':
+                backend.update_hotkeys(cmd[1])
+
+    threading.Thread(target=forward_commands, daemon=True).start()
+    try:
+        backend.run(dict(hotkeys),
+                    lambda action: event_queue.put(('hotkey', action)),
+                    lambda failed_items: event_queue.put(('hotkey_failed', failed_items)))
+    except Exception as e:
+        print(f"全局快捷键后端异常退出: {e}")
+
+
+def _hotkey_process_main(backend_class, hotkeys, command_queue, event_queue):
+    """全局快捷键进程主函数"""
+    _serve_hotkeys(backend_class(), hotkeys, command_queue, event_queue)
+
+
+# 全局快捷键管理器
+class GlobalHotkeyProcess(QObject):
+    """全局快捷键管理器。
+
+    默认在独立进程中运行 Win32HotkeyBackend（不受界面线程卡顿影响）；
+    传入后端实例（例如 FakeHotkeyBackend）时改在本进程的线程中运行。
+    界面一侧由一个阻塞读取事件队列的线程把按键转成 Qt 信号，事件到达时才唤醒界面线程。
+    """
+
+    triggered = pyqtSignal(str)             # 动作名（show_window / toggle_play / previous_song / next_song）
+    registration_failed = pyqtSignal(list)  # [(动作名, 快捷键, 原因), ...]
+
+    def __init__(self, backend=None, parent=None):
+        super().__init__(parent)
+        self.backend = backend
         self.process = None
         self.command_queue = None
         self.event_queue = None
         self.is_running = False
-        
+        self.delivered = 0      # 读取线程被唤醒的次数（每次一个事件）
+
         # 默认快捷键设置（使用 Ctrl+Alt+Shift 组合，避免冲突）
         self.hotkeys = {
             'show_window': 'Ctrl+Alt+Shift+M',
@@ -72,10 +313,14 @@ class GlobalHotkeyProcess:
             'previous_song': 'Ctrl+Alt+Shift+Left',
             'next_song': 'Ctrl+Alt+Shift+Right'
         }
-    
+
+    @property
+    def available(self):
+        return self.backend is not None or GLOBAL_HOTKEY_AVAILABLE
+
     def start(self, hotkeys=None):
-        """启动全局快捷键进程"""
-        if not GLOBAL_HOTKEY_AVAILABLE:
+        """启动全局快捷键后端"""
+        if not self.available:
             return False
 
         if self.is_running:
@@ -85,300 +330,2567 @@ class GlobalHotkeyProcess:
             self.hotkeys.update(hotkeys)
 
         try:
-            self.command_queue = multiprocessing.Queue()
-            self.event_queue = multiprocessing.Queue()
-
-            self.process = multiprocessing.Process(
-                target=self._hotkey_process_main,
-                args=(self.hotkeys, self.command_queue, self.event_queue),
-                daemon=True
-            )
+            if self.backend is not None:
+                self.command_queue = queue.Queue()
+                self.event_queue = queue.Queue()
+                self.process = threading.Thread(
+                    target=_serve_hotkeys,
+                    args=(self.backend, self.hotkeys, self.command_queue, self.event_queue),
+                    daemon=True
+                )
+            else:
+                self.command_queue = multiprocessing.Queue()
+                self.event_queue = multiprocessing.Queue()
+                self.process = multiprocessing.Process(
+                    target=_hotkey_process_main,
+                    args=(Win32HotkeyBackend, self.hotkeys, self.command_queue, self.event_queue),
+                    daemon=True
+                )
             self.process.start()
+            threading.Thread(target=self._read_events, args=(self.event_queue,), daemon=True).start()
             self.is_running = True
             return True
 
         except Exception:
             return False
-    
+
     def stop(self):
-        """停止全局快捷键进程"""
+        """停止全局快捷键后端"""
         if not self.is_running:
             return
 
         try:
-            if self.command_queue:
-                self.command_queue.put(('stop',))
-
-            if self.process and self.process.is_alive():
-                self.process.join(timeout=2.0)
-                if self.process.is_alive():
-                    self.process.terminate()
-                    self.process.join()
-
-            self.is_running = False
+            self.command_queue.put(('stop',))
+            self.process.join(timeout=2.0)
+            if isinstance(self.process, multiprocessing.Process) and self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.event_queue.put(None)     # 结束读取线程
         except Exception:
             pass
-    
+        self.is_running = False
+
     def update_hotkeys(self, hotkeys):
         """更新快捷键设置"""
         self.hotkeys.update(hotkeys)
         if self.is_running and self.command_queue:
             try:
-                self.command_queue.put(('update_hotkeys', hotkeys))
-            except:
+                self.command_queue.put(('update_hotkeys', dict(hotkeys)))
+            except Exception:
                 pass
-    
-    def get_events(self):
-        """获取快捷键事件"""
-        events = []
-        if self.event_queue:
+
+    def _read_events(self, event_queue):
+        """读取线程：阻塞等待后端送来的事件，转成 Qt 信号（排队送到界面线程）"""
+        while True:
             try:
-                while True:
-                    event = self.event_queue.get_nowait()
-                    events.append(event)
-            except:
-                pass
-        return events
-    
+                event = event_queue.get()
+            except (EOFError, OSError):
+                break
+            if event is None:
+                break
+            self.delivered += 1
+            if event[0] == 'hotkey':
+                self.triggered.emit(event[1])
+            elif event[0] == 'hotkey_failed':
+                self.registration_failed.emit(event[1])
+
+
+# 支持的音频扩展名（小写）
+AUDIO_EXTENSIONS = frozenset(['.mp3', '.wav', '.m4a', '.flac', '.ogg'])
+
+
+def compile_exclude_globs(patterns):
+    """把排除规则（如 "*.tmp;歌词*"）编译成一个不区分大小写的正则，没有规则时返回 None"""
+    if isinstance(patterns, str):
+        patterns = re.split(r'[;\n]', patterns)
+    patterns = [p.strip() for p in patterns or [] if p and p.strip()]
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(p) for p in patterns), re.IGNORECASE)
+
+
+def iter_audio_files(root, exclude_globs=None):
+    """用 os.scandir 流式遍历文件夹，边遍历边产出音频文件路径。
+
+    会跟随符号链接/目录联接，但用 (st_dev, st_ino) 记录已进入的目录，
+    链接成环时不会无限递归。exclude_globs 按文件名或目录名匹配。
+    同一目录内按名称排序，先产出文件，再依次进入子目录。
+    """
+    exclude_re = compile_exclude_globs(exclude_globs)
+    visited = set()
+    stack = [root]
+
+    while stack:
+        folder = stack.pop()
+        try:
+            st = os.stat(folder)
+        except OSError:
+            continue
+        dir_key = (st.st_dev, st.st_ino)
+        if dir_key in visited:
+            continue
+        visited.add(dir_key)
+
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name.lower())
+        except OSError:
+            continue
+
+        sub_dirs = []
+        for entry in entries:
+            if exclude_re and exclude_re.match(entry.name):
+                continue
+            try:
+                if entry.is_dir():
+                    sub_dirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                    yield entry.path
+            except OSError:
+                continue
+
+        # 倒序入栈，保证按名称顺序进入子目录
+        stack.extend(reversed(sub_dirs))
+
+
+def parse_song_info(file_path):
+    """解析歌曲标签信息（不依赖界面对象，可在后台线程中调用）"""
+    song_info = {
+        'path': file_path,
+        'title': os.path.basename(file_path),
+        'artist': '未知艺术家',
+        'album': '未知专辑',
+        'duration': 0
+    }
+
+    try:
+        audio_file = mutagen.File(file_path)
+        if audio_file is not None:
+            # 获取标题
+            if 'TIT2' in audio_file:
+                song_info['title'] = str(audio_file['TIT2'])
+            elif 'TITLE' in audio_file:
+                song_info['title'] = str(audio_file['TITLE'][0])
+
+            # 获取艺术家
+            if 'TPE1' in audio_file:
+                song_info['artist'] = str(audio_file['TPE1'])
+            elif 'ARTIST' in audio_file:
+                song_info['artist'] = str(audio_file['ARTIST'][0])
+
+            # 获取专辑
+            if 'TALB' in audio_file:
+                song_info['album'] = str(audio_file['TALB'])
+            elif 'ALBUM' in audio_file:
+                song_info['album'] = str(audio_file['ALBUM'][0])
+
+            # 获取时长
+            if hasattr(audio_file, 'info') and hasattr(audio_file.info, 'length'):
+                song_info['duration'] = int(audio_file.info.length)
+    except Exception:
+        pass
+
+    return song_info
+
+
+def read_song_info(file_path, cache=None):
+    """获取歌曲信息：先查元数据缓存，未命中时才解析标签并写回缓存"""
+    st = None
+    if cache is not None:
+        song_info, st = cache.lookup(file_path)
+        if song_info is not None:
+            return song_info
+
+    song_info = parse_song_info(file_path)
+    if cache is not None and st is not None:
+        cache.store(file_path, st, song_info)
+    return song_info
+
+
+# 元数据磁盘缓存
+class MetadataCache:
+    """歌曲元数据的磁盘缓存（SQLite）。
+
+    以 规范化路径 + 文件大小 + 修改时间 作为有效性判断，文件没有变化时
+    只需要一次 os.stat 就能拿到标签信息，不必再用 mutagen 解析。
+    可以在多个线程中同时使用（内部加锁）。
+    """
+
+    # 只缓存标签解析出来的字段，display_name 等用户数据不属于缓存
+    INFO_FIELDS = ('title', 'artist', 'album', 'duration')
+    FLUSH_EVERY = 200                   # 累积多少条新记录提交一次事务
+    EVICT_INTERVAL = 7 * 24 * 3600      # 清理失效记录的最短间隔（秒）
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = []
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " info TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seek_index ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS loudness ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " loudness REAL NOT NULL,"
+            " peak REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS waveform ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
     @staticmethod
-    def _hotkey_process_main(hotkeys, command_queue, event_queue):
-        """全局快捷键进程主函数"""
-        if not GLOBAL_HOTKEY_AVAILABLE:
-            return
+    def make_key(file_path):
+        """规范化路径作为缓存键（Windows 下不区分大小写和斜杠方向）"""
+        return os.path.normcase(os.path.abspath(file_path))
 
-        # 创建消息窗口用于接收热键消息
-        message_hwnd = None
+    def lookup(self, file_path):
+        """查询缓存，返回 (song_info 或 None, os.stat 结果或 None)"""
         try:
-            # 定义窗口类
-            wc = win32gui.WNDCLASS()
-            wc.lpfnWndProc = lambda hwnd, msg, wp, lp: win32gui.DefWindowProc(hwnd, msg, wp, lp)
-            wc.lpszClassName = "HotkeyMessageWindow"
-            wc.hInstance = win32api.GetModuleHandle(None)
-
-            # 注册窗口类
-            class_atom = win32gui.RegisterClass(wc)
-
-            # 创建一个隐藏的真实窗口（而不是消息窗口）
-            # 全局热键需要真实窗口，不能使用 HWND_MESSAGE
-            message_hwnd = win32gui.CreateWindowEx(
-                win32con.WS_EX_TOOLWINDOW,      # dwExStyle (工具窗口，不显示在任务栏)
-                class_atom,                     # lpClassName
-                "HotkeyWindow",                 # lpWindowName
-                win32con.WS_POPUP,              # dwStyle (弹出窗口，无边框)
-                -100, -100, 1, 1,              # x, y, width, height (屏幕外的1x1像素)
-                None,                           # hWndParent
-                0, wc.hInstance, None
-            )
-            # 确保窗口完全隐藏
-            if message_hwnd:
-                win32gui.ShowWindow(message_hwnd, 0)
-            win32gui.PumpWaitingMessages()
+            st = os.stat(file_path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        key = self.make_key(file_path)
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, info FROM metadata WHERE path = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                self.hits += 1
+            else:
+                self.misses += 1
+                return None, st
 
-        except Exception:
-            pass
+        try:
+            song_info = {'path': file_path}
+            song_info.update(json.loads(row[2]))
+            return song_info, st
+        except (ValueError, TypeError):
+            return None, st
+
+    def store(self, file_path, st, song_info):
+        """写入一条缓存记录（先放入待提交队列，攒够一批再提交）"""
+        info = {k: song_info[k] for k in self.INFO_FIELDS if k in song_info}
+        record = (self.make_key(file_path), st.st_size, st.st_mtime_ns,
+                  json.dumps(info, ensure_ascii=False))
+        with self._lock:
+            self._pending.append(record)
+            if len(self._pending) >= self.FLUSH_EVERY:
+                self._flush_locked()
+
+    def lookup_seek_index(self, file_path):
+        """查询 MP3 帧索引，返回 (Mp3SeekIndex 或 None, os.stat 结果或 None)"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None, None
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, data FROM seek_index WHERE path = ?",
+                    (self.make_key(file_path),)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return Mp3SeekIndex.from_bytes(row[2]), st
+        return None, st
+
+    def store_seek_index(self, file_path, st, index):
+        """写入 MP3 帧索引（很少发生，直接提交）"""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO seek_index (path, size, mtime_ns, data) VALUES (?, ?, ?, ?)",
+                    (self.make_key(file_path), st.st_size, st.st_mtime_ns, index.to_bytes())
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"跳转索引写入失败: {e}")
+
+    def lookup_loudness(self, file_path):
+        """查询响度分析结果，返回 (积分响度 LUFS, 峰值)；没有或文件已经改变时返回 None"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, loudness, peak FROM loudness WHERE path = ?",
+                    (self.make_key(file_path),)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2], row[3]
+        return None
 
-        if not message_hwnd:
-            return
+    def store_loudness(self, file_path, size, mtime_ns, loudness, peak):
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO loudness (path, size, mtime_ns, loudness, peak) VALUES (?, ?, ?, ?, ?)",
+                    (self.make_key(file_path), size, mtime_ns, loudness, peak)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"响度写入失败: {e}")
+
+    def lookup_waveform(self, file_path):
+        """查询波形概览（compute_waveform 的结果）；没有或文件已经改变时返回 None"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, data FROM waveform WHERE path = ?",
+                    (self.make_key(file_path),)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return bytes(row[2])
+        return None
 
-        registered_hotkeys = []
-        running = True
-        
-        # 命名按键到 Win32 虚拟键码的映射，必须与 HotkeyLineEdit 录入的字符串保持一致
-        named_keys = {
-            'space':     win32con.VK_SPACE,
-            'enter':     win32con.VK_RETURN,
-            'return':    win32con.VK_RETURN,
-            'left':      win32con.VK_LEFT,
-            'right':     win32con.VK_RIGHT,
-            'up':        win32con.VK_UP,
-            'down':      win32con.VK_DOWN,
-            'delete':    win32con.VK_DELETE,
-            'del':       win32con.VK_DELETE,
-            'backspace': win32con.VK_BACK,
-            'tab':       win32con.VK_TAB,
-            'escape':    win32con.VK_ESCAPE,
-            'esc':       win32con.VK_ESCAPE,
-            'home':      win32con.VK_HOME,
-            'end':       win32con.VK_END,
-            'pgup':      win32con.VK_PRIOR,
-            'pageup':    win32con.VK_PRIOR,
-            'pgdown':    win32con.VK_NEXT,
-            'pagedown':  win32con.VK_NEXT,
-            'ins':       win32con.VK_INSERT,
-            'insert':    win32con.VK_INSERT,
+    def store_waveform(self, file_path, size, mtime_ns, data):
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO waveform (path, size, mtime_ns, data) VALUES (?, ?, ?, ?)",
+                    (self.make_key(file_path), size, mtime_ns, data)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"波形写入失败: {e}")
+
+    def flush(self):
+        """提交所有待写入的记录"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        try:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (path, size, mtime_ns, info) VALUES (?, ?, ?, ?)",
+                self._pending
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"元数据缓存写入失败: {e}")
+        self._pending = []
+
+    def evict_missing(self):
+        """删除文件已经不存在的缓存记录，返回删除条数"""
+        with self._lock:
+            keys = [row[0] for row in self._conn.execute("SELECT path FROM metadata")]
+
+        # 逐个检查文件是否存在时不持有锁，避免阻塞扫描线程
+        gone = [(key,) for key in keys if not os.path.exists(key)]
+
+        with self._lock:
+            if gone:
+                self._conn.executemany("DELETE FROM metadata WHERE path = ?", gone)
+                self._conn.executemany("DELETE FROM seek_index WHERE path = ?", gone)
+                self._conn.executemany("DELETE FROM loudness WHERE path = ?", gone)
+                self._conn.executemany("DELETE FROM waveform WHERE path = ?", gone)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('last_evict', ?)",
+                (str(time.time()),)
+            )
+            self._conn.commit()
+        return len(gone)
+
+    def maybe_evict_missing(self):
+        """距离上次清理超过 EVICT_INTERVAL 才执行清理（适合在后台线程调用）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_meta WHERE key = 'last_evict'"
+            ).fetchone()
+        try:
+            last_evict = float(row[0]) if row else 0.0
+        except ValueError:
+            last_evict = 0.0
+        if time.time() - last_evict < self.EVICT_INTERVAL:
+            return 0
+        return self.evict_missing()
+
+    def stats(self):
+        """返回命中统计：{'hits', 'misses', 'hit_rate', 'entries'}"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'entries': entries,
         }
 
-        def parse_hotkey(hotkey_str):
-            """解析快捷键字符串"""
-            if not hotkey_str:
-                return None
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
 
-            modifiers = 0
-            key = 0
-
-            parts = hotkey_str.split('+')
-            for part in parts:
-                part = part.strip().lower()
-                if part == 'ctrl':
-                    modifiers |= win32con.MOD_CONTROL
-                elif part == 'alt':
-                    modifiers |= win32con.MOD_ALT
-                elif part == 'shift':
-                    modifiers |= win32con.MOD_SHIFT
-                elif part == 'win':
-                    modifiers |= win32con.MOD_WIN
-                elif len(part) == 1:
-                    # A-Z, 0-9
-                    key = ord(part.upper())
-                elif part in named_keys:
-                    key = named_keys[part]
-                elif part.startswith('f') and len(part) <= 3:
-                    # F1-F12
-                    try:
-                        f_num = int(part[1:])
-                        if 1 <= f_num <= 12:
-                            key = win32con.VK_F1 + f_num - 1
-                    except:
-                        pass
 
-            return (modifiers, key) if key else None
-        
-        def register_hotkeys():
-            """注册热键"""
-            nonlocal registered_hotkeys
+# 延迟写入的设置
+class DeferredSettings(QObject):
+    """QSettings 的写缓冲层。
+
+    setValue / remove 只记在内存里，最后一次修改后停顿 FLUSH_DELAY 毫秒
+    才统一写盘（退出时由 flush() 立即写盘）。拖动音量条这类连续修改
+    只会产生一次磁盘写入。写盘通过 QSettings.sync() 完成，并要求原子同步：
+    Qt 先写临时文件再整体替换，写到一半崩溃也不会损坏 settings.ini。
+    读取时优先返回尚未落盘的新值，用法与 QSettings 相同。
+    """
+
+    FLUSH_DELAY = 1000  # 毫秒
+
+    _REMOVED = object()  # 标记待删除的键
 
-            # 先注销已注册的热键
-            for hotkey_id in registered_hotkeys:
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self._settings = settings
+        self._settings.setAtomicSyncRequired(True)
+        self._dirty = {}
+        self.flush_count = 0  # 实际写盘次数，便于检查合并效果
+
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.timeout.connect(self.flush)
+
+    def value(self, key, defaultValue=None, type=None):
+        if key in self._dirty:
+            value = self._dirty[key]
+            if value is self._REMOVED:
+                return defaultValue
+            if type is not None:
                 try:
-                    user32 = ctypes.windll.user32
-                    user32.UnregisterHotKey(None, hotkey_id)  # 使用 NULL
-                except:
-                    pass
-            registered_hotkeys.clear()
-
-            # 注册新的热键
-            hotkey_ids = {
-                'show_window': 1,
-                'toggle_play': 2,
-                'previous_song': 3,
-                'next_song': 4
+                    return type(value)
+                except (TypeError, ValueError):
+                    return defaultValue
+            return value
+        if type is None:
+            return self._settings.value(key, defaultValue)
+        return self._settings.value(key, defaultValue, type=type)
+
+    def contains(self, key):
+        if key in self._dirty:
+            return self._dirty[key] is not self._REMOVED
+        return self._settings.contains(key)
+
+    def setValue(self, key, value):
+        self._dirty[key] = value
+        self._flush_timer.start(self.FLUSH_DELAY)
+
+    def remove(self, key):
+        self._dirty[key] = self._REMOVED
+        self._flush_timer.start(self.FLUSH_DELAY)
+
+    def flush(self):
+        """立即把所有待写入的修改写盘"""
+        self._flush_timer.stop()
+        if not self._dirty:
+            return
+
+        for key, value in self._dirty.items():
+            if value is self._REMOVED:
+                self._settings.remove(key)
+            else:
+                self._settings.setValue(key, value)
+        self._dirty.clear()
+
+        self._settings.sync()
+        self.flush_count += 1
+        if self._settings.status() != QSettings.NoError:
+            print(f"设置保存失败: {self._settings.fileName()}")
+
+    def sync(self):
+        self.flush()
+
+
+# 播放列表数据库
+class LibraryStore:
+    """播放列表数据库（SQLite，WAL 模式）。
+
+    每首歌一行，添加、重命名、删除只改动对应的行，不再把整个列表
+    序列化进 settings.ini。歌曲字典里的 'id' 就是这里的行号。
+    """
+
+    TRACK_FIELDS = ('path', 'title', 'artist', 'album', 'duration', 'display_name', 'pinyin')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        try:
+            self._conn = sqlite3.connect(db_path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error as e:
+            # 数据库无法打开时退回内存数据库，至少保证本次运行正常
+            print(f"无法打开播放列表数据库: {e}")
+            self._conn = sqlite3.connect(":memory:")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " path TEXT NOT NULL,"
+            " title TEXT,"
+            " artist TEXT,"
+            " album TEXT,"
+            " duration INTEGER,"
+            " display_name TEXT,"
+            " pinyin TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tracks)")}
+        if 'pinyin' not in columns:
+            # 旧版数据库没有拼音列，加载时补算
+            self._conn.execute("ALTER TABLE tracks ADD COLUMN pinyin TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS library_meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+    def load_tracks(self):
+        """按添加顺序读取所有歌曲"""
+        songs = []
+        cursor = self._conn.execute(
+            "SELECT id, path, title, artist, album, duration, display_name, pinyin"
+            " FROM tracks ORDER BY id"
+        )
+        for row in cursor:
+            song_info = {
+                'id': row[0],
+                'path': row[1],
+                'title': row[2] or os.path.basename(row[1]),
+                'artist': row[3] or '未知艺术家',
+                'album': row[4] or '未知专辑',
+                'duration': row[5] or 0,
             }
+            if row[6]:
+                song_info['display_name'] = row[6]
+            if row[7] is not None:
+                song_info['pinyin'] = row[7]
+            songs.append(song_info)
+        return songs
+
+    def is_empty(self):
+        return self._conn.execute("SELECT 1 FROM tracks LIMIT 1").fetchone() is None
+
+    def insert_tracks(self, songs):
+        """追加歌曲（一个事务），并把新行号写回每个歌曲字典的 'id'"""
+        with self._conn:
+            for song_info in songs:
+                cursor = self._conn.execute(
+                    "INSERT INTO tracks (path, title, artist, album, duration, display_name, pinyin)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    tuple(song_info.get(k) for k in self.TRACK_FIELDS)
+                )
+                song_info['id'] = cursor.lastrowid
+
+    def update_display_name(self, track_id, display_name, pinyin=None):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE tracks SET display_name = ?, pinyin = ? WHERE id = ?",
+                (display_name, pinyin, track_id)
+            )
 
-            success_count = 0
-            failed_items = []  # [(action, hotkey_str, reason), ...]
-            for action, hotkey_str in hotkeys.items():
-                hotkey_id = hotkey_ids.get(action)
-                if not hotkey_id:
-                    continue
+    def update_pinyin(self, songs):
+        """写回补算的拼音搜索键"""
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE tracks SET pinyin = ? WHERE id = ?",
+                [(song_info.get('pinyin'), song_info['id']) for song_info in songs]
+            )
 
-                key_code = parse_hotkey(hotkey_str)
-                if not key_code:
-                    failed_items.append((action, hotkey_str, "无法解析按键"))
-                    continue
+    def delete_tracks(self, track_ids):
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM tracks WHERE id = ?", [(track_id,) for track_id in track_ids]
+            )
 
-                try:
-                    user32 = ctypes.windll.user32
-                    kernel32 = ctypes.windll.kernel32
-                    kernel32.SetLastError(0)
-
-                    result = user32.RegisterHotKey(
-                        None,
-                        hotkey_id,
-                        key_code[0],
-                        key_code[1]
-                    )
-
-                    if result:
-                        registered_hotkeys.append(hotkey_id)
-                        success_count += 1
-                    else:
-                        # Windows 错误码 1409 = ERROR_HOTKEY_ALREADY_REGISTERED
-                        err = kernel32.GetLastError()
-                        if err == 1409:
-                            reason = "已被其他程序占用"
-                        else:
-                            reason = f"注册失败 (错误码 {err})"
-                        failed_items.append((action, hotkey_str, reason))
-                except Exception as e:
-                    failed_items.append((action, hotkey_str, f"异常: {e}"))
-
-            # 通知主进程注册结果（带失败的具体明细）
-            if failed_items:
-                event_queue.put(('hotkey_failed', failed_items))
-            return success_count > 0
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM tracks")
+            self._conn.execute("DELETE FROM library_meta")
+
+    def get_meta(self, key, default=""):
+        row = self._conn.execute(
+            "SELECT value FROM library_meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO library_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+# 后台元数据扫描器
+class MetadataScanner(QObject):
+    """在线程池中并发解析标签，按原顺序分批把结果送回 GUI 线程。
+
+    每次 start() 返回一个扫描编号，所有信号都带着这个编号，
+    这样取消后旧扫描线程残留的信号可以被直接忽略。
+    """
+
+    batch_ready = pyqtSignal(int, object)    # (扫描编号, [song_info, ...])
+    progress = pyqtSignal(int, int, int)     # (扫描编号, 已完成, 总数；总数未知时为 0)
+    finished = pyqtSignal(int, bool)         # (扫描编号, 是否完整结束；False 表示被取消或出错)
+
+    BATCH_SIZE = 200        # 每批最多多少首
+    BATCH_INTERVAL = 0.1    # 距上次发送超过这么多秒就立即发送当前批次
+
+    def __init__(self, parent=None, max_workers=None, cache=None):
+        super().__init__(parent)
+        self.cache = cache
+        # 解析标签主要耗在（网络盘）I/O 上，线程数可以比 CPU 核数多
+        self.max_workers = max_workers or min(16, (os.cpu_count() or 1) * 4)
+        self._scan_id = 0
+        self._cancel_event = threading.Event()
+        self._thread = None
+
+    def start(self, file_paths):
+        """开始扫描，返回本次扫描编号（会先取消正在进行的扫描）"""
+        self.cancel()
+        self._scan_id += 1
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(self._scan_id, file_paths, self._cancel_event),
+            daemon=True
+        )
+        self._thread.start()
+        return self._scan_id
+
+    def cancel(self):
+        """请求取消当前扫描（不等待线程退出，避免阻塞界面）"""
+        self._cancel_event.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
 
+    @staticmethod
+    def _read_track(file_path, cache):
+        """工作线程中读取一首歌：标签信息 + 拼音搜索键（导入时算一次，之后随播放列表保存）"""
+        song_info = read_song_info(file_path, cache)
+        song_info['pinyin'] = track_pinyin(song_info)
+        return song_info
+
+    def _run(self, scan_id, file_paths, cancel_event):
+        """扫描线程主函数"""
         try:
-            # 初始注册热键
-            register_hotkeys()
-            # 主消息循环
-            while running:
-                try:
-                    # 检查命令（非阻塞）
+            total = len(file_paths)
+        except TypeError:
+            total = 0
+
+        # 控制同时提交的任务数量，既能保持线程池满载，又能及时响应取消
+        window = self.max_workers * 4
+        pending = deque()
+        batch = []
+        done = 0
+        last_emit = 0.0  # 第一首解析完立即发送，尽快让列表里有歌可播
+        completed = True
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            path_iter = iter(file_paths)
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < window:
                     try:
-                        cmd = command_queue.get_nowait()
-                        if cmd[0] == 'stop':
-                            running = False
-                            break
-                        elif cmd[0] == 'update_hotkeys':
-                            hotkeys.update(cmd[1])
-                            register_hotkeys()
-                    except:
-                        pass
+                        file_path = next(path_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append(executor.submit(
+                        self._read_track, os.path.normpath(file_path), self.cache
+                    ))
+
+                if not pending:
+                    break
+                if cancel_event.is_set():
+                    completed = False
+                    break
 
-                    # 检查热键消息（非阻塞）
-                    try:
-                        # 使用 ctypes 直接调用 PeekMessageW
-                        # 使用 NULL 窗口句柄获取线程消息队列中的热键消息
-                        msg = wintypes.MSG()
-                        result = ctypes.windll.user32.PeekMessageW(
-                            ctypes.byref(msg),
-                            None,  # NULL - 获取线程的所有消息
-                            win32con.WM_HOTKEY,
-                            win32con.WM_HOTKEY,
-                            win32con.PM_REMOVE
-                        )
-
-                        if result:
-                            # msg.wParam 包含 hotkey_id
-                            hotkey_id = msg.wParam
-                            if hotkey_id == 1:
-                                event_queue.put('show_window')
-                            elif hotkey_id == 2:
-                                event_queue.put('toggle_play')
-                            elif hotkey_id == 3:
-                                event_queue.put('previous_song')
-                            elif hotkey_id == 4:
-                                event_queue.put('next_song')
-                    except Exception:
-                        pass
+                # 按提交顺序取结果，保证播放列表顺序与文件顺序一致
+                batch.append(pending.popleft().result())
+                done += 1
 
-                    time.sleep(0.01)
+                now = time.monotonic()
+                if len(batch) >= self.BATCH_SIZE or now - last_emit >= self.BATCH_INTERVAL:
+                    self.batch_ready.emit(scan_id, batch)
+                    self.progress.emit(scan_id, done, total)
+                    batch = []
+                    last_emit = now
+        except Exception as e:
+            # 遍历文件列表或读取标签时的意外错误：结束扫描，界面不会一直停在“扫描中”
+            print(f"扫描出错: {e}")
+            completed = False
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self.cache is not None:
+                self.cache.flush()
 
-                except Exception:
-                    break
+        # 出错时也把已经读到的歌曲交给界面，取消时不再发送
+        if batch and not cancel_event.is_set():
+            self.batch_ready.emit(scan_id, batch)
+            self.progress.emit(scan_id, done, total)
+        self.finished.emit(scan_id, completed)
 
-        except Exception:
-            pass
-        
+
+# 后台检查歌曲文件是否存在
+class ExistenceChecker(QObject):
+    """启动后在后台逐个检查播放列表里的文件是否还存在。
+
+    网络盘唤醒时 os.path.exists 可能卡住好几秒，放在后台线程里
+    就不会拖慢窗口显示。发现不存在的文件时按批次报告歌曲 id。
+    """
+
+    missing_found = pyqtSignal(int, object)   # (检查编号, [track_id, ...])
+    finished = pyqtSignal(int)                # 检查编号
+
+    BATCH_INTERVAL = 0.2  # 秒
+
+    def __init__(self, parent=None, max_workers=8):
+        super().__init__(parent)
+        self.max_workers = max_workers
+        self._check_id = 0
+        self._cancel_event = threading.Event()
+
+    def start(self, songs):
+        """检查 songs（歌曲字典列表）中的文件，返回检查编号"""
+        self.cancel()
+        self._check_id += 1
+        self._cancel_event = threading.Event()
+        targets = [(song_info['id'], song_info['path']) for song_info in songs]
+        threading.Thread(
+            target=self._run,
+            args=(self._check_id, targets, self._cancel_event),
+            daemon=True
+        ).start()
+        return self._check_id
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def _run(self, check_id, targets, cancel_event):
+        missing = []
+        last_emit = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda t: (t[0], os.path.exists(t[1])), targets)
+            for track_id, exists in results:
+                if cancel_event.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return
+                if not exists:
+                    missing.append(track_id)
+                now = time.monotonic()
+                if missing and now - last_emit >= self.BATCH_INTERVAL:
+                    self.missing_found.emit(check_id, missing)
+                    missing = []
+                    last_emit = now
+
+        if missing:
+            self.missing_found.emit(check_id, missing)
+        self.finished.emit(check_id)
+
+
+# 播放结束检测
+class MusicEndDetector:
+    """根据 pygame.mixer.music 的状态变化判断一首歌已经播放结束，由播放引擎线程在醒来时调用。
+
+    get_busy() 由真变假是自然结束；仍在播放但 get_pos() 明显小于按经过时间推算的位置，
+    是排队的下一首已经接上（get_pos() 从新歌开头重新计数）。两次检查可以隔很久，
+    醒来时新歌已经播放了一段也能发现。只读取混音器状态，不需要 SDL 的视频子系统和事件队列，
+    所以可以在任何线程、任何平台上使用。调用方自己改变播放状态（播放、跳转、停止、暂停）之后
+    要调用 reset()，避免把这些变化当成结束。
+    """
+
+    TOLERANCE_MS = 200  # get_pos() 按混音缓冲区推进，允许的误差
+
+    def __init__(self):
+        self._busy = False
+        self._position = -1
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _state():
+        try:
+            return pygame.mixer.music.get_busy(), pygame.mixer.music.get_pos()
+        except pygame.error:
+            return False, -1
+
+    def reset(self):
+        """以当前状态为基准"""
+        self._busy, self._position = self._state()
+        self._checked_at = time.monotonic()
+
+    def check(self):
+        """自上次调用以来是否有一首歌结束"""
+        busy, position = self._state()
+        now = time.monotonic()
+        expected = self._position + (now - self._checked_at) * 1000
+        ended = (self._busy and not busy) or \
+            (busy and self._position >= 0 and 0 <= position < expected - self.TOLERANCE_MS)
+        self._busy, self._position, self._checked_at = busy, position, now
+        return ended
+
+
+# 切歌间隙统计
+class GapStats:
+    """记录两首歌之间的静音间隙（毫秒），检查是否在预算以内。
+
+    间隙 = 检测到上一首结束时已经过去的时间 - 下一首已经播放的时间，
+    无缝衔接时接近 0，先停再打开下一首时就是打开文件所花的时间。
+    """
+
+    def __init__(self, budget_ms=20.0, keep=200):
+        self.budget_ms = budget_ms
+        self.samples = deque(maxlen=keep)
+        self.count = 0
+        self.over_budget = 0
+        self.max_ms = 0.0
+
+    def record(self, gap_ms):
+        gap_ms = max(0.0, gap_ms)
+        self.samples.append(gap_ms)
+        self.count += 1
+        self.max_ms = max(self.max_ms, gap_ms)
+        if gap_ms > self.budget_ms:
+            self.over_budget += 1
+        return gap_ms
+
+    def summary(self):
+        """最近若干次切歌的 次数/平均/95 分位/最大/超出预算次数"""
+        if not self.samples:
+            return {'count': 0, 'mean': 0.0, 'p95': 0.0, 'max': 0.0, 'over_budget': 0}
+        ordered = sorted(self.samples)
+        return {
+            'count': self.count,
+            'mean': sum(ordered) / len(ordered),
+            'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            'max': self.max_ms,
+            'over_budget': self.over_budget,
+        }
+
+
+# MP3 帧索引（精确跳转）
+class Mp3SeekIndex:
+    """根据 MP3 帧头建立的 时间 -> 字节偏移 索引。
+
+    每隔 STRIDE 帧记录一次（帧的起始偏移, 该帧之前的采样数），跳转时二分查找
+    目标时间之前最近的记录，从那一帧开始解码。VBR 文件没有 Xing 目录也能准确定位，
+    并且知道落点的确切时间，播放位置不会漂移。
+    """
+
+    STRIDE = 8          # 约 0.2 秒（MPEG1 Layer III 每帧 1152 个采样）
+    FORMAT_VERSION = 1
+
+    # 比特率表（kbps），按 (MPEG1?, layer) 索引
+    _BITRATES = {
+        (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+        (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    }
+    # 采样率表，按版本位索引（0: MPEG2.5, 2: MPEG2, 3: MPEG1）
+    _SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+    def __init__(self, sample_rate, offsets, samples, total_samples):
+        self.sample_rate = sample_rate
+        self.offsets = offsets          # array('I')，帧起始字节偏移
+        self.samples = samples          # array('I')，该帧之前的采样数
+        self.total_samples = total_samples
+
+    @property
+    def duration_ms(self):
+        return self.total_samples * 1000 // self.sample_rate
+
+    def locate(self, position_ms):
+        """返回 (字节偏移, 实际落点毫秒)：position_ms 之前最近的索引帧"""
+        target = position_ms * self.sample_rate // 1000
+        i = max(0, bisect.bisect_right(self.samples, target) - 1)
+        return self.offsets[i], self.samples[i] * 1000 // self.sample_rate
+
+    @classmethod
+    def parse_header(cls, header):
+        """解析 4 字节帧头，返回 (帧长度, 每帧采样数, 采样率)，不是有效帧头时返回 None"""
+        value = int.from_bytes(header, 'big')
+        if value >> 21 != 0x7FF:
+            return None
+        version = (value >> 19) & 3
+        layer = 4 - ((value >> 17) & 3)
+        bitrate_index = (value >> 12) & 15
+        rate_index = (value >> 10) & 3
+        if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+            return None  # 保留值或自由格式，视为无效
+        mpeg1 = version == 3
+        bitrate = cls._BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+        sample_rate = cls._SAMPLE_RATES[version][rate_index]
+        padding = (value >> 9) & 1
+        if layer == 1:
+            return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+        if layer == 3 and not mpeg1:
+            return 72 * bitrate // sample_rate + padding, 576, sample_rate
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+
+    @classmethod
+    def build(cls, file_path):
+        """扫描文件中的帧头建立索引；不是 MP3 或找不到帧时返回 None"""
+        with open(file_path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return None  # 空文件
+        try:
+            return cls._scan(data)
         finally:
-            # 清理注册的热键
-            for hotkey_id in registered_hotkeys:
-                try:
-                    ctypes.windll.user32.UnregisterHotKey(None, hotkey_id)
-                except:
-                    pass
+            data.close()
+
+    @classmethod
+    def _scan(cls, data):
+        size = len(data)
+        pos = 0
+        # 跳过 ID3v2 标签（可能有多个）
+        while data[pos:pos + 3] == b'ID3' and pos + 10 <= size:
+            tag_size = 0
+            for byte in data[pos + 6:pos + 10]:
+                tag_size = (tag_size << 7) | (byte & 0x7F)
+            pos += 10 + tag_size + (10 if data[pos + 5] & 0x10 else 0)
+
+        parse = cls.parse_header
+        offsets = array('I')
+        samples = array('I')
+        sample_rate = 0
+        total = 0
+        frame_number = 0
+        first = True
+        while pos + 4 <= size:
+            header = parse(data[pos:pos + 4])
+            if header is None or (first and not cls._confirmed(data, pos, header)):
+                # 失去同步：跳到下一个可能的帧头（到达文件尾的 ID3v1/APE 标签时结束）
+                if data[pos:pos + 3] == b'TAG' or data[pos:pos + 8] == b'APETAGEX':
+                    break
+                next_sync = data.find(b'\xff', pos + 1)
+                if next_sync < 0:
+                    break
+                pos = next_sync
+                first = True
+                continue
+            length, frame_samples, rate = header
+            if not sample_rate:
+                sample_rate = rate
+                # 第一帧可能是 Xing/Info/VBRI 信息帧，不含音频
+                if cls._is_info_frame(data, pos, length):
+                    pos += length
+                    continue
+            first = False
+            if frame_number % cls.STRIDE == 0:
+                offsets.append(pos)
+                samples.append(total)
+            frame_number += 1
+            total += frame_samples
+            pos += length
+
+        if not frame_number:
+            return None
+        return cls(sample_rate, offsets, samples, total)
+
+    @classmethod
+    def _confirmed(cls, data, pos, header):
+        """重新同步时要求紧接着的一帧也是有效帧头，避免把音频数据误认为帧头"""
+        next_pos = pos + header[0]
+        if next_pos + 4 > len(data):
+            return True
+        return cls.parse_header(data[next_pos:next_pos + 4]) is not None
+
+    @staticmethod
+    def _is_info_frame(data, pos, length):
+        frame = data[pos + 4:pos + min(length, 64)]
+        return b'Xing' in frame or b'Info' in frame or b'VBRI' in frame
+
+    def to_bytes(self):
+        head = struct.pack('<BIII', self.FORMAT_VERSION, self.sample_rate,
+                           len(self.offsets), self.total_samples)
+        return head + self.offsets.tobytes() + self.samples.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """反序列化；格式不匹配时返回 None"""
+        head_size = struct.calcsize('<BIII')
+        if len(blob) < head_size:
+            return None
+        version, sample_rate, count, total = struct.unpack_from('<BIII', blob)
+        if version != cls.FORMAT_VERSION or len(blob) != head_size + count * 8:
+            return None
+        offsets = array('I')
+        offsets.frombytes(blob[head_size:head_size + count * 4])
+        samples = array('I')
+        samples.frombytes(blob[head_size + count * 4:])
+        return cls(sample_rate, offsets, samples, total)
+
 
-            # 销毁消息窗口
-            if message_hwnd:
+class FileSlice(io.RawIOBase):
+    """把一个可随机访问的二进制文件对象从 offset 开始的部分当作独立文件读取
+    （交给 pygame 从某一帧开始解码）"""
+
+    def __init__(self, raw, offset):
+        super().__init__()
+        self._raw = raw
+        self._offset = offset
+        raw.seek(offset)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._raw.readinto(buffer)
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos += self._offset
+        return max(0, self._raw.seek(pos, whence) - self._offset)
+
+    def tell(self):
+        return self._raw.tell() - self._offset
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+class SeekIndexBuilder(QObject):
+    """在后台线程中为 MP3 建立帧索引，结果缓存在元数据缓存数据库中"""
+
+    built = pyqtSignal(str, object)     # (文件路径, Mp3SeekIndex)
+
+    def __init__(self, cache=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def supports(file_path):
+        return file_path.lower().endswith('.mp3')
+
+    def request(self, file_path):
+        if self.supports(file_path):
+            self._requests.put(file_path)
+
+    def close(self):
+        self._requests.put(None)
+
+    def _run(self):
+        while True:
+            file_path = self._requests.get()
+            if file_path is None:
+                break
+            try:
+                index = self._get_or_build(file_path)
+            except OSError as e:
+                print(f"无法建立跳转索引: {file_path}: {e}")
+                continue
+            if index is not None:
+                self.built.emit(file_path, index)
+
+    def _get_or_build(self, file_path):
+        st = None
+        if self.cache is not None:
+            index, st = self.cache.lookup_seek_index(file_path)
+            if index is not None:
+                return index
+        index = Mp3SeekIndex.build(file_path)
+        if index is not None and self.cache is not None and st is not None:
+            self.cache.store_seek_index(file_path, st, index)
+        return index
+
+
+# 预读缓存
+class ReadAheadCache(QObject):
+    """把接下来要播放的一两首歌提前读进内存（大文件复制到本地溢出目录），
+    播放时直接从内存或本地文件打开，不必等待网络盘。
+
+    内存和溢出目录各有字节预算，超出时按最近最少使用淘汰。
+    预读在后台线程中按顺序进行；新的预读请求会取代尚未开始的旧请求。
+    可以在多个线程中同时使用（内部加锁）。
+    """
+
+    finished = pyqtSignal(str, bool)    # (原始路径, 是否已放进缓存)；中途放弃的预读不发送
+
+    CHUNK_SIZE = 1024 * 1024
+    MAX_ENTRY_FRACTION = 0.5    # 超过内存预算这个比例的文件放到溢出目录
+
+    def __init__(self, memory_budget, spill_budget=0, spill_dir=None, parent=None):
+        super().__init__(parent)
+        self.memory_budget = memory_budget
+        self.spill_budget = spill_budget
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 规范化路径 -> bytes（内存）或 str（溢出文件路径）
+        self._sizes = {}
+        self._memory_used = 0
+        self._spill_used = 0
+        self._requests = queue.Queue()
+        self._wanted = set()           # 最近一次请求预读的文件
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clear_spill_dir()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def enabled(self):
+        return self.memory_budget > 0
+
+    @staticmethod
+    def key(file_path):
+        return os.path.normcase(os.path.normpath(file_path))
+
+    def contains(self, file_path):
+        with self._lock:
+            return self.key(file_path) in self._entries
+
+    def prefetch(self, file_paths):
+        """请求预读这些文件（取代之前尚未开始的请求）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._wanted = {self.key(p) for p in file_paths}
+            wanted = [p for p in file_paths if self.key(p) not in self._entries]
+            for file_path in file_paths:
+                # 即将用到的条目移到最近使用的一端，避免被新预读的文件挤掉
+                k = self.key(file_path)
+                if k in self._entries:
+                    self._entries.move_to_end(k)
+        for file_path in wanted:
+            self._requests.put(file_path)
+
+    def open(self, file_path, count=True):
+        """返回可以交给 pygame 的来源：内存中的 BytesIO、本地溢出文件路径，未缓存时返回 None。
+        count=False 时不计入命中率（例如跳转时重新打开当前歌曲）"""
+        k = self.key(file_path)
+        with self._lock:
+            data = self._entries.get(k)
+            if data is None:
+                self.misses += count
+                return None
+            self._entries.move_to_end(k)
+            self.hits += count
+        return io.BytesIO(data) if isinstance(data, bytes) else data
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'memory_used': self._memory_used,
+                'spill_used': self._spill_used,
+                'evictions': self.evictions,
+            }
+
+    def close(self):
+        """停止预读线程并删除溢出文件"""
+        self._requests.put(None)
+        with self._lock:
+            for k in list(self._entries):
+                self._remove(k)
+
+    # ---- 内部 ----
+
+    def _clear_spill_dir(self):
+        """删除上次运行遗留的溢出文件"""
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return
+        for entry in os.scandir(self.spill_dir):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _remove(self, k):
+        """删除一个条目（调用方持有锁）"""
+        data = self._entries.pop(k)
+        size = self._sizes.pop(k)
+        if isinstance(data, bytes):
+            self._memory_used -= size
+        else:
+            self._spill_used -= size
+            try:
+                os.remove(data)
+            except OSError:
+                pass  # 可能仍在播放（Windows 下无法删除），留给下次启动清理
+
+    def _make_room(self, size, spill):
+        """按 LRU 淘汰同一类条目，直到放得下 size 字节（调用方持有锁）。
+        仍在预读请求中的条目不淘汰，放不下时新文件不缓存。"""
+        budget = self.spill_budget if spill else self.memory_budget
+        for k in list(self._entries):
+            used = self._spill_used if spill else self._memory_used
+            if used + size <= budget:
+                break
+            if isinstance(self._entries[k], bytes) != spill and k not in self._wanted:
+                self._remove(k)
+                self.evictions += 1
+        used = self._spill_used if spill else self._memory_used
+        return used + size <= budget
+
+    def _run(self):
+        while True:
+            file_path = self._requests.get()
+            if file_path is None:
+                break
+            k = self.key(file_path)
+            with self._lock:
+                if k not in self._wanted or k in self._entries:
+                    continue
+            try:
+                self._load(file_path)
+            except OSError as e:
+                print(f"预读失败: {file_path}: {e}")
+                self.finished.emit(file_path, False)
+
+    def _load(self, file_path):
+        size = os.path.getsize(file_path)
+        spill = size > self.memory_budget * self.MAX_ENTRY_FRACTION
+        if spill and not (self.spill_dir and size <= self.spill_budget):
+            self.finished.emit(file_path, False)
+            return
+
+        k = self.key(file_path)
+        if spill:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            # hash() 对字符串每次启动都不同，用路径的摘要作为文件名，重启后仍然一样
+            name = hashlib.sha1(k.encode('utf-8')).hexdigest() + os.path.splitext(file_path)[1]
+            target = os.path.join(self.spill_dir, name)
+            try:
+                with open(file_path, 'rb') as src, open(target, 'wb') as dst:
+                    while True:
+                        chunk = src.read(self.CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+            except OSError:
+                # 复制到一半失败（磁盘已满、原文件消失）：删掉写了一半的文件
                 try:
-                    win32gui.DestroyWindow(message_hwnd)
-                except:
+                    os.remove(target)
+                except OSError:
                     pass
-
+                raise
+            data = target
+        else:
+            chunks = []
+            with open(file_path, 'rb') as f:
+                while True:
+                    chunk = f.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    # 已经不需要这首歌了（切歌后有了新的预读请求），放弃
+                    if k not in self._wanted:
+                        return
+            data = b''.join(chunks)
+
+        with self._lock:
+            cached = k in self._entries
+            stored = not cached and self._make_room(size, spill)
+            if stored:
+                self._entries[k] = data
+                self._sizes[k] = size
+                if spill:
+                    self._spill_used += size
+                else:
+                    self._memory_used += size
+        if spill and not (cached or stored):
             try:
-                win32gui.UnregisterClass("HotkeyMessageWindow", win32api.GetModuleHandle(None))
-            except:
+                os.remove(data)
+            except OSError:
                 pass
+        self.finished.emit(file_path, cached or stored)
+
+
+# 解码后的 PCM 缓存
+class PcmTrack:
+    """一首已经解码成混音器格式的歌曲（内存映射的 PCM 文件），按帧随机访问"""
+
+    def __init__(self, file_path, frequency, frame_bytes):
+        self.file_path = file_path
+        self.frequency = frequency
+        self.frame_bytes = frame_bytes
+        with open(file_path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.frames = len(self._map) // frame_bytes
+
+    def ms_to_frame(self, position_ms):
+        return min(self.frames, max(0, position_ms * self.frequency // 1000))
+
+    def frame_to_ms(self, frame):
+        return frame * 1000 // self.frequency
+
+    def block(self, start, count):
+        """从 start 帧开始最多 count 帧的原始 PCM 数据"""
+        return self._map[start * self.frame_bytes:(start + count) * self.frame_bytes]
+
+
+class PcmCache(QObject):
+    """把歌曲解码一次，保存成与混音器格式相同的原始 PCM 文件，播放时内存映射读取。
+
+    单曲循环再次播放不必重新解码，跳转可以精确到采样；页面由操作系统按需换入换出，
+    常驻内存有上限。文件总大小超过磁盘预算时按最近使用时间（文件修改时间）淘汰。
+    解码在单独的进程中进行：pygame.mixer.Sound 会把整首歌解码进内存，放在进程里
+    播放进程的内存不受影响，也不会在引擎线程以外调用本进程的混音器；
+    解码前先按文件头中的长度检查大小，超过上限的歌不解码。
+    """
+
+    decoded = pyqtSignal(str)   # 一首歌解码完成（原始路径）
+
+    MAX_TRACK_FRACTION = 0.25   # 单首歌的 PCM 最多占预算的比例
+    MAX_TRACK_BYTES = 256 * 1024 * 1024     # 单首歌解码后的上限（44.1 kHz 16 位立体声约 25 分钟）
+
+    def __init__(self, cache_dir, budget, mixer_format, parent=None):
+        super().__init__(parent)
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.frequency, size, self.channels = mixer_format
+        self.frame_bytes = abs(size) // 8 * self.channels
+        # 文件名带上格式，混音器格式变化后旧文件不会被误用
+        self._suffix = f".{self.frequency}x{abs(size)}x{self.channels}.pcm"
+        self.mixer_format = tuple(mixer_format)
+        self._executor = None   # 第一次请求解码时才启动解码进程
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_per_second(self):
+        return self.frequency * self.frame_bytes
+
+    @property
+    def max_track_bytes(self):
+        return min(self.budget * self.MAX_TRACK_FRACTION, self.MAX_TRACK_BYTES)
+
+    def fits(self, duration_s):
+        return duration_s * self.bytes_per_second <= self.max_track_bytes
+
+    def cache_path(self, file_path):
+        """缓存文件路径；原文件不存在时返回 None"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        key = f"{os.path.normcase(os.path.abspath(file_path))}|{st.st_size}|{st.st_mtime_ns}"
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + self._suffix
+        return os.path.join(self.cache_dir, name)
+
+    def lookup(self, file_path):
+        """已解码时返回 PcmTrack，否则返回 None"""
+        cache_path = self.cache_path(file_path)
+        if cache_path is None or not os.path.exists(cache_path):
+            return None
+        try:
+            os.utime(cache_path)    # 记录最近使用时间，淘汰时参考
+            return PcmTrack(cache_path, self.frequency, self.frame_bytes)
+        except (OSError, ValueError):
+            return None
+
+    def request(self, file_path):
+        """在解码进程中解码这首歌（已经缓存或正在解码时什么也不做）"""
+        cache_path = self.cache_path(file_path)
+        if cache_path is None or os.path.exists(cache_path):
+            return
+        with self._lock:
+            if file_path in self._pending:
+                return
+            self._pending.add(file_path)
+        if self._executor is None:
+            # 与响度分析相同，统一用 spawn
+            self._executor = ProcessPoolExecutor(
+                1, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_pcm_worker, initargs=(self.mixer_format,)
+            )
+        try:
+            future = self._executor.submit(decode_to_pcm, file_path, cache_path, self.max_track_bytes)
+        except RuntimeError:
+            return  # 已经关闭
+        future.add_done_callback(lambda f, p=file_path: self._on_done(p, f))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _on_done(self, file_path, future):
+        # 在进程池的结果线程中调用
+        with self._lock:
+            self._pending.discard(file_path)
+        if future.cancelled():
+            return
+        try:
+            written = future.result()
+        except Exception as e:  # 解码进程中的任何错误（无法解码、磁盘已满、进程退出）
+            print(f"解码缓存失败: {file_path}: {e}")
+            return
+        if written:
+            self._evict()
+            self.decoded.emit(file_path)
+
+    def _evict(self):
+        """删除最久没有使用的缓存文件，直到总大小不超过预算"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pcm'):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if used <= self.budget:
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                pass  # 正在播放（Windows 下被映射的文件无法删除）
+
+
+def _init_pcm_worker(mixer_format):
+    """解码缓存进程初始化：用不输出声音的音频驱动、按播放时的格式初始化混音器，只用来解码"""
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    frequency, size, channels = mixer_format
+    pygame.mixer.init(frequency=frequency, size=size, channels=channels)
+
+
+def decode_to_pcm(file_path, cache_path, max_bytes):
+    """在解码进程中运行：把一首歌解码成原始 PCM 写入 cache_path，返回是否写入。
+    先按文件头中的长度估算大小，读不出长度或超过 max_bytes 时不解码"""
+    frequency, size, channels = pygame.mixer.get_init()
+    try:
+        length = mutagen.File(file_path).info.length
+    except Exception:
+        return False
+    if not length or length * frequency * abs(size) // 8 * channels > max_bytes:
+        return False
+    raw = pygame.mixer.Sound(file_path).get_raw()
+    if len(raw) > max_bytes:
+        return False
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(raw)
+    os.replace(temp_path, cache_path)
+    return True
+
+
+# 响度分析（ITU-R BS.1770 积分响度，与 ReplayGain 2.0 相同的测量方法）
+def k_weighting_power(frequencies, sample_rate):
+    """K 计权滤波器（高搁架 + 高通两级双二阶）在给定频率处的功率响应 |H|^2"""
+    # 按 BS.1770 的滤波器参数用双线性变换算出任意采样率下的系数（与 libebur128 相同的推导），
+    # 48 kHz 时与标准中给出的系数一致
+    stages = []
+    gain_db, q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    k = np.tan(np.pi * fc / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    stages.append((
+        ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0),
+        (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0),
+    ))
+    q, fc = 0.5003270373238773, 38.13547087602444
+    k = np.tan(np.pi * fc / sample_rate)
+    a0 = 1 + k / q + k * k
+    stages.append((
+        (1.0, -2.0, 1.0),
+        (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0),
+    ))
+
+    z = np.exp(-1j * 2 * np.pi * np.asarray(frequencies) / sample_rate)
+    power = np.ones(len(z))
+    for b, a_coeffs in stages:
+        h = (b[0] + b[1] * z + b[2] * z * z) / (a_coeffs[0] + a_coeffs[1] * z + a_coeffs[2] * z * z)
+        power *= np.abs(h) ** 2
+    return power
+
+
+def measure_loudness(samples, sample_rate):
+    """计算积分响度（LUFS）和采样峰值（线性，满刻度为 1.0）。
+
+    samples: 形状为 (帧数, 声道数) 的数组；整数采样按满刻度换算，浮点采样范围为 -1.0~1.0。
+    把信号切成 100 ms 的小段，用 FFT 在频域做 K 计权求出每段的均方值（帕塞瓦尔定理），
+    再把相邻 4 段合成 400 ms、重叠 75% 的门限块，全部运算都是数组运算。
+    """
+    if len(samples) == 0:
+        return None, 0.0
+    scale = 1.0 / (np.iinfo(samples.dtype).max + 1) if np.issubdtype(samples.dtype, np.integer) else 1.0
+    peak = max(float(samples.max()), -float(samples.min())) * scale
+    segment = sample_rate // 10
+    count = len(samples) // segment
+    if count < 4:
+        return None, peak
+
+    # 双边谱的能量：rfft 的中间频点在负频率一侧还有一份
+    weights = k_weighting_power(np.fft.rfftfreq(segment, 1.0 / sample_rate), sample_rate)
+    weights[1:(segment + 1) // 2] *= 2
+    weights *= scale * scale / (segment * segment)
+
+    energies = []
+    chunk = 600  # 一次处理 60 秒，限制临时数组的大小
+    for start in range(0, count, chunk):
+        stop = min(count, start + chunk)
+        # 逐块转换成浮点，整首歌只以原始的 16 位形式留在内存中
+        block = samples[start * segment:stop * segment].reshape(stop - start, segment, -1)
+        spectrum = np.fft.rfft(block.astype(np.float64), axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        energies.append(np.einsum('nfc,f->n', power, weights))
+    energies = np.concatenate(energies)      # 每 100 ms 各声道均方值之和
+
+    cumulative = np.concatenate(([0.0], np.cumsum(energies)))
+    blocks = (cumulative[4:] - cumulative[:-4]) / 4
+    with np.errstate(divide='ignore'):
+        loudness = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[loudness > -70.0]
+    if len(gated) == 0:
+        return None, peak
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    gated = blocks[(loudness > -70.0) & (loudness > relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean())), peak
+
+
+def compute_waveform(samples, buckets=1024):
+    """波形概览：把整首歌均分成 buckets 段，每段的峰值和均方根各量化成一个字节（0-255 对应满刻度）。
+    返回 峰值字节 + 均方根字节（一共 2 * buckets 字节）；没有采样时返回 b''"""
+    frames = len(samples)
+    buckets = min(buckets, frames)
+    if buckets == 0:
+        return b''
+    scale = 255.0 / (np.iinfo(samples.dtype).max + 1) if np.issubdtype(samples.dtype, np.integer) else 255.0
+    edges = np.linspace(0, frames, buckets + 1).astype(np.int64)
+    # 沿帧方向归约，最后才合并声道（在只有两个元素的声道轴上归约很慢）
+    highs = np.maximum.reduceat(samples, edges[:-1], axis=0).max(axis=1).astype(np.float64)
+    lows = np.minimum.reduceat(samples, edges[:-1], axis=0).min(axis=1).astype(np.float64)
+    peaks = np.maximum(highs, -lows)
+    power = np.empty(buckets)
+    group = 64  # 一次转换 64 段为浮点，限制临时数组的大小
+    for first in range(0, buckets, group):
+        last = min(buckets, first + group)
+        block = samples[edges[first]:edges[last]].astype(np.float32)
+        power[first:last] = np.add.reduceat(block * block, edges[first:last] - edges[first], axis=0).sum(axis=1)
+    rms = np.sqrt(power / (np.diff(edges) * samples.shape[1]))
+    levels = np.concatenate((peaks, rms)) * scale
+    return np.clip(np.rint(levels), 0, 255).astype(np.uint8).tobytes()
+
+
+# 分析进程解码用的混音器格式（频率, 位数, 声道数）；格式相同的解码缓存可以直接读取
+LOUDNESS_FORMAT = (44100, -16, 2)
+
+
+def _init_loudness_worker():
+    """分析进程初始化：用不输出声音的音频驱动初始化混音器，只用来解码"""
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    frequency, size, channels = LOUDNESS_FORMAT
+    pygame.mixer.init(frequency=frequency, size=size, channels=channels)
+
+
+def analyze_loudness(file_path, pcm_path=None):
+    """在分析进程中运行：解码并测量一首歌，返回 (路径, 大小, 修改时间, 响度, 峰值, 波形概览)。
+    有解码缓存（与分析进程相同的 LOUDNESS_FORMAT 格式）时直接读取缓存。"""
+    st = os.stat(file_path)
+    frequency, size, channels = pygame.mixer.get_init()
+    if pcm_path and os.path.exists(pcm_path):
+        samples = np.memmap(pcm_path, dtype=np.int16, mode='r')
+    else:
+        samples = np.frombuffer(pygame.mixer.Sound(file_path).get_raw(), dtype=np.int16)
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    loudness, peak = measure_loudness(samples, frequency)
+    return file_path, st.st_size, st.st_mtime_ns, loudness, peak, compute_waveform(samples)
+
+
+class LoudnessAnalyzer(QObject):
+    """在进程池中批量分析响度（同时生成进度条的波形概览），结果写入元数据缓存。
+
+    每个进程各自解码、计算，不受 GIL 限制，整库分析的速度随 CPU 核数线性增加。
+    播放时顺带分析单首歌只用一个后台进程；整库分析（batch=True）另开一个用上全部核心的进程池。
+    """
+
+    BACKGROUND_WORKERS = 1
+
+    analyzed = pyqtSignal(str, float, float)    # (路径, 响度 LUFS, 峰值)
+    waveform_ready = pyqtSignal(str, bytes)     # (路径, 波形概览)
+    progress = pyqtSignal(int, int)             # (已完成, 总数)
+
+    def __init__(self, cache=None, workers=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self._executors = {}    # batch -> ProcessPoolExecutor，第一次用到时才启动
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.total = 0
+        self.done = 0
+
+    @property
+    def busy(self):
+        return bool(self._pending)
+
+    def analyze(self, items, batch=False):
+        """items: [(文件路径, 解码缓存路径或 None)]；已有结果或已经在分析的会跳过。
+        batch 为 True 时用全部 CPU 核心（整库分析），否则只用一个后台进程。
+        查询缓存（每首歌一次 os.stat）在后台线程中进行，不会卡住界面"""
+        executor = self._executors.get(batch)
+        if executor is None:
+            # 统一用 spawn：fork 会复制 Qt、SDL 和各个后台线程持有的锁
+            executor = self._executors[batch] = ProcessPoolExecutor(
+                self.workers if batch else self.BACKGROUND_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_loudness_worker
+            )
+        threading.Thread(target=self._submit, args=(executor, list(items)), daemon=True).start()
+
+    def _submit(self, executor, items):
+        for file_path, pcm_path in items:
+            if self.cache is not None and self.cache.lookup_loudness(file_path) is not None and \
+                    self.cache.lookup_waveform(file_path) is not None:
+                continue
+            with self._lock:
+                if file_path in self._pending:
+                    continue
+                if not self._pending:
+                    self.total = self.done = 0
+                self._pending.add(file_path)
+                self.total += 1
+            try:
+                future = executor.submit(analyze_loudness, file_path, pcm_path)
+            except RuntimeError:
+                return  # 已经关闭
+            future.add_done_callback(lambda f, p=file_path: self._on_done(p, f))
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+    def _on_done(self, file_path, future):
+        # 在进程池的结果线程中调用
+        with self._lock:
+            self._pending.discard(file_path)
+            self.done += 1
+            done, total = self.done, self.total
+        if future.cancelled():
+            return
+        try:
+            file_path, size, mtime_ns, loudness, peak, waveform = future.result()
+        except Exception as e:  # 分析进程中的任何错误（无法解码、文件消失、进程退出）
+            print(f"响度分析失败: {file_path}: {e}")
+        else:
+            if waveform:
+                if self.cache is not None:
+                    self.cache.store_waveform(file_path, size, mtime_ns, waveform)
+                self.waveform_ready.emit(file_path, waveform)
+            if loudness is not None:
+                if self.cache is not None:
+                    self.cache.store_loudness(file_path, size, mtime_ns, loudness, peak)
+                self.analyzed.emit(file_path, loudness, peak)
+        self.progress.emit(done, total)
+
+
+# 音效处理（均衡器和限幅器），按块处理解码后的音频
+class Equalizer:
+    """多段均衡器：低频搁架 + 三个峰值 + 高频搁架（RBJ 双二阶）。
+
+    各段双二阶的频率响应用数组运算算出后相乘，得到整条滤波链的响应，
+    截成 TAPS 点的 FIR，再用重叠保留法按块做 FFT 卷积。
+    递归形式的双二阶必须逐个采样计算，这样整块音频只需要一次 FFT 和一次 IFFT。
+    """
+
+    BANDS = ((60, 'low_shelf'), (250, 'peak'), (1000, 'peak'), (4000, 'peak'), (12000, 'high_shelf'))
+    Q = 1.0
+    TAPS = 4096
+
+    def __init__(self, sample_rate, channels, block_frames, gains_db=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.fft_size = 1 << (block_frames + self.TAPS - 2).bit_length()
+        self._history = np.zeros((self.TAPS - 1, channels))
+        self._spectrum = None
+        self.set_gains(gains_db or [0.0] * len(self.BANDS))
+
+    @property
+    def flat(self):
+        return self._spectrum is None
+
+    def set_gains(self, gains_db):
+        self.gains_db = list(gains_db)
+        if not any(self.gains_db):
+            self._spectrum = None
+            return
+        z = np.exp(-1j * 2 * np.pi * np.fft.rfftfreq(self.TAPS))
+        response = np.ones(len(z), dtype=complex)
+        for (frequency, kind), gain_db in zip(self.BANDS, self.gains_db):
+            if gain_db:
+                b, a = self.biquad(kind, frequency, gain_db, self.sample_rate)
+                response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+        impulse = np.fft.irfft(response, self.TAPS)
+        # 尾部渐隐，减小截断带来的波纹
+        fade = self.TAPS // 4
+        impulse[-fade:] *= np.hanning(2 * fade)[fade:]
+        self._spectrum = np.fft.rfft(impulse, self.fft_size)[:, None]
+
+    @classmethod
+    def biquad(cls, kind, frequency, gain_db, sample_rate):
+        """RBJ 音频 EQ 公式，返回 (b, a)"""
+        a_gain = 10 ** (gain_db / 40)
+        w = 2 * np.pi * frequency / sample_rate
+        cos_w = np.cos(w)
+        if kind == 'peak':
+            alpha = np.sin(w) / (2 * cls.Q)
+            return ((1 + alpha * a_gain, -2 * cos_w, 1 - alpha * a_gain),
+                    (1 + alpha / a_gain, -2 * cos_w, 1 - alpha / a_gain))
+        alpha = np.sin(w) / 2 * np.sqrt(2)   # 搁架斜率 S = 1
+        sqrt_alpha = 2 * np.sqrt(a_gain) * alpha
+        if kind == 'low_shelf':
+            return ((a_gain * ((a_gain + 1) - (a_gain - 1) * cos_w + sqrt_alpha),
+                     2 * a_gain * ((a_gain - 1) - (a_gain + 1) * cos_w),
+                     a_gain * ((a_gain + 1) - (a_gain - 1) * cos_w - sqrt_alpha)),
+                    ((a_gain + 1) + (a_gain - 1) * cos_w + sqrt_alpha,
+                     -2 * ((a_gain - 1) + (a_gain + 1) * cos_w),
+                     (a_gain + 1) + (a_gain - 1) * cos_w - sqrt_alpha))
+        return ((a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w + sqrt_alpha),
+                 -2 * a_gain * ((a_gain - 1) + (a_gain + 1) * cos_w),
+                 a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w - sqrt_alpha)),
+                ((a_gain + 1) - (a_gain - 1) * cos_w + sqrt_alpha,
+                 2 * ((a_gain - 1) - (a_gain + 1) * cos_w),
+                 (a_gain + 1) - (a_gain - 1) * cos_w - sqrt_alpha))
+
+    def process(self, block):
+        """block: (帧数, 声道数) 浮点数组，帧数不超过 block_frames"""
+        if self._spectrum is None:
+            return block
+        frames = len(block)
+        buffer = np.concatenate((self._history, block))
+        self._history = buffer[-(self.TAPS - 1):]
+        spectrum = np.fft.rfft(buffer, self.fft_size, axis=0)
+        output = np.fft.irfft(spectrum * self._spectrum, self.fft_size, axis=0)
+        return output[self.TAPS - 1:self.TAPS - 1 + frames]
+
+    def reset(self):
+        self._history[:] = 0.0
+
+
+class PeakLimiter:
+    """前瞻峰值限幅器：输出延迟 lookahead 毫秒，增益在峰值到来之前就降下来，输出不会超过上限。
+
+    全部是数组运算：前瞻窗口内取最小值（需要的增益），线性恢复用 minimum.accumulate
+    求出闭式解，最后用同样长度的滑动平均让增益平滑变化（平均值不会超过窗口内的最小值，
+    所以峰值处的增益仍然足够小）。
+    """
+
+    def __init__(self, sample_rate, channels, ceiling_db=-1.0, lookahead_ms=5.0, release_ms=200.0):
+        self.ceiling = 10 ** (ceiling_db / 20)
+        self.lookahead = max(1, int(sample_rate * lookahead_ms / 1000))
+        self.release_step = 1.0 / (sample_rate * release_ms / 1000)    # 每个采样最多恢复的增益
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        self._delay = np.zeros((self.lookahead, self.channels))
+        self._gain_history = np.ones(self.lookahead)
+        self._last_gain = 1.0
+        self.min_gain = 1.0     # 最近处理过的块中最小的增益（用于显示）
+
+    def process(self, block):
+        frames = len(block)
+        window = self.lookahead
+        buffer = np.concatenate((self._delay, block))
+        self._delay = buffer[-window:]
+
+        peak = np.abs(buffer).max(axis=1)
+        required = np.minimum(1.0, self.ceiling / np.maximum(peak, 1e-12))
+        # 前瞻：每个采样取之后 window 个采样中需要的最小增益
+        held = np.lib.stride_tricks.sliding_window_view(required, window + 1).min(axis=1)
+        # 线性恢复：gain[k] = min(held[k], gain[k-1] + step)
+        ramp = self.release_step * np.arange(frames)
+        gain = np.minimum.accumulate(np.minimum(held - ramp, self._last_gain + self.release_step - ramp[:1]))
+        gain = np.minimum(1.0, gain + ramp)
+        self._last_gain = gain[-1]
+        # 滑动平均平滑增益变化
+        cumulative = np.concatenate(([0.0], np.cumsum(np.concatenate((self._gain_history, gain)))))
+        smooth = (cumulative[window + 1:] - cumulative[:-window - 1]) / (window + 1)
+        self._gain_history = gain[-window:] if frames >= window else \
+            np.concatenate((self._gain_history, gain))[-window:]
+        self.min_gain = float(smooth.min()) if frames else 1.0
+        return buffer[:frames] * smooth[:, None]
+
+
+class DspChain:
+    """解码音频的处理链：16 位交错 PCM 进，16 位交错 PCM 出，状态在块之间延续"""
+
+    def __init__(self, sample_rate, channels, block_frames):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.equalizer = None
+        self.limiter = None
+
+    @property
+    def active(self):
+        return self.equalizer is not None or self.limiter is not None
+
+    def configure(self, eq_gains_db, limiter):
+        """修改参数；尽量保留已有的滤波器状态，避免切换时出现爆音"""
+        if eq_gains_db and any(eq_gains_db):
+            if self.equalizer is None:
+                self.equalizer = Equalizer(self.sample_rate, self.channels, self.block_frames, eq_gains_db)
+            else:
+                self.equalizer.set_gains(eq_gains_db)
+        else:
+            self.equalizer = None
+        if limiter and self.limiter is None:
+            self.limiter = PeakLimiter(self.sample_rate, self.channels)
+        elif not limiter:
+            self.limiter = None
+
+    def process(self, data):
+        if not self.active:
+            return data
+        block = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels) / 32768.0
+        if self.equalizer is not None:
+            block = self.equalizer.process(block)
+        if self.limiter is not None:
+            block = self.limiter.process(block)
+        return (np.clip(block, -1.0, 32767 / 32768) * 32768).astype(np.int16).tobytes()
+
+    def reset(self):
+        """跳转或重新开始时清掉滤波器和延迟线中的旧音频"""
+        if self.equalizer is not None:
+            self.equalizer.reset()
+        if self.limiter is not None:
+            self.limiter.reset()
+
+
+# 正在播放的采样（供频谱显示）
+class SampleTap:
+    """声道模式下交给混音器的音频块（经过音效处理后的）的环形缓冲。
+
+    引擎线程送块时记下这一块预计开始播放的时刻，界面线程按当前时刻取出正在播放的那一段采样。
+    enabled 为 False 时引擎不送数据，没有任何开销。
+    """
+
+    MAX_BLOCKS = 4
+
+    def __init__(self, mixer_format):
+        self.frequency, size, self.channels = mixer_format or (44100, -16, 2)
+        self.usable = NUMPY_AVAILABLE and size == -16
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._blocks = deque(maxlen=self.MAX_BLOCKS)   # (开始时刻, 采样数组)
+        self._paused_at = None
+
+    def push(self, data, start_time):
+        """引擎线程调用：data 为 16 位交错 PCM"""
+        samples = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        with self._lock:
+            self._blocks.append((start_time, samples))
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._paused_at = None
+
+    def pause(self):
+        with self._lock:
+            self._paused_at = time.monotonic()
+
+    def resume(self):
+        """恢复播放：把所有块的开始时刻推后暂停的时长"""
+        with self._lock:
+            if self._paused_at is not None:
+                delay = time.monotonic() - self._paused_at
+                self._blocks = deque(((start + delay, samples) for start, samples in self._blocks),
+                                     maxlen=self.MAX_BLOCKS)
+                self._paused_at = None
+
+    def latest(self, frames):
+        """此刻正在播放的位置之前的 frames 帧（形状 (frames, 声道数)）；暂停、没有数据或数据不够时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            if self._paused_at is not None:
+                return None
+            blocks = list(self._blocks)
+        for i in range(len(blocks) - 1, -1, -1):
+            start, samples = blocks[i]
+            if start <= now:
+                break
+        else:
+            return None
+        offset = int((now - start) * self.frequency)
+        if offset > len(samples):
+            return None     # 送数据中断（停止或播放结束）
+        if offset >= frames:
+            return samples[offset - frames:offset]
+        if i == 0:
+            return None
+        previous = blocks[i - 1][1]
+        if len(previous) < frames - offset:
+            return None
+        return np.concatenate((previous[len(previous) - (frames - offset):], samples[:offset]))
+
+
+# 后台播放引擎
+class PlaybackEngine(QObject):
+    """在独立线程中持有 pygame 混音器，所有播放操作都通过命令队列交给这个线程执行。
+
+    打开文件（load/queue）可能因为网络盘而很慢，放在这里执行不会卡住界面。
+    调用方传入一个 tag（这里是歌曲字典）标识每首歌，状态变化通过 Qt 信号
+    带着 tag 送回 GUI 线程。播放结束也在这个线程中检测：按歌曲长度和当前位置算出预计结束的时刻，
+    线程在命令队列上一直等到这个时刻（或者下一次发送位置）才醒来检查（MusicEndDetector），
+    播放中不需要频繁轮询。结束和其他命令按顺序处理，不会与换歌、停止交错。
+    """
+
+    track_started = pyqtSignal(object, bool, float)   # (tag, 是否由排队无缝接上, 切歌间隙毫秒；不适用时为 -1)
+    load_failed = pyqtSignal(object, str)             # (tag, 错误信息)
+    queue_failed = pyqtSignal(object, str)            # (tag, 错误信息)
+    ended = pyqtSignal(float)                         # 自然播放结束且没有排队的下一首（检测到结束的时刻）
+    position_changed = pyqtSignal(int, float)         # (当前播放位置毫秒, 取得位置的时刻 time.monotonic())
+    channel_mode_changed = pyqtSignal(bool)           # 是否正在通过声道播放已解码的歌曲（音效和频谱只在此时有效）
+    error = pyqtSignal(str)
+
+    POSITION_INTERVAL = 1.0     # 秒，播放中发送位置的间隔
+    BLOCK_FRAMES = 8192         # 声道模式每块的帧数（44.1 kHz 下约 0.19 秒）
+    FEED_INTERVAL = 0.02        # 秒，声道模式检查是否需要送下一块的间隔
+    END_RETRY_INTERVAL = 0.02   # 秒，到了预计结束时刻还在播放（长度有误差）时再次检查的间隔
+    END_RETRY_WINDOW = 2.0      # 秒，超过预计结束时刻这么久仍在播放就不再短间隔检查
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._commands = queue.Queue()
+        self._thread = None
+        self.readahead = None       # 可选的 ReadAheadCache，打开文件时优先从中读取
+        self.pcm_cache = None       # 可选的 PcmCache，已解码的歌曲通过声道播放
+        self.tap = None             # 可选的 SampleTap，声道模式下记录送出的音频块
+
+        # 以下状态只在引擎线程中访问
+        self._playing = False
+        self._paused = False
+        self._tag = None
+        self._path = None
+        self._queued_tag = None
+        self._queued_path = None
+        self._queue_stale = False   # pygame 无法取消排队，记下已排队的歌已经作废
+        self._offset_ms = 0         # 跳转后 get_pos() 从 0 开始，需要加上跳转位置
+        self._last_position_emit = 0.0
+        self._volume = 1.0
+        self._gain = 1.0            # 当前歌曲的音量增益
+        self._queued_gain = 1.0
+        # 声道模式（当前歌曲已解码缓存）的状态，_pcm 为 None 时使用 pygame.mixer.music
+        self._channel = None
+        self._pcm = None
+        self._queued_pcm = None
+        self._channel_mode = False  # 最近一次通知界面的声道模式
+        self._blocks = deque()
+        self._block_began = 0.0     # 正在播放的块开始的时刻
+        self._block_elapsed = 0.0   # 暂停时正在播放的块已经播放的秒数
+        self._serial_counter = 0
+        self._serial = 0            # 正在播放的歌曲的序号
+        self._feed_serial = 0
+        self._feed_tag = None
+        self._feed_pcm = None
+        self._feed_frame = 0
+        self._feeding_queued = False
+        self._dsp = None            # 声道模式下的音效处理链（均衡器/限幅器）
+        self._end_detector = MusicEndDetector()
+        self._length_ms = None      # 当前歌曲（music 播放）的长度，未知时为 None
+        self._queued_length_ms = None
+        self._end_deadline = None   # 预计播放结束、需要醒来检查的时刻（time.monotonic()）
+        self._end_retry_until = 0.0
+
+    # ---- GUI 线程调用的接口（只放入队列，立即返回） ----
+
+    def start(self):
+        """启动引擎线程，等待混音器初始化完成"""
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait(5.0)
+
+    def play(self, tag, path, start_ms=0, ended_at=None, gain=1.0):
+        """打开并播放（同时丢弃排队的下一首）；ended_at 为上一首结束的时刻时会计算切歌间隙。
+        gain 是这首歌的音量增益（线性），与整体音量相乘"""
+        self._commands.put(('play', (tag, path, start_ms, ended_at, gain)))
+
+    def queue(self, tag, path, gain=1.0):
+        """提前打开下一首，当前歌曲结束后由混音器无缝接上"""
+        self._commands.put(('queue', (tag, path, gain)))
+
+    def clear_queue(self):
+        self._commands.put(('clear_queue', ()))
+
+    def pause(self):
+        self._commands.put(('pause', ()))
+
+    def resume(self):
+        self._commands.put(('resume', ()))
+
+    def stop(self):
+        self._commands.put(('stop', ()))
+
+    def seek(self, position_ms, seek_index=None):
+        """跳转；提供 MP3 帧索引时直接从目标帧开始解码，又快又准"""
+        self._commands.put(('seek', (position_ms, seek_index)))
+
+    def set_volume(self, volume):
+        """volume: 0.0-1.0"""
+        self._commands.put(('set_volume', (volume,)))
+
+    def set_gain(self, gain):
+        """修改当前歌曲的音量增益（例如响度分析刚刚完成）"""
+        self._commands.put(('set_gain', (gain,)))
+
+    def set_dsp(self, eq_gains_db, limiter):
+        """设置音效：eq_gains_db 为各频段增益（dB），None 表示关闭均衡器。
+        音效只作用于通过声道播放的已解码歌曲"""
+        self._commands.put(('set_dsp', (eq_gains_db, limiter)))
+
+    def shutdown(self):
+        """停止播放、关闭混音器并等待引擎线程退出"""
+        if self._thread is None:
+            return
+        self._commands.put(('quit', ()))
+        self._thread.join(timeout=2.0)
+        self._thread = None
+
+    # ---- 引擎线程 ----
+
+    def _run(self, ready):
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=2048)
+            # 保留一个声道给解码缓存播放，其他音效不会占用它
+            pygame.mixer.set_reserved(1)
+            self._channel = pygame.mixer.Channel(0)
+        except pygame.error:
+            try:
+                pygame.mixer.init()
+                pygame.mixer.set_reserved(1)
+                self._channel = pygame.mixer.Channel(0)
+            except pygame.error as e:
+                self.error.emit(f"无法初始化音频: {e}")
+        ready.set()
+
+        while True:
+            if self._pcm is not None and self._playing and not self._paused:
+                timeout = self.FEED_INTERVAL
+            elif self._playing and not self._paused:
+                # 等到下一次发送位置，或者预计播放结束的时刻
+                wake_at = self._last_position_emit + self.POSITION_INTERVAL
+                if self._end_deadline is not None:
+                    wake_at = min(wake_at, self._end_deadline)
+                timeout = max(0.0, wake_at - time.monotonic())
+            else:
+                timeout = None
+            try:
+                command, args = self._commands.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+            if command == 'quit':
+                break
+            try:
+                # 先处理等待期间的播放结束，再执行命令；命令改变的播放状态不算结束
+                if self._pcm is None and self._playing and not self._paused:
+                    self._check_music_end()
+                if command is not None:
+                    getattr(self, '_do_' + command)(*args)
+                    self._arm_end_deadline()
+                if self._pcm is not None and self._playing and not self._paused:
+                    self._feed_channel()
+            except pygame.error as e:
+                self.error.emit(str(e))
+            if (self._pcm is not None) != self._channel_mode:
+                self._channel_mode = self._pcm is not None
+                self.channel_mode_changed.emit(self._channel_mode)
+            if self._playing and not self._paused and \
+                    time.monotonic() - self._last_position_emit >= self.POSITION_INTERVAL:
+                self._emit_position()
+
+        try:
+            pygame.mixer.music.stop()
+            pygame.mixer.quit()
+        except pygame.error:
+            pass
+
+    def _check_music_end(self):
+        if self._end_detector.check():
+            self._do_ended(time.perf_counter())
+            self._arm_end_deadline()
+            return
+        now = time.monotonic()
+        if self._end_deadline is not None and now >= self._end_deadline:
+            # 到了预计结束的时刻还在播放（长度或位置有误差）：短时间内再查几次，
+            # 之后只在每秒发送位置时检查
+            self._end_deadline = now + self.END_RETRY_INTERVAL if now < self._end_retry_until else None
+
+    def _arm_end_deadline(self):
+        """播放状态变化后，按歌曲长度和当前位置重新计算预计结束的时刻"""
+        self._end_detector.reset()
+        self._end_deadline = None
+        if self._pcm is not None or not self._playing or self._paused or self._length_ms is None:
+            return
+        position = self._position_ms()
+        if position is None:
+            return
+        self._end_deadline = time.monotonic() + max(0, self._length_ms - position) / 1000.0
+        self._end_retry_until = self._end_deadline + self.END_RETRY_WINDOW
+
+    @staticmethod
+    def _track_length_ms(path):
+        """歌曲长度（毫秒，由 mutagen 读取文件头得到），读不出时返回 None"""
+        try:
+            audio = mutagen.File(path)
+        except Exception:
+            return None
+        length = getattr(getattr(audio, 'info', None), 'length', 0)
+        return int(length * 1000) if length else None
+
+    def _position_ms(self):
+        """当前播放位置（毫秒），无法获得时返回 None"""
+        if self._pcm is not None:
+            if not self._blocks:
+                return None
+            serial, tag, pcm, start_frame, frames = self._blocks[0]
+            if not serial:
+                return None
+            elapsed = self._block_elapsed if self._paused else time.monotonic() - self._block_began
+            return pcm.frame_to_ms(start_frame + min(frames, int(elapsed * pcm.frequency)))
+        try:
+            position = pygame.mixer.music.get_pos()
+        except pygame.error:
+            return None
+        return position + self._offset_ms if position >= 0 else None
+
+    def _emit_position(self):
+        self._last_position_emit = time.monotonic()
+        position = self._position_ms()
+        if position is not None:
+            self.position_changed.emit(position, time.monotonic())
+
+    def _gap_since(self, ended_at):
+        """上一首结束到现在经过的时间减去新歌已经播放的时间"""
+        position = self._position_ms() or 0
+        return max(0.0, (time.perf_counter() - ended_at) * 1000 - (position - self._offset_ms))
+
+    def _source(self, path):
+        """返回交给 pygame 的来源和扩展名提示：已预读时用缓存，否则直接打开原文件"""
+        source = self.readahead.open(path) if self.readahead is not None else None
+        return (source or path), os.path.splitext(path)[1].lstrip('.')
+
+    def _lookup_pcm(self, path):
+        return self.pcm_cache.lookup(path) if self.pcm_cache is not None else None
+
+    def _do_play(self, tag, path, start_ms, ended_at, gain):
+        self._queued_tag = None
+        self._queued_pcm = None
+        self._start_track(tag, path, start_ms, ended_at, gain, from_queue=False)
+
+    def _start_track(self, tag, path, start_ms, ended_at, gain, from_queue):
+        """开始播放一首歌：已经解码缓存的用声道播放，否则交给 pygame.mixer.music"""
+        pcm = self._lookup_pcm(path)
+        self._gain = gain
+        self._apply_volume()
+        try:
+            if pcm is not None:
+                if self._pcm is None:
+                    pygame.mixer.music.stop()
+                self._start_channel(tag, pcm, pcm.ms_to_frame(start_ms))
+            else:
+                self._stop_channel()
+                self._length_ms = self._track_length_ms(path)
+                # load 会同时丢弃之前排队的下一首
+                pygame.mixer.music.load(*self._source(path))
+                self._queue_stale = False
+                if start_ms:
+                    pygame.mixer.music.play(start=start_ms / 1000.0)
+                else:
+                    pygame.mixer.music.play()
+        except pygame.error as e:
+            self._playing = False
+            self._tag = None
+            self._path = None
+            self.load_failed.emit(tag, str(e))
+            return
+        self._playing = True
+        self._paused = False
+        self._tag = tag
+        self._path = path
+        self._offset_ms = start_ms
+        gap = self._gap_since(ended_at) if ended_at is not None else -1.0
+        self.track_started.emit(tag, from_queue, gap)
+        self._emit_position()
+
+    def _do_queue(self, tag, path, gain):
+        if self._pcm is not None:
+            # 声道模式：下一首已解码时读完当前歌曲后直接接着送数据，否则结束时再打开
+            self._unqueue_channel()
+            self._queued_tag = tag
+            self._queued_path = path
+            self._queued_pcm = self._lookup_pcm(path)
+            self._queued_gain = gain
+            return
+        pcm = self._lookup_pcm(path)
+        if pcm is not None:
+            # 下一首已解码：不交给 music 排队，检测到结束时改用声道播放
+            if self._queued_tag is not None and self._queued_pcm is None:
+                self._queue_stale = True
+            self._queued_tag = tag
+            self._queued_path = path
+            self._queued_pcm = pcm
+            self._queued_gain = gain
+            return
+        try:
+            pygame.mixer.music.queue(*self._source(path))
+        except pygame.error as e:
+            if self._queued_tag is not None:
+                self._queue_stale = True
+            self._queued_tag = None
+            self.queue_failed.emit(tag, str(e))
+            return
+        self._queued_tag = tag
+        self._queued_path = path
+        self._queued_pcm = None
+        self._queued_gain = gain
+        self._queued_length_ms = self._track_length_ms(path)
+        self._queue_stale = False
+
+    def _do_clear_queue(self):
+        if self._queued_tag is None:
+            return
+        if self._pcm is not None:
+            self._unqueue_channel()
+        elif self._queued_pcm is None:
+            self._queue_stale = True
+        self._queued_tag = None
+        self._queued_pcm = None
+
+    def _do_pause(self):
+        if self._pcm is not None:
+            self._channel.pause()
+            self._block_elapsed = time.monotonic() - self._block_began
+            if self.tap is not None:
+                self.tap.pause()
+        else:
+            pygame.mixer.music.pause()
+        self._paused = True
+
+    def _do_resume(self):
+        if self._pcm is not None:
+            self._block_began = time.monotonic() - self._block_elapsed
+            self._channel.unpause()
+            if self.tap is not None:
+                self.tap.resume()
+        else:
+            pygame.mixer.music.unpause()
+        self._paused = False
+
+    def _do_stop(self):
+        self._playing = False
+        self._paused = False
+        self._tag = None
+        self._queued_tag = None
+        self._queued_pcm = None
+        self._queue_stale = False
+        self._stop_channel()
+        pygame.mixer.music.stop()
+
+    def _do_seek(self, position_ms, seek_index):
+        if self._tag is None:
+            return
+        pcm = self._pcm_of_current()
+        if pcm is not None:
+            # 已解码：直接从目标采样开始送数据
+            if self._pcm is None:
+                pygame.mixer.music.stop()
+                if self._queued_tag is not None:
+                    self._queued_pcm = self._lookup_pcm(self._queued_path)
+            self._start_channel(self._tag, pcm, pcm.ms_to_frame(position_ms))
+            self._offset_ms = pcm.frame_to_ms(pcm.ms_to_frame(position_ms))
+            if self._paused:
+                self._channel.pause()
+                self._block_elapsed = 0.0
+        elif seek_index is not None:
+            self._seek_with_index(position_ms, seek_index)
+        else:
+            pygame.mixer.music.play(start=position_ms / 1000.0)
+            self._offset_ms = position_ms
+        if self._paused:
+            # 暂停中拖动进度条：跳转后保持暂停
+            if self._pcm is None:
+                pygame.mixer.music.pause()
+        else:
+            self._emit_position()
+
+    def _pcm_of_current(self):
+        """当前歌曲的解码缓存：正在用声道播放时直接使用，否则看后台是否已经解码好"""
+        if self._pcm is not None:
+            return self._pcm
+        return self._lookup_pcm(self._path)
+
+    def _seek_with_index(self, position_ms, seek_index):
+        """从索引中目标时间之前最近的一帧开始解码（pygame 自己跳转要从头扫描 VBR 文件）"""
+        offset, start_ms = seek_index.locate(position_ms)
+        raw = None
+        try:
+            source = self.readahead.open(self._path, count=False) if self.readahead is not None else None
+            raw = source if isinstance(source, io.BytesIO) else open(source or self._path, 'rb')
+            pygame.mixer.music.load(FileSlice(raw, offset), 'mp3')
+        except (OSError, pygame.error) as e:
+            # 索引与文件不符等情况：退回到重新打开整个文件再跳转
+            print(f"按索引跳转失败: {e}")
+            if raw is not None and not isinstance(raw, io.BytesIO):
+                raw.close()     # 加载失败时 pygame 不会接管这个文件
+            try:
+                pygame.mixer.music.load(*self._source(self._path))
+                pygame.mixer.music.play(start=position_ms / 1000.0)
+            except (OSError, pygame.error) as e:
+                tag = self._tag
+                self._do_stop()
+                self.load_failed.emit(tag, str(e))
+                return
+            start_ms = position_ms
+        else:
+            pygame.mixer.music.play()
+        self._offset_ms = start_ms
+        # load 会丢弃排队的下一首，重新排队（作废的排队也随之清除）
+        self._queue_stale = False
+        if self._queued_tag is not None:
+            self._do_queue(self._queued_tag, self._queued_path, self._queued_gain)
+
+    def _do_set_volume(self, volume):
+        self._volume = volume
+        self._apply_volume()
+
+    def _do_set_gain(self, gain):
+        self._gain = gain
+        self._apply_volume()
+
+    def _do_set_dsp(self, eq_gains_db, limiter):
+        if self._dsp is None:
+            mixer = pygame.mixer.get_init()
+            if not NUMPY_AVAILABLE or not mixer or mixer[1] != -16:
+                return  # 只处理 16 位有符号 PCM
+            self._dsp = DspChain(mixer[0], mixer[2], self.BLOCK_FRAMES)
+        self._dsp.configure(eq_gains_db, limiter)
+        if not self._dsp.active:
+            self._dsp = None
+
+    def _apply_volume(self):
+        # 响度均衡的增益不超过 1.0（只衰减），与音量相乘后不会超出 pygame 的范围
+        volume = min(1.0, self._volume * self._gain)
+        pygame.mixer.music.set_volume(volume)
+        if self._channel is not None:
+            self._channel.set_volume(volume)
+
+    def _do_ended(self, ended_at):
+        """music 播放结束：区分自然结束、排队歌曲已接上、以及接上的是作废的排队歌曲"""
+        if not self._playing or self._pcm is not None:
+            return
+        busy = pygame.mixer.music.get_busy()
+        if self._queued_pcm is not None and not self._paused:
+            # 排队的是已解码的歌曲：改用声道接着播放（如果作废的 music 排队已经接上，会先被停掉）
+            tag, path = self._queued_tag, self._queued_path
+            self._queued_tag = None
+            self._queued_pcm = None
+            self._queue_stale = False
+            self._start_track(tag, path, 0, ended_at, self._queued_gain, from_queue=True)
+        elif busy and self._queued_tag is not None:
+            self._tag = self._queued_tag
+            self._path = self._queued_path
+            self._queued_tag = None
+            self._offset_ms = 0
+            self._length_ms = self._queued_length_ms
+            self._gain = self._queued_gain
+            self._apply_volume()
+            self.track_started.emit(self._tag, True, self._gap_since(ended_at))
+            self._emit_position()
+        elif busy and self._queue_stale:
+            # 接上的是已经作废的排队歌曲：停下来，交给 GUI 按当前状态选择下一首
+            self._do_stop()
+            self.ended.emit(ended_at)
+        elif not busy and not self._paused:
+            self._playing = False
+            self._tag = None
+            self.ended.emit(ended_at)
+
+    # ---- 声道模式（解码缓存） ----
+    # _blocks 记录已经交给声道的块：[正在播放的, 排队的]，每项为 (序号, tag, PcmTrack, 起始帧, 帧数)。
+    # 每开始送一首歌序号加一（单曲循环时前后两首的 tag 相同，靠序号区分）；
+    # 序号为 0 的是用来顶掉已排队块的静音块。
+
+    def _start_channel(self, tag, pcm, start_frame):
+        self._channel.stop()
+        self._blocks.clear()
+        if self._dsp is not None:
+            self._dsp.reset()
+        if self.tap is not None:
+            self.tap.clear()
+        self._serial_counter += 1
+        self._serial = self._serial_counter
+        self._tag = tag
+        self._pcm = pcm
+        self._feed_serial = self._serial
+        self._feed_tag = tag
+        self._feed_pcm = pcm
+        self._feed_frame = start_frame
+        self._feeding_queued = False
+        self._feed_channel()
+
+    def _stop_channel(self):
+        if self._pcm is None:
+            return
+        self._channel.stop()
+        self._blocks.clear()
+        self._pcm = None
+        self._feed_pcm = None
+        self._feeding_queued = False
+        if self.tap is not None:
+            self.tap.clear()
+
+    def _unqueue_channel(self):
+        """取消排队：已经把下一首的数据交给声道时用静音块顶掉，并让送数据停在当前歌曲末尾"""
+        if self._feeding_queued:
+            self._feed_serial = self._serial
+            self._feed_tag = self._tag
+            self._feed_pcm = self._pcm
+            self._feed_frame = self._pcm.frames
+            self._feeding_queued = False
+        if len(self._blocks) > 1 and self._blocks[-1][0] != self._serial:
+            self._channel.queue(pygame.mixer.Sound(buffer=bytes(self._pcm.frame_bytes)))
+            self._blocks[-1] = (0, None, None, 0, 0)
+
+    def _next_block(self):
+        """下一块要送给声道的数据；当前歌曲读完后接上已解码的排队歌曲"""
+        if self._feed_frame >= self._feed_pcm.frames:
+            if self._queued_pcm is None or self._feeding_queued:
+                return None
+            self._serial_counter += 1
+            self._feed_serial = self._serial_counter
+            self._feed_tag = self._queued_tag
+            self._feed_pcm = self._queued_pcm
+            self._feed_frame = 0
+            self._feeding_queued = True
+        start = self._feed_frame
+        frames = min(self.BLOCK_FRAMES, self._feed_pcm.frames - start)
+        self._feed_frame += frames
+        return (self._feed_serial, self._feed_tag, self._feed_pcm, start, frames)
+
+    def _feed_channel(self):
+        """保持声道上有一块正在播放、一块排队；检测块之间的歌曲切换和播放结束"""
+        channel = self._channel
+        if (len(self._blocks) == 2 and channel.get_queue() is None) or \
+                (len(self._blocks) == 1 and not channel.get_busy()):
+            # 正在播放的块放完了
+            self._blocks.popleft()
+            self._block_began = time.monotonic()
+
+        while len(self._blocks) < 2:
+            block = self._next_block()
+            if block is None:
+                break
+            pcm, start, frames = block[2:]
+            data = pcm.block(start, frames)
+            if self._dsp is not None:
+                data = self._dsp.process(data)
+            sound = pygame.mixer.Sound(buffer=data)
+            if self._blocks:
+                channel.queue(sound)
+                playing = self._blocks[0]
+                start_time = self._block_began + (playing[4] / playing[2].frequency if playing[2] else 0.0)
+            else:
+                channel.play(sound)
+                self._block_began = start_time = time.monotonic()
+            if self.tap is not None and self.tap.enabled:
+                self.tap.push(data, start_time)
+            self._blocks.append(block)
+
+        if not self._blocks:
+            self._channel_finished(time.perf_counter())
+            return
+        serial, tag, pcm = self._blocks[0][:3]
+        if serial and serial != self._serial:
+            # 排队的歌曲已经无缝接上
+            self._serial = serial
+            self._tag = tag
+            self._path = self._queued_path
+            self._pcm = pcm
+            self._queued_tag = None
+            self._queued_pcm = None
+            self._feeding_queued = False
+            self._offset_ms = 0
+            self._gain = self._queued_gain
+            self._apply_volume()
+            self.track_started.emit(tag, True, 0.0)
+            self._emit_position()
+
+    def _channel_finished(self, ended_at):
+        """声道上的歌曲放完：有排队的（未解码）歌曲时打开它，否则通知自然结束"""
+        self._pcm = None
+        self._feed_pcm = None
+        if self._queued_tag is not None:
+            tag, path = self._queued_tag, self._queued_path
+            self._queued_tag = None
+            self._start_track(tag, path, 0, ended_at, self._queued_gain, from_queue=True)
+        else:
+            self._playing = False
+            self._tag = None
+            self.ended.emit(ended_at)
 
 
 # 自定义按键捕获输入框
@@ -452,38 +2964,1446 @@ class HotkeyLineEdit(QLineEdit):
             elif self.allow_no_modifiers:
                 self.setText(key_text)
 
-        # 不调用父类的keyPressEvent，防止默认处理
+        # 不调用父类的keyPressEvent，防止默认处理
+
+
+# 自定义搜索框，支持方向键导航
+class SearchLineEdit(QLineEdit):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent_window = parent
+        
+    def keyPressEvent(self, event):
+        # 如果按下下方向键，聚焦到播放列表
+        if event.key() == Qt.Key_Down:
+            if self.parent_window and hasattr(self.parent_window, 'playlist_view'):
+                self.parent_window.focus_playlist_from_search()
+            return
+        
+        # 其他按键正常处理
+        super().keyPressEvent(event)
+
+
+# 随机播放袋
+class ShuffleBag:
+    """惰性生成的 Fisher–Yates 随机排列：一轮之内每首歌只出现一次，全部放完再开始新一轮。
+
+    只记录被交换过的位置（稀疏字典），每次抽取 O(1)，不必预先打乱整个列表。
+    状态只有 (种子, 已抽取数, 本轮的大小变化)，重启后用同一个种子、按当时的大小重放
+    即可接着原来的顺序。大小变化是 [(已抽取数, 大小), ...]：本轮开始时的大小，
+    以及本轮中每次追加歌曲后的大小（之前的抽取用的是较小的范围，重放时也要用它）。
+    """
+
+    def __init__(self, size=0, seed=None, count=0, sizes=None):
+        self.restore(size, seed, count, sizes)
+
+    def restore(self, size, seed=None, count=0, sizes=None):
+        """按 state() 保存的状态恢复，重放已抽取的部分（只在启动时做一次）。
+        没有 sizes 时按 size 重放；size 是现在的列表长度"""
+        sizes = sorted(sizes) if sizes else [(0, size)]
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self._rng = random.Random(self.seed)
+        self._swaps = {}
+        self.count = 0
+        self.size = sizes[0][1]
+        self._sizes = [(0, self.size)]
+        for (_drawn, round_size), (until, _) in zip(sizes, sizes[1:] + [(count, 0)]):
+            self.grow(round_size)
+            while self.count < min(until, count, self.size):
+                self._draw()
+        if size < self.size:
+            # 列表比保存时短，已抽取的位置可能已经不存在了
+            self.reset(size)
+        else:
+            self.grow(size)
+
+    def reset(self, size):
+        """曲目增删后开始新的一轮"""
+        self.restore(size)
+
+    def grow(self, size):
+        """列表末尾追加了歌曲：新歌直接加入本轮尚未抽取的部分"""
+        if size <= self.size:
+            return
+        self.size = size
+        if self._sizes[-1][0] == self.count:
+            self._sizes[-1] = (self.count, size)
+        else:
+            self._sizes.append((self.count, size))
+
+    def remaining(self):
+        return self.size - self.count
+
+    def _draw(self):
+        i = self.count
+        j = self._rng.randrange(i, self.size)
+        swaps = self._swaps
+        picked = swaps.pop(j, j) if j != i else swaps.pop(i, i)
+        if j != i:
+            swaps[j] = swaps.pop(i, i)
+        self.count += 1
+        return picked
+
+    def next_index(self, avoid=-1):
+        """抽取下一首；尽量不与 avoid（正在播放的歌曲）相同。列表为空时返回 -1"""
+        if self.size <= 0:
+            return -1
+        if self.count >= self.size:
+            self.reset(self.size)
+        index = self._draw()
+        if index == avoid and self.size > 1:
+            # avoid 刚刚播放过，算作本轮已经放过，再抽一首
+            if self.count >= self.size:
+                self.reset(self.size)
+            index = self._draw()
+        return index
+
+    def state(self):
+        return self.seed, self.count, list(self._sizes)
+
+
+# 播放历史
+class HistoryRing:
+    """固定容量的环形播放历史，支持任意次数的上一曲/下一曲。
+
+    游标指向正在播放的歌曲；后退后再播放新歌会丢弃游标之后的记录（与浏览器相同）。
+    容量满时覆盖最早的记录，所有操作都是 O(1)。
+    """
+
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self._buf = [0] * capacity
+        self._start = 0
+        self._len = 0
+        self._pos = -1
+
+    def __len__(self):
+        return self._len
+
+    def _get(self, i):
+        return self._buf[(self._start + i) % self.capacity]
+
+    def clear(self):
+        self._start = 0
+        self._len = 0
+        self._pos = -1
+
+    def current(self):
+        return self._get(self._pos) if self._pos >= 0 else None
+
+    def push(self, index):
+        """记录一首开始播放的歌曲（与当前记录相同时不重复记录）"""
+        if self._pos >= 0 and self._get(self._pos) == index:
+            self._len = self._pos + 1
+            return
+        self._len = self._pos + 1
+        if self._len == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._len -= 1
+        self._buf[(self._start + self._len) % self.capacity] = index
+        self._len += 1
+        self._pos = self._len - 1
+
+    def back(self):
+        """后退一首，没有更早的记录时返回 None"""
+        if self._pos <= 0:
+            return None
+        self._pos -= 1
+        return self._get(self._pos)
+
+    def forward(self):
+        """前进一首（之前后退过），没有时返回 None"""
+        if self._pos >= self._len - 1:
+            return None
+        self._pos += 1
+        return self._get(self._pos)
+
+    def items(self):
+        return [self._get(i) for i in range(self._len)]
+
+    def recent(self, count):
+        """游标及之前最近的 count 条记录"""
+        return [self._get(i) for i in range(max(0, self._pos - count + 1), self._pos + 1)]
+
+    def position(self):
+        return self._pos
+
+    def load(self, items, position):
+        """恢复保存的历史（超出容量时只保留最近的部分）"""
+        self.clear()
+        drop = max(0, len(items) - self.capacity)
+        for index in items[drop:]:
+            self._buf[(self._start + self._len) % self.capacity] = index
+            self._len += 1
+        self._pos = min(max(position - drop, -1), self._len - 1)
+
+    def remove_rows(self, first, last):
+        """播放列表删除了 first..last 行：删掉指向这些行的记录，之后的行号前移。
+        只遍历历史本身（容量固定），与播放列表长度无关"""
+        count = last - first + 1
+        kept = []
+        position = -1
+        for i in range(self._len):
+            index = self._get(i)
+            if first <= index <= last:
+                if i <= self._pos:
+                    position = len(kept) - 1
+                continue
+            if i <= self._pos:
+                position = len(kept)
+            kept.append(index - count if index > last else index)
+        self.load(kept, position)
+
+
+# 播放统计
+class PlayStats:
+    """每首歌的 播放次数 / 完整听完次数 / 跳过次数，保存在只追加的日志文件里。
+
+    每个事件追加一行 "事件\t路径"（p=开始播放，f=听完，s=跳过），写入只是一次 append；
+    日志过长时压缩成每首歌一行的汇总 "=\t路径\t播放\t听完\t跳过"，用临时文件整体替换。
+    以规范化路径为键，清空列表后重新导入同一首歌，统计仍然有效。
+    """
+
+    EVENTS = {'p': 0, 'f': 1, 's': 2}
+    COMPACT_EVERY = 5000    # 日志中累积多少条事件后压缩
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self._counts = {}   # 路径 -> [播放, 听完, 跳过]
+        self._events = 0    # 自上次压缩以来的事件数
+        self._load()
+        self._file = None
+        try:
+            self._file = open(self.log_path, 'a', encoding='utf-8')
+        except OSError as e:
+            print(f"无法打开播放统计日志: {e}")
+
+    @staticmethod
+    def key(file_path):
+        return os.path.normcase(os.path.normpath(file_path))
+
+    def _load(self):
+        try:
+            with open(self.log_path, encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if parts[0] == '=' and len(parts) == 5:
+                        try:
+                            self._counts[parts[1]] = [int(x) for x in parts[2:]]
+                        except ValueError:
+                            continue
+                    elif len(parts) == 2 and parts[0] in self.EVENTS:
+                        self._counts.setdefault(parts[1], [0, 0, 0])[self.EVENTS[parts[0]]] += 1
+                        self._events += 1
+        except OSError:
+            pass
+
+    def record(self, file_path, event):
+        """记录一个事件：'p' 开始播放，'f' 完整听完，'s' 跳过"""
+        key = self.key(file_path)
+        self._counts.setdefault(key, [0, 0, 0])[self.EVENTS[event]] += 1
+        self._events += 1
+        if self._file is not None:
+            try:
+                self._file.write(f"{event}\t{key}\n")
+                self._file.flush()
+            except OSError as e:
+                print(f"写入播放统计失败: {e}")
+        if self._events >= self.COMPACT_EVERY:
+            self.compact()
+
+    def get(self, file_path):
+        """返回 (播放, 听完, 跳过)"""
+        return tuple(self._counts.get(self.key(file_path), (0, 0, 0)))
+
+    def weight(self, file_path):
+        """随机播放权重：常听完的歌权重高，常跳过的歌权重低，没有记录时为 1"""
+        counts = self._counts.get(self.key(file_path))
+        if counts is None:
+            return 1.0
+        _plays, full, skips = counts
+        return min(AliasSampler.MAX_WEIGHT, max(AliasSampler.MIN_WEIGHT, (2 + full) / (2 + skips)))
+
+    def __len__(self):
+        return len(self._counts)
+
+    def compact(self):
+        """把日志压缩成每首歌一行的汇总"""
+        tmp_path = self.log_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, (plays, full, skips) in self._counts.items():
+                    f.write(f"=\t{key}\t{plays}\t{full}\t{skips}\n")
+            if self._file is not None:
+                self._file.close()
+            os.replace(tmp_path, self.log_path)
+            self._file = open(self.log_path, 'a', encoding='utf-8')
+            self._events = 0
+        except OSError as e:
+            print(f"压缩播放统计失败: {e}")
+
+    def maybe_compact(self):
+        """启动时调用：日志中的事件较多时压缩一次"""
+        if self._events >= self.COMPACT_EVERY // 10:
+            self.compact()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# 加权随机抽样
+class AliasSampler:
+    """Walker 别名表加权抽样，每次抽取 O(1)。
+
+    别名表按每个位置的“上界”（建表时权重 × HEADROOM）建立，抽到后再以
+    实际权重 / 上界 的概率接受（拒绝采样），所以权重在上界以内变化时
+    不需要重建。追加的歌曲先放在表外，统一的上界下均匀抽取。
+    只有权重超过上界、删除歌曲、表外歌曲过多或接受率过低时才整体重建。
+    """
+
+    HEADROOM = 2.0
+    MIN_WEIGHT = 0.1
+    MAX_WEIGHT = 10.0
+    MAX_TRIES = 64
+
+    def __init__(self, weight_source, rng=None):
+        """weight_source() 返回当前所有行的权重列表（只在重建时调用）"""
+        self._weight_source = weight_source
+        self._rng = rng or random.Random()
+        self._weights = []
+        self._bounds = []
+        self._prob = []
+        self._alias = []
+        self._table_size = 0
+        self._extra_bound = 0.0
+        self._weight_sum = 0.0
+        self._bound_sum = 0.0
+        self._stale = True
+        self.rebuild_count = 0
+
+    def invalidate(self):
+        self._stale = True
+
+    def rebuild(self):
+        """按当前权重重建别名表（Vose 算法，O(n)）"""
+        weights = list(self._weight_source())
+        bounds = [w * self.HEADROOM for w in weights]
+        n = len(bounds)
+        total = sum(bounds)
+        prob = [0.0] * n
+        alias = list(range(n))
+        if n:
+            scaled = [b * n / total for b in bounds]
+            small = [i for i, p in enumerate(scaled) if p < 1.0]
+            large = [i for i, p in enumerate(scaled) if p >= 1.0]
+            while small and large:
+                s = small.pop()
+                l = large[-1]
+                prob[s] = scaled[s]
+                alias[s] = l
+                scaled[l] -= 1.0 - scaled[s]
+                if scaled[l] < 1.0:
+                    small.append(large.pop())
+            for i in small + large:
+                prob[i] = 1.0
+        self._weights = weights
+        self._bounds = bounds
+        self._prob = prob
+        self._alias = alias
+        self._table_size = n
+        self._extra_bound = 0.0
+        self._weight_sum = sum(weights)
+        self._bound_sum = total
+        self._stale = False
+        self.rebuild_count += 1
+
+    def set_weight(self, row, weight):
+        """某一行的权重变了：在上界以内只更新数值，超过上界时标记重建"""
+        if self._stale or not 0 <= row < len(self._weights):
+            return
+        if row < self._table_size:
+            bound = self._bounds[row]
+        else:
+            bound = self._extra_bound
+        if weight > bound:
+            self._stale = True
+            return
+        self._weight_sum += weight - self._weights[row]
+        self._weights[row] = weight
+        # 接受率太低时抽样会变慢，重建一次
+        if self._weight_sum * 4 < self._bound_sum + self._extra_mass():
+            self._stale = True
+
+    def append(self, weights):
+        """列表末尾追加歌曲"""
+        if self._stale:
+            return
+        self._weights.extend(weights)
+        self._weight_sum += sum(weights)
+        if weights:
+            self._extra_bound = max(self._extra_bound, max(weights) * self.HEADROOM)
+        if len(self._weights) - self._table_size > max(64, self._table_size // 10):
+            self._stale = True
+
+    def _extra_mass(self):
+        return self._extra_bound * (len(self._weights) - self._table_size)
+
+    def weight(self, row):
+        if self._stale:
+            self.rebuild()
+        return self._weights[row]
+
+    def probability(self, row):
+        """某一行被抽中的概率"""
+        if self._stale:
+            self.rebuild()
+        return self._weights[row] / self._weight_sum if self._weight_sum else 0.0
+
+    def acceptance_rate(self):
+        if self._stale:
+            self.rebuild()
+        mass = self._bound_sum + self._extra_mass()
+        return self._weight_sum / mass if mass else 0.0
+
+    def pick(self, reject=None):
+        """按权重抽取一行；reject(row) 为 True 的行重新抽，绝不返回被拒绝的行。
+        列表为空或所有行都被拒绝时返回 -1"""
+        if self._stale:
+            self.rebuild()
+        n = len(self._weights)
+        if n == 0:
+            return -1
+        rng = self._rng
+        table_mass = self._bound_sum
+        total_mass = table_mass + self._extra_mass()
+        for _ in range(self.MAX_TRIES):
+            if rng.random() * total_mass < table_mass:
+                i = int(rng.random() * self._table_size)
+                row = i if rng.random() < self._prob[i] else self._alias[i]
+                bound = self._bounds[row]
+            else:
+                row = self._table_size + int(rng.random() * (n - self._table_size))
+                bound = self._extra_bound
+            if rng.random() * bound < self._weights[row] and not (reject and reject(row)):
+                return row
+        if reject is None:
+            return row
+        # 几乎所有行都被拒绝（例如列表很短）：从随机位置开始找第一个没有被拒绝的行
+        start = int(rng.random() * n)
+        return next((r for r in itertools.chain(range(start, n), range(start))
+                     if not reject(r)), -1)
+
+
+# 播放列表数据模型
+class PlaylistModel(QAbstractListModel):
+    """播放列表的唯一数据源：tracks 是歌曲字典列表，视图只在绘制时按行取数据。
+
+    每行除了歌曲字典本身不再额外创建任何对象，十万首歌也能流畅滚动。
+    """
+
+    # 只影响外观（高亮背景、不可用的灰色文字）的行变化。
+    # QListView 收到 dataChanged 时会对整个列表重新排版（O(n)），
+    # 这类变化改由视图直接重绘对应的行，代价与列表长度无关。
+    rows_repaint_requested = pyqtSignal(object)  # [row, ...]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tracks = []
+        self.highlight_row = -1  # 正在播放的行（高亮显示）
+        self._row_of_track = {}  # id(歌曲字典) -> 行号；删除行后置为 None，下次查找时重建
+
+    @staticmethod
+    def display_text(song_info):
+        return song_info.get('display_name', f"{song_info['title']} - {song_info['artist']}")
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.tracks)
+
+    def data(self, index, role=Qt.DisplayRole):
+        row = index.row()
+        if not index.isValid() or row >= len(self.tracks):
+            return None
+
+        song_info = self.tracks[row]
+        if role == Qt.DisplayRole:
+            return self.display_text(song_info)
+        if role == Qt.BackgroundRole and row == self.highlight_row:
+            return QBrush(Qt.lightGray)
+        if song_info.get('missing'):
+            if role == Qt.ForegroundRole:
+                return QBrush(Qt.gray)
+            if role == Qt.ToolTipRole:
+                return f"文件不可用: {song_info['path']}"
+        return None
+
+    def set_tracks(self, songs):
+        """整体替换所有歌曲"""
+        self.beginResetModel()
+        self.tracks = songs
+        self.highlight_row = -1
+        self._row_of_track = None
+        self.endResetModel()
+
+    def append_tracks(self, songs):
+        """在末尾批量追加歌曲（一次 beginInsertRows）"""
+        if not songs:
+            return
+        first = len(self.tracks)
+        self.beginInsertRows(QModelIndex(), first, first + len(songs) - 1)
+        self.tracks.extend(songs)
+        if self._row_of_track is not None:
+            self._row_of_track.update((id(s), row) for row, s in enumerate(songs, first))
+        self.endInsertRows()
+
+    def remove_track(self, row):
+        """删除一行"""
+        if not 0 <= row < len(self.tracks):
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.tracks[row]
+        # 后面的行号都变了；连续删除多行时只在下次查找时重建一次
+        self._row_of_track = None
+        if row == self.highlight_row:
+            self.highlight_row = -1
+        elif row < self.highlight_row:
+            self.highlight_row -= 1
+        self.endRemoveRows()
+
+    def clear(self):
+        self.set_tracks([])
+
+    def row_of(self, song_info):
+        """歌曲字典（按对象，不按内容）所在的行号，不在列表中时返回 -1"""
+        if self._row_of_track is None:
+            self._row_of_track = {id(s): row for row, s in enumerate(self.tracks)}
+        row = self._row_of_track.get(id(song_info), -1)
+        return row if row >= 0 and self.tracks[row] is song_info else -1
+
+    def track_changed(self, row):
+        """某一行的歌曲信息被修改后通知视图刷新"""
+        if 0 <= row < len(self.tracks):
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def set_highlight_row(self, row):
+        """设置正在播放的行：只重绘旧行和新行，与列表长度无关"""
+        old_row = self.highlight_row
+        if row == old_row:
+            return
+        self.highlight_row = row
+        self.rows_repaint_requested.emit(
+            [r for r in (old_row, row) if 0 <= r < len(self.tracks)]
+        )
+
+    def set_missing(self, rows):
+        """把若干行标记为不可用（文件不存在或无法打开）"""
+        rows = [row for row in rows if 0 <= row < len(self.tracks)]
+        for row in rows:
+            self.tracks[row]['missing'] = True
+        if rows:
+            self.rows_repaint_requested.emit(rows)
+
+
+def normalize_search_text(text):
+    """搜索用的规范化：全角转半角、统一大小写"""
+    return unicodedata.normalize('NFKC', text).casefold()
 
 
-# 自定义搜索框，支持方向键导航
-class SearchLineEdit(QLineEdit):
-    def __init__(self, parent=None):
+# 拼音搜索
+PINYIN_TABLE_FILE = "pinyin_table.txt"
+_pinyin_table = None
+_pinyin_table_lock = threading.Lock()
+
+
+def load_pinyin_table():
+    """按需加载随程序附带的拼音表（汉字 -> 不带声调的音节），只在第一次用到时读取"""
+    global _pinyin_table
+    if _pinyin_table is None:
+        with _pinyin_table_lock:
+            if _pinyin_table is None:
+                table = {}
+                base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+                try:
+                    with open(os.path.join(base_path, PINYIN_TABLE_FILE), encoding='utf-8') as f:
+                        for line in f:
+                            if line.startswith('#'):
+                                continue
+                            syllable, _, chars = line.rstrip('\n').partition(' ')
+                            table.update(dict.fromkeys(chars, syllable))
+                except OSError as e:
+                    print(f"无法加载拼音表: {e}")
+                _pinyin_table = table
+    return _pinyin_table
+
+
+def pinyin_keys(text):
+    """返回 (全拼, 首字母)；汉字转成拼音，字母数字原样保留，其余字符丢弃。
+    文本中没有汉字时返回 ('', '')"""
+    table = load_pinyin_table()
+    full = []
+    initials = []
+    has_hanzi = False
+    for ch in normalize_search_text(text):
+        syllable = table.get(ch)
+        if syllable:
+            has_hanzi = True
+            full.append(syllable)
+            initials.append(syllable[0])
+        elif ch.isalnum():
+            full.append(ch)
+            initials.append(ch)
+    if not has_hanzi:
+        return '', ''
+    return ''.join(full), ''.join(initials)
+
+
+def track_pinyin(song_info):
+    """歌曲的拼音搜索键：显示名/标题/艺术家/专辑中含汉字的字段的全拼和首字母"""
+    parts = []
+    for field in ('display_name', 'title', 'artist', 'album'):
+        text = song_info.get(field)
+        if text:
+            full, initials = pinyin_keys(str(text))
+            if full:
+                parts.append(full)
+                parts.append(initials)
+    return '\x1f'.join(parts)
+
+
+# 播放列表搜索索引
+class SearchIndex:
+    """预先计算好的搜索索引，与 PlaylistModel 的行一一对应。
+
+    每首歌把 标题/艺术家/专辑/显示名/路径 规范化后拼成一条文本，
+    再附上导入时算好的拼音全拼和首字母（song_info['pinyin']），
+    连接到模型的信号上自动跟随增删改。匹配循环全部交给 map/compress
+    在 C 层完成，不逐行执行 Python 代码。
+    新的关键字包含上一次的关键字时（继续输入），只在上一次的结果里筛选。
+    全部行都命中时返回 range(行数)，不生成十万项的行号列表。
+    """
+
+    FIELD_SEPARATOR = '\x1f'
+
+    def __init__(self, model=None):
+        self._keys = []
+        self._all_rows = None  # range(len(keys))，表示全部行
+        self._last_query = None
+        self._last_rows = None
+        if model is not None:
+            self.attach(model)
+
+    def attach(self, model):
+        """跟随模型的变化自动更新索引"""
+        self._model = model
+        model.modelReset.connect(self._on_model_reset)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.rowsRemoved.connect(self._on_rows_removed)
+        model.dataChanged.connect(self._on_data_changed)
+        self.rebuild(model.tracks)
+
+    def _on_model_reset(self):
+        self.rebuild(self._model.tracks)
+
+    def _on_rows_inserted(self, parent, first, last):
+        self.insert(first, self._model.tracks[first:last + 1])
+
+    def _on_rows_removed(self, parent, first, last):
+        self.remove(first, last)
+
+    def _on_data_changed(self, top_left, bottom_right, roles=None):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self.update(row, self._model.tracks[row])
+
+    @classmethod
+    def make_key(cls, song_info):
+        fields = [
+            song_info.get('title', ''),
+            song_info.get('artist', ''),
+            song_info.get('album', ''),
+            song_info.get('display_name', ''),
+            song_info.get('path', ''),
+        ]
+        pinyin = song_info.get('pinyin')
+        if pinyin is None:
+            # 旧数据没有拼音键，补算一次并留在歌曲字典里
+            pinyin = song_info['pinyin'] = track_pinyin(song_info)
+        fields.append(pinyin)
+        text = cls.FIELD_SEPARATOR.join(str(f) for f in fields if f)
+        return normalize_search_text(text)
+
+    def _changed(self):
+        self._all_rows = None
+        self._last_query = None
+        self._last_rows = None
+
+    def rebuild(self, songs):
+        self._keys = [self.make_key(song_info) for song_info in songs]
+        self._changed()
+
+    def insert(self, row, songs):
+        self._keys[row:row] = [self.make_key(song_info) for song_info in songs]
+        self._changed()
+
+    def update(self, row, song_info):
+        if 0 <= row < len(self._keys):
+            self._keys[row] = self.make_key(song_info)
+            self._changed()
+
+    def remove(self, first, last):
+        del self._keys[first:last + 1]
+        self._changed()
+
+    def _match(self, query, rows=None):
+        """rows 为 None 时在全部行中查找"""
+        keys = self._keys
+        if rows is None:
+            if self._all_rows is None:
+                self._all_rows = range(len(keys))
+            rows = self._all_rows
+            candidates = keys
+            if len(query) == 1 and all(map(operator.contains, keys, itertools.repeat(query))):
+                # 单个字常常命中所有行：all 遇到不匹配的行就停下，全部命中时不生成逐行结果
+                return rows
+        else:
+            candidates = map(keys.__getitem__, rows)
+        hits = list(map(operator.contains, candidates, itertools.repeat(query)))
+        if all(hits):
+            # 全部命中时直接复用原列表，过滤模型发现结果没变就不会重置
+            return rows
+        return list(itertools.compress(rows, hits))
+
+    def match_rows(self, query, rows):
+        """在给定的行中筛选匹配 query 的行"""
+        return self._match(normalize_search_text(query).strip(), rows)
+
+    def search(self, query):
+        """返回匹配的行号列表（升序）；关键字为空时返回 None 表示不过滤"""
+        query = normalize_search_text(query).strip()
+        if not query:
+            self._last_query = None
+            self._last_rows = None
+            return None
+
+        if (self._last_query is not None and self._last_query in query
+                and self._last_rows is not self._all_rows):
+            # 继续输入：结果一定是上一次结果的子集
+            rows = self._match(query, self._last_rows)
+        else:
+            rows = self._match(query)
+
+        self._last_query = query
+        self._last_rows = rows
+        return rows
+
+
+# 模糊搜索索引
+class FuzzySearchIndex:
+    """基于三元组（trigram）倒排索引的模糊搜索，容忍错字和漏字，结果按匹配程度排序。
+
+    每个字段（标题/艺术家/专辑/文件夹/拼音）各有一张倒排表，以歌曲 id 为键
+    （行号会因删除而变化，id 不会），每个三元组对应一个紧凑的 array。
+    查询时用 Counter 在 C 层统计每首歌在各字段命中的三元组数，
+    分数 = 命中比例 × 字段权重。
+    删除不修改倒排表，打分时跳过已不存在的 id；改名的歌曲单独记下，
+    打分时按当前字段重新计算。过期记录太多时整体重建。
+    索引在第一次模糊搜索时才建立，之后随模型的增删改增量更新。
+    """
+
+    N = 3
+    # 各字段的权重：标题（含显示名） > 艺术家、拼音 > 专辑 > 所在文件夹
+    FIELD_WEIGHTS = (('title', 3.0), ('artist', 2.0), ('album', 1.5), ('folder', 1.0),
+                     ('pinyin', 2.0))
+    MIN_OVERLAP = 0.4   # 最佳字段命中的三元组比例低于这个值的不显示
+
+    def __init__(self, model=None):
+        self._postings = [{} for _ in self.FIELD_WEIGHTS]  # 每个字段: trigram -> array('q') of id
+        self._indexed_ids = set()
+        self._changed_ids = set()   # 建索引后改过名的歌曲
+        self._stale_count = 0
+        self._pending_rows = None   # 尚未建索引的行（None 表示需要整体重建）
+        self._row_of_id = None
+        self._model = None
+        if model is not None:
+            self.attach(model)
+
+    def attach(self, model):
+        """跟随模型的变化自动更新索引"""
+        self._model = model
+        model.modelReset.connect(self._on_model_reset)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._on_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._on_rows_removed)
+        model.dataChanged.connect(self._on_data_changed)
+
+    @staticmethod
+    def track_key(song_info):
+        return song_info.get('id', id(song_info))
+
+    @staticmethod
+    def track_fields(song_info):
+        """按 FIELD_WEIGHTS 的顺序返回各字段规范化后的文本"""
+        title = song_info.get('title', '')
+        if song_info.get('display_name'):
+            title = f"{song_info['display_name']} {title}"
+        folder = os.path.basename(os.path.dirname(song_info.get('path', '')))
+        pinyin = song_info.get('pinyin')
+        if pinyin is None:
+            pinyin = song_info['pinyin'] = track_pinyin(song_info)
+        return [normalize_search_text(text) for text in
+                (title, song_info.get('artist', ''), song_info.get('album', ''), folder,
+                 pinyin.replace('\x1f', ' '))]
+
+    @classmethod
+    def grams(cls, text):
+        """文本的三元组集合（前后补空格，短词也能参与匹配）"""
+        text = f" {' '.join(text.split())} "
+        return {text[i:i + cls.N] for i in range(len(text) - cls.N + 1)}
+
+    # ---- 跟随模型的变化 ----
+
+    def _on_model_reset(self):
+        self._pending_rows = None
+        self._row_of_id = None
+
+    def _on_rows_inserted(self, parent, first, last):
+        self._row_of_id = None
+        if self._pending_rows is not None:
+            self._pending_rows.extend(range(first, last + 1))
+
+    def _on_rows_about_to_be_removed(self, parent, first, last):
+        for song_info in self._model.tracks[first:last + 1]:
+            key = self.track_key(song_info)
+            if key in self._indexed_ids:
+                self._indexed_ids.discard(key)
+                self._stale_count += 1
+
+    def _on_rows_removed(self, parent, first, last):
+        self._row_of_id = None
+        # 待建索引的行号已经失效，下一次搜索时整体重建
+        if self._pending_rows:
+            self._pending_rows = None
+
+    def _on_data_changed(self, top_left, bottom_right, roles=None):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            key = self.track_key(self._model.tracks[row])
+            if key in self._indexed_ids:
+                self._changed_ids.add(key)
+
+    # ---- 建立索引 ----
+
+    def _add_track(self, song_info):
+        key = self.track_key(song_info)
+        for postings, text in zip(self._postings, self.track_fields(song_info)):
+            for gram in self.grams(text):
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array('q')
+                posting.append(key)
+        self._indexed_ids.add(key)
+
+    def _ensure_built(self):
+        tracks = self._model.tracks
+        stale = self._stale_count + len(self._changed_ids)
+        if self._pending_rows is None or stale > max(1000, len(tracks) // 4):
+            self._postings = [{} for _ in self.FIELD_WEIGHTS]
+            self._indexed_ids = set()
+            self._changed_ids = set()
+            self._stale_count = 0
+            rows = range(len(tracks))
+        else:
+            rows = self._pending_rows
+        for row in rows:
+            self._add_track(tracks[row])
+        self._pending_rows = []
+
+    def _row_map(self):
+        if self._row_of_id is None:
+            self._row_of_id = {self.track_key(s): i for i, s in enumerate(self._model.tracks)}
+        return self._row_of_id
+
+    def _exact_score(self, song_info, query_grams):
+        """按歌曲当前的字段计算分数（用于改过名的歌曲）"""
+        best_overlap = best_score = 0.0
+        for (_field, weight), text in zip(self.FIELD_WEIGHTS, self.track_fields(song_info)):
+            overlap = len(query_grams & self.grams(text)) / len(query_grams)
+            best_overlap = max(best_overlap, overlap)
+            best_score = max(best_score, overlap * weight)
+        return best_score if best_overlap >= self.MIN_OVERLAP else 0.0
+
+    # ---- 查询 ----
+
+    def search(self, query):
+        """返回按匹配程度从高到低排序的行号列表；关键字为空时返回 None"""
+        query = normalize_search_text(query).strip()
+        if not query:
+            return None
+        self._ensure_built()
+
+        query_grams = self.grams(query)
+        min_hits = self.MIN_OVERLAP * len(query_grams)
+        row_of_id = self._row_map()
+        tracks = self._model.tracks
+
+        scores = {}
+        for postings, (_field, weight) in zip(self._postings, self.FIELD_WEIGHTS):
+            # Counter.update 在 C 层完成计数
+            counts = Counter()
+            for gram in query_grams:
+                posting = postings.get(gram)
+                if posting:
+                    counts.update(posting)
+            unit = weight / len(query_grams)
+            for key, hits in counts.items():
+                if hits >= min_hits:
+                    score = hits * unit
+                    if score > scores.get(key, 0.0):
+                        scores[key] = score
+
+        for key in self._changed_ids:
+            row = row_of_id.get(key, -1)
+            if row >= 0:
+                scores[key] = self._exact_score(tracks[row], query_grams)
+
+        ranked = []
+        for key, score in scores.items():
+            row = row_of_id.get(key, -1)
+            if row >= 0 and score > 0.0:
+                ranked.append((-score, row))
+        ranked.sort()
+        return [row for _score, row in ranked]
+
+
+# 播放列表过滤模型
+class PlaylistFilterModel(QAbstractListModel):
+    """PlaylistModel 之上的过滤层，只保存匹配行的行号列表。
+
+    rows 为 None 时不过滤，行号与源模型一致；rows 也可以是 range（全部命中）。
+    显示的行没有变化时不通知视图，新结果只是去掉当前结果中的少数几段时逐段删除，
+    其他情况整体重置一次，不再逐行设置隐藏。
+    """
+
+    rows_repaint_requested = pyqtSignal(object)
+
+    MAX_REMOVED_RANGES = 32     # 去掉的段数超过这个值时整体重置（逐段删除反而更慢）
+
+    def __init__(self, source, parent=None):
         super().__init__(parent)
-        self.parent_window = parent
-        
-    def keyPressEvent(self, event):
-        # 如果按下下方向键，聚焦到播放列表
-        if event.key() == Qt.Key_Down:
-            if self.parent_window and hasattr(self.parent_window, 'playlist_widget'):
-                self.parent_window.focus_playlist_from_search()
+        self.source = source
+        self._rows = None
+        self._row_of_source = None  # 源行号 -> 过滤后行号（按需生成）
+
+        source.modelAboutToBeReset.connect(self.beginResetModel)
+        source.modelReset.connect(self._on_source_reset)
+        source.rowsAboutToBeInserted.connect(self._on_source_rows_about_to_be_inserted)
+        source.rowsInserted.connect(self._on_source_rows_inserted)
+        source.rowsAboutToBeRemoved.connect(self._on_source_rows_about_to_be_removed)
+        source.rowsRemoved.connect(self._on_source_rows_removed)
+        source.dataChanged.connect(self._on_source_data_changed)
+        source.rows_repaint_requested.connect(self._on_source_repaint_requested)
+
+    def is_filtered(self):
+        return self._rows is not None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.source.tracks) if self._rows is None else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        source_row = self.map_to_source(index.row())
+        if source_row < 0:
+            return None
+        return self.source.data(self.source.index(source_row), role)
+
+    def map_to_source(self, row):
+        if self._rows is None:
+            return row if 0 <= row < len(self.source.tracks) else -1
+        return self._rows[row] if 0 <= row < len(self._rows) else -1
+
+    def map_from_source(self, source_row):
+        if self._rows is None:
+            return source_row
+        if isinstance(self._rows, range):
+            return self._rows.index(source_row) if source_row in self._rows else -1
+        if self._row_of_source is None:
+            self._row_of_source = {r: i for i, r in enumerate(self._rows)}
+        return self._row_of_source.get(source_row, -1)
+
+    def set_filter_rows(self, rows):
+        """设置过滤结果（源行号列表或 range），None 表示显示全部"""
+        if rows is self._rows:
+            return
+        everything = range(len(self.source.tracks))
+        current = everything if self._rows is None else self._rows
+        new = everything if rows is None else rows
+        if type(current) is type(new) and current == new:
+            # 显示的行不变（例如单个字命中了全部行），只记下是否处于过滤状态
+            self._rows = rows
+            self._row_of_source = None
             return
-        
-        # 其他按键正常处理
-        super().keyPressEvent(event)
 
+        removed = self._removed_ranges(current, new)
+        if removed is None:
+            self.beginResetModel()
+            self._rows = rows
+            self._row_of_source = None
+            self.endResetModel()
+            return
+        # 继续输入缩小了结果：从后往前逐段删除，视图保留排版和滚动位置
+        remaining = list(current)
+        for first, last in removed:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del remaining[first:last + 1]
+            self._rows = remaining
+            self._row_of_source = None
+            self.endRemoveRows()
+        self._rows = rows
+
+    def _removed_ranges(self, current, new):
+        """new 是 current 按顺序去掉不超过 MAX_REMOVED_RANGES 段的结果时，
+        返回这些段在 current 中的位置区间（从后往前），否则返回 None"""
+        if not new or len(new) >= len(current):
+            return None
+        if isinstance(current, range):
+            if current.start != 0 or current.step != 1:
+                return None
+            positions = new     # 全部行时位置就是源行号
+        else:
+            if self._row_of_source is None:
+                self._row_of_source = {r: i for i, r in enumerate(current)}
+            positions = list(map(self._row_of_source.get, new, itertools.repeat(-1)))
+        # 相邻两项不连续的地方就是一段被去掉的行（在 C 层比较，段数超出上限就停下）
+        breaks = list(itertools.islice(itertools.compress(
+            range(1, len(positions)),
+            map(operator.ne, itertools.islice(positions, 1, None), map((1).__add__, positions))
+        ), self.MAX_REMOVED_RANGES + 1))
+        if len(breaks) > self.MAX_REMOVED_RANGES or positions[0] < 0:
+            return None
+        ranges = []
+        if positions[-1] < len(current) - 1:
+            ranges.append((positions[-1] + 1, len(current) - 1))
+        for i in reversed(breaks):
+            if positions[i] <= positions[i - 1]:
+                return None     # 顺序不同（例如按匹配程度排序的模糊搜索结果）
+            ranges.append((positions[i - 1] + 1, positions[i] - 1))
+        if positions[0] > 0:
+            ranges.append((0, positions[0] - 1))
+        return ranges or None
+
+    def append_filtered_rows(self, rows):
+        """过滤状态下源模型追加了新歌，把其中匹配的行追加到结果末尾"""
+        if self._rows is None or not rows:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        if isinstance(self._rows, range):
+            self._rows = list(self._rows)
+        self._rows.extend(rows)
+        self._row_of_source = None
+        self.endInsertRows()
+
+    # ---- 跟随源模型的变化 ----
+
+    def _on_source_reset(self):
+        self._rows = None
+        self._row_of_source = None
+        self.endResetModel()
+
+    def _on_source_rows_about_to_be_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+
+    def _on_source_rows_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.endInsertRows()
+            return
+        # 过滤状态下：插入点之后的源行号整体后移
+        count = last - first + 1
+        self._rows = [r + count if r >= first else r for r in self._rows]
+        self._row_of_source = None
+
+    def _on_source_rows_about_to_be_removed(self, parent, first, last):
+        if self._rows is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            return
+        self._removed_positions = [i for i, r in enumerate(self._rows) if first <= r <= last]
+        if len(self._removed_positions) == 1:
+            position = self._removed_positions[0]
+            self.beginRemoveRows(QModelIndex(), position, position)
+        elif self._removed_positions:
+            self.beginResetModel()
+
+    def _on_source_rows_removed(self, parent, first, last):
+        if self._rows is None:
+            self.endRemoveRows()
+            return
+        count = last - first + 1
+        self._rows = [r - count if r > last else r
+                      for r in self._rows if not first <= r <= last]
+        self._row_of_source = None
+        if len(self._removed_positions) == 1:
+            self.endRemoveRows()
+        elif self._removed_positions:
+            self.endResetModel()
+
+    def _on_source_data_changed(self, top_left, bottom_right, roles=None):
+        for source_row in range(top_left.row(), bottom_right.row() + 1):
+            row = self.map_from_source(source_row)
+            if row >= 0:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, roles or [])
+
+    def _on_source_repaint_requested(self, source_rows):
+        rows = [self.map_from_source(r) for r in source_rows]
+        rows = [r for r in rows if r >= 0]
+        if rows:
+            self.rows_repaint_requested.emit(rows)
+
+
+# 播放时钟
+class PlaybackClock:
+    """界面线程中的播放位置：以开始、暂停、继续、跳转这些事件为锚点，按单调时钟推算当前位置，
+    界面可以按显示帧率刷新进度而不必询问混音器。
+
+    播放引擎每秒送来一次带时间戳的实际位置（sync）：偏差很大（例如打开文件比预期慢）时直接对齐，
+    小偏差每次只修正一部分，进度条不会来回跳。
+    """
+
+    SNAP_MS = 250.0     # 偏差超过这个值时直接对齐
+    SLEW = 0.25         # 小偏差每次修正的比例
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.running = False
+        self.duration_ms = 0
+        self.last_error_ms = 0.0
+        self._anchor_ms = 0.0
+        self._anchor_time = clock()
+        self._event_time = self._anchor_time
+
+    def _anchor(self, position_ms):
+        self._anchor_ms = float(position_ms)
+        self._anchor_time = self._event_time = self._clock()
+
+    def start(self, position_ms=0, duration_ms=0):
+        self.duration_ms = duration_ms
+        self._anchor(position_ms)
+        self.running = True
+
+    def pause(self):
+        if self.running:
+            self._anchor(self.position())
+            self.running = False
+
+    def resume(self):
+        if not self.running:
+            self._anchor(self._anchor_ms)
+            self.running = True
+
+    def seek(self, position_ms):
+        self._anchor(position_ms)
 
-# 自定义播放列表，支持回车键播放
-class PlaylistWidget(QListWidget):
+    def stop(self):
+        self.running = False
+        self.duration_ms = 0
+        self._anchor(0)
+
+    def _raw_position(self, now):
+        if not self.running:
+            return self._anchor_ms
+        return self._anchor_ms + (now - self._anchor_time) * 1000
+
+    def position(self, now=None):
+        """当前位置（毫秒），不超出 [0, 时长]"""
+        position = max(0.0, self._raw_position(self._clock() if now is None else now))
+        return min(position, self.duration_ms) if self.duration_ms > 0 else position
+
+    def sync(self, reported_ms, measured_at):
+        """用播放引擎在 measured_at 时刻取得的实际位置修正时钟；早于最近一次事件的报告已经过时，忽略"""
+        if not self.running or measured_at < self._event_time:
+            return
+        error = reported_ms - self._raw_position(measured_at)
+        self.last_error_ms = error
+        if abs(error) > self.SNAP_MS:
+            self._anchor_ms = float(reported_ms)
+            self._anchor_time = measured_at
+        else:
+            self._anchor_ms += error * self.SLEW
+
+
+# 带波形概览的进度条
+class WaveformSlider(QSlider):
+    """在滑槽位置画出整首歌的波形（compute_waveform 的峰值和均方根），已播放部分用高亮色。
+
+    波形按当前尺寸预先画成两张图（未播放/已播放的颜色），进度变化时只需要贴图，
+    进度条可以按显示帧率刷新。
+    """
+
+    def __init__(self, orientation, parent=None):
+        super().__init__(orientation, parent)
+        self._peaks = b''
+        self._rms = b''
+        self._images = None     # (尺寸, 未播放的图, 已播放的图)
+        self.setMinimumHeight(32)
+
+    def set_waveform(self, data):
+        """data: compute_waveform 的结果；None 或空时恢复普通进度条"""
+        half = len(data) // 2 if data else 0
+        self._peaks = data[:half] if half else b''
+        self._rms = data[half:] if half else b''
+        self._images = None
+        self.update()
+
+    def has_waveform(self):
+        return bool(self._peaks)
+
+    def resizeEvent(self, event):
+        self._images = None
+        super().resizeEvent(event)
+
+    def _render(self, width, height, peak_color, rms_color):
+        """画出整条波形：每个像素列取对应各段中最大的峰值和均方根"""
+        image = QPixmap(width, height)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        count = len(self._peaks)
+        middle = height / 2
+        amplitude = height / 2 - 2
+        for x in range(width):
+            first = x * count // width
+            last = max(first + 1, (x + 1) * count // width)
+            peak_height = max(1, int(max(self._peaks[first:last]) / 255 * amplitude))
+            rms_height = int(max(self._rms[first:last]) / 255 * amplitude)
+            painter.fillRect(x, int(middle - peak_height), 1, 2 * peak_height, peak_color)
+            if rms_height:
+                painter.fillRect(x, int(middle - rms_height), 1, 2 * rms_height, rms_color)
+        painter.end()
+        return image
+
+    def paintEvent(self, event):
+        if not self._peaks:
+            super().paintEvent(event)
+            return
+        option = QStyleOptionSlider()
+        self.initStyleOption(option)
+        handle = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderHandle, self)
+        # 波形左右各留出半个滑块宽度，与滑块中心能到达的范围对齐
+        left = handle.width() // 2
+        width = self.width() - handle.width()
+        if width <= 0:
+            super().paintEvent(event)
+            return
+        size = (width, self.height())
+        if self._images is None or self._images[0] != size:
+            palette = self.palette()
+            highlight = palette.highlight().color()
+            self._images = (size,
+                            self._render(width, self.height(), palette.mid().color(), palette.dark().color()),
+                            self._render(width, self.height(), highlight, highlight.darker(130)))
+        played = max(0, min(width, handle.center().x() - left)) if self.maximum() > self.minimum() else 0
+
+        painter = QPainter(self)
+        _, remaining_image, played_image = self._images
+        painter.drawPixmap(left + played, 0, remaining_image, played, 0, width - played, self.height())
+        if played:
+            painter.drawPixmap(left, 0, played_image, 0, 0, played, self.height())
+        # 只画滑块，不画默认的滑槽
+        option.subControls = QStyle.SC_SliderHandle
+        self.style().drawComplexControl(QStyle.CC_Slider, option, painter, self)
+        painter.end()
+
+
+# 频谱显示
+class SpectrumWidget(QWidget):
+    """频谱和电平显示：按显示帧率从 SampleTap 取出正在播放的采样，加窗后做 FFT，合并成对数间隔的频段。
+
+    只在自己可见且窗口没有最小化时运行计时器（隐藏到托盘时 Qt 会对子控件发送 hideEvent）。
+    每帧的计算和绘制时间计入滑动平均，超过预算时降低帧率，回落后再恢复。
+    """
+
+    FFT_SIZE = 2048
+    BANDS = 32
+    MIN_FREQUENCY = 40.0
+    MAX_FREQUENCY = 16000.0
+    FLOOR_DB = -72.0
+    FALL_DB_PER_SECOND = 48.0
+    FRAME_INTERVALS = (33, 50, 100)     # 毫秒，约 30 / 20 / 10 帧每秒，超出预算时依次降级
+    FRAME_BUDGET_MS = 3.0               # 单帧（计算 + 绘制）的时间预算
+
+    def __init__(self, tap, parent=None):
+        super().__init__(parent)
+        self.tap = tap
+        self.setMinimumHeight(60)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.tick)
+        self._interval_level = 0
+        self.frame_cost_ms = 0.0        # 单帧耗时的滑动平均
+        self.frames = 0
+        self._last_tick = None
+        self._levels = None
+        self._meter_db = self.FLOOR_DB
+        self.source_active = False      # 引擎正在通过声道播放，SampleTap 有数据
+        if NUMPY_AVAILABLE:
+            self._levels = np.full(self.BANDS, self.FLOOR_DB)
+            self._layout_for_rate(tap.frequency)
+
+    def _layout_for_rate(self, frequency):
+        self._window = np.hanning(self.FFT_SIZE)
+        # 满刻度正弦波对应 0 dB
+        self._reference = (self._window.sum() / 2) ** 2
+        edges = np.geomspace(self.MIN_FREQUENCY, min(self.MAX_FREQUENCY, frequency / 2), self.BANDS + 1)
+        bins = np.rint(edges * self.FFT_SIZE / frequency).astype(np.int64)
+        # 低频段不足一个频点时至少占一个，保证每段都不为空
+        steps = np.arange(len(bins))
+        bins = np.maximum.accumulate(bins - steps) + steps
+        self._band_starts = bins[:-1]
+        self._band_stop = bins[-1]
+
+    @property
+    def running(self):
+        return self._timer.isActive()
+
+    @property
+    def interval_ms(self):
+        return self.FRAME_INTERVALS[self._interval_level]
+
+    def update_running(self):
+        """窗口可见性变化后调用：只有看得见时才运行计时器并让引擎送数据"""
+        window = self.window()
+        active = self.isVisible() and not window.isMinimized() and self.tap.usable and self.source_active
+        self.tap.enabled = active
+        if active and not self._timer.isActive():
+            self._last_tick = None
+            self._timer.start(self.interval_ms)
+        elif not active and self._timer.isActive():
+            self._timer.stop()
+
+    def set_source_active(self, active):
+        """引擎切换播放方式时调用：不通过声道播放时没有采样，停下计时器并显示提示"""
+        self.source_active = active
+        if not active and self._levels is not None:
+            self._levels[:] = self.FLOOR_DB
+            self._meter_db = self.FLOOR_DB
+        self.update_running()
+        self.update()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_running()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_running()
+
+    def compute_frame(self, elapsed):
+        """用最新的采样更新各频段的电平（dB）；没有数据时按下降速度回落"""
+        fall = self.FALL_DB_PER_SECOND * elapsed
+        samples = self.tap.latest(self.FFT_SIZE)
+        if samples is None:
+            self._levels = np.maximum(self._levels - fall, self.FLOOR_DB)
+            self._meter_db = max(self._meter_db - fall, self.FLOOR_DB)
+            return
+        mono = samples.mean(axis=1) / 32768.0
+        spectrum = np.fft.rfft(mono * self._window)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        bands = np.maximum.reduceat(power[:self._band_stop], self._band_starts)
+        with np.errstate(divide='ignore'):
+            levels = 10 * np.log10(bands / self._reference)
+            meter = 10 * np.log10(np.mean(mono * mono) * 2) if len(mono) else self.FLOOR_DB
+        self._levels = np.maximum(np.maximum(levels, self._levels - fall), self.FLOOR_DB)
+        self._meter_db = max(float(meter), self._meter_db - fall, self.FLOOR_DB)
+
+    def tick(self):
+        started = time.perf_counter()
+        elapsed = started - self._last_tick if self._last_tick is not None else self.interval_ms / 1000
+        self._last_tick = started
+        self.compute_frame(elapsed)
+        self.repaint()
+        cost = (time.perf_counter() - started) * 1000
+        self.frame_cost_ms = cost if not self.frames else 0.9 * self.frame_cost_ms + 0.1 * cost
+        self.frames += 1
+        self._adjust_rate()
+        if self.frames % 30 == 0:
+            self.setToolTip(f"频谱：{self.cost_text()}")
+
+    def _adjust_rate(self):
+        """超出预算时降低帧率；耗时降到预算一半以下时恢复"""
+        level = self._interval_level
+        if self.frame_cost_ms > self.FRAME_BUDGET_MS and level + 1 < len(self.FRAME_INTERVALS):
+            level += 1
+        elif self.frame_cost_ms < self.FRAME_BUDGET_MS / 2 and level > 0:
+            level -= 1
+        if level != self._interval_level:
+            self._interval_level = level
+            self._timer.setInterval(self.interval_ms)
+
+    def cost_text(self):
+        fps = 1000 / self.interval_ms
+        return (f"{fps:.0f} 帧/秒，每帧 {self.frame_cost_ms:.2f} ms"
+                f"（占界面线程 {self.frame_cost_ms / self.interval_ms:.1%}）")
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        palette = self.palette()
+        painter.fillRect(self.rect(), palette.base())
+        meter_width = 8
+        width = self.width() - meter_width - 4
+        height = self.height()
+        if not self.source_active:
+            painter.setPen(palette.color(QPalette.Disabled, QPalette.Text))
+            painter.drawText(self.rect(), Qt.AlignCenter | Qt.TextWordWrap,
+                             "频谱只显示已解码缓存的歌曲（通过声道播放时），从下一首或拖动进度条后开始")
+        elif width > 0 and self._levels is not None:
+            scale = height / -self.FLOOR_DB
+            bar_color = palette.highlight().color()
+            for i, level in enumerate(self._levels):
+                x = i * width // self.BANDS
+                bar_width = max(1, (i + 1) * width // self.BANDS - x - 1)
+                bar_height = int((level - self.FLOOR_DB) * scale)
+                if bar_height > 0:
+                    painter.fillRect(x, height - bar_height, bar_width, bar_height, bar_color)
+            meter_height = int((self._meter_db - self.FLOOR_DB) * scale)
+            if meter_height > 0:
+                color = QColor(Qt.red) if self._meter_db > -1.0 else palette.dark().color()
+                painter.fillRect(self.width() - meter_width, height - meter_height, meter_width, meter_height, color)
+        painter.end()
+
+
+# 自定义播放列表视图，支持回车键播放
+class PlaylistView(QListView):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_window = parent
-        
+        # 所有行高度相同，视图不必逐行计算尺寸
+        self.setUniformItemSizes(True)
+        # 行数很多时分批排版，单次事件循环的耗时有上限；
+        # 排版每一项都会调用过滤模型（Python 实现）的 rowCount，每批 256 项约 1 ms，不会拖慢下一次按键
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(256)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+    def setModel(self, model):
+        super().setModel(model)
+        if hasattr(model, 'rows_repaint_requested'):
+            model.rows_repaint_requested.connect(self.repaint_rows)
+
+    def repaint_rows(self, rows):
+        """只重绘指定的行（不触发重新排版）"""
+        model = self.model()
+        for row in rows:
+            self.update(model.index(row, 0))
+
     def keyPressEvent(self, event):
         # 如果按下回车键，播放选中的歌曲
         if event.key() == Qt.Key_Return or event.key() == Qt.Key_Enter:
-            current_item = self.currentItem()
-            if current_item and self.parent_window:
-                self.parent_window.play_selected_song(current_item)
+            current_index = self.currentIndex()
+            if current_index.isValid() and self.parent_window:
+                self.parent_window.play_selected_song(current_index)
             return
         
         # 其他按键正常处理
@@ -641,6 +4561,183 @@ class ShortcutSettingsDialog(QDialog):
         super().accept()
 
 
+class PlayStatsDialog(QDialog):
+    """查看随机播放权重：每首歌的播放/听完/跳过次数、权重和被抽中的概率"""
+
+    MAX_ROWS = 500
+    SIMULATE_PICKS = 10000
+
+    def __init__(self, player, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("随机播放权重")
+        self.resize(720, 560)
+        if parent:
+            self.setWindowIcon(parent.windowIcon())
+
+        from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QHeaderView
+        self._item_class = QTableWidgetItem
+
+        self.player = player
+        sampler = player.weighted_sampler
+        stats = player.play_stats
+        songs = player.song_list
+
+        layout = QVBoxLayout()
+
+        self.weighted_checkbox = QCheckBox("随机播放时按权重抽取（常听完的多放，常跳过的少放）")
+        self.weighted_checkbox.setChecked(player.weighted_shuffle)
+        self.weighted_checkbox.toggled.connect(player.set_weighted_shuffle)
+        layout.addWidget(self.weighted_checkbox)
+
+        # 有统计记录的歌曲按权重从高到低排列，其余歌曲都是默认权重 1
+        rows = [i for i, song_info in enumerate(songs) if any(stats.get(song_info['path']))]
+        rows.sort(key=sampler.weight, reverse=True)
+        self.rows = rows[:self.MAX_ROWS]
+
+        summary = QLabel(
+            f"共 {len(songs)} 首，有统计记录 {len(rows)} 首（其余权重为 1）；"
+            f"别名表已建立 {sampler.rebuild_count} 次，抽样接受率 {sampler.acceptance_rate():.0%}"
+        )
+        summary.setWordWrap(True)
+        layout.addWidget(summary)
+
+        self.table = QTableWidget(len(self.rows), 7)
+        self.table.setHorizontalHeaderLabels(["歌曲", "播放", "听完", "跳过", "权重", "概率", "模拟"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        for r, row in enumerate(self.rows):
+            song_info = songs[row]
+            plays, full, skips = stats.get(song_info['path'])
+            values = [PlaylistModel.display_text(song_info), plays, full, skips,
+                      f"{sampler.weight(row):.2f}", f"{sampler.probability(row):.4%}", ""]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(str(value))
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(r, column, item)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        simulate_btn = QPushButton(f"模拟抽样 {self.SIMULATE_PICKS} 次")
+        simulate_btn.setToolTip("用当前的别名表实际抽样，对比“模拟”列与“概率”列")
+        simulate_btn.clicked.connect(self.simulate)
+        buttons.addWidget(simulate_btn)
+        buttons.addStretch()
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+        self.setLayout(layout)
+
+    def simulate(self):
+        """实际抽样，填写“模拟”列"""
+        counts = Counter(self.player.weighted_sampler.pick() for _ in range(self.SIMULATE_PICKS))
+        for r, row in enumerate(self.rows):
+            item = self._item_class(f"{counts[row] / self.SIMULATE_PICKS:.4%}")
+            item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            self.table.setItem(r, 6, item)
+
+
+class EqualizerDialog(QDialog):
+    """五段均衡器和限幅器设置，拖动滑块立即生效"""
+
+    def __init__(self, player, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("均衡器")
+        if parent:
+            self.setWindowIcon(parent.windowIcon())
+
+        self.player = player
+        layout = QVBoxLayout()
+
+        self.enabled_checkbox = QCheckBox("启用均衡器")
+        self.enabled_checkbox.setChecked(player.eq_enabled)
+        self.enabled_checkbox.toggled.connect(player.set_eq_enabled)
+        layout.addWidget(self.enabled_checkbox)
+
+        bands = QHBoxLayout()
+        self.sliders = []
+        self.value_labels = []
+        for (frequency, _), gain_db in zip(Equalizer.BANDS, player.eq_gains):
+            column = QVBoxLayout()
+            value_label = QLabel()
+            value_label.setAlignment(Qt.AlignCenter)
+            slider = QSlider(Qt.Vertical)
+            slider.setRange(-12, 12)
+            slider.setValue(int(round(gain_db)))
+            slider.setTickPosition(QSlider.TicksBothSides)
+            slider.setTickInterval(6)
+            slider.valueChanged.connect(self.on_slider_changed)
+            name = f"{frequency // 1000} kHz" if frequency >= 1000 else f"{frequency} Hz"
+            name_label = QLabel(name)
+            name_label.setAlignment(Qt.AlignCenter)
+            column.addWidget(value_label)
+            column.addWidget(slider, 0, Qt.AlignHCenter)
+            column.addWidget(name_label)
+            bands.addLayout(column)
+            self.sliders.append(slider)
+            self.value_labels.append(value_label)
+        layout.addLayout(bands)
+        self.update_labels()
+
+        self.limiter_checkbox = QCheckBox("限幅器（峰值不超过 -1 dBFS，防止提升后削波）")
+        self.limiter_checkbox.setChecked(player.limiter_enabled)
+        self.limiter_checkbox.toggled.connect(player.set_limiter_enabled)
+        layout.addWidget(self.limiter_checkbox)
+
+        note = QLabel("音效只作用于已解码缓存的歌曲（通过声道播放时），开启后会自动打开解码缓存")
+        note.setWordWrap(True)
+        layout.addWidget(note)
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+        self.update_status(player.channel_mode)
+        player.engine.channel_mode_changed.connect(self.update_status)
+
+        buttons = QHBoxLayout()
+        reset_btn = QPushButton("重置")
+        reset_btn.clicked.connect(self.reset)
+        buttons.addWidget(reset_btn)
+        buttons.addStretch()
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+        self.setLayout(layout)
+
+    def update_status(self, channel_mode):
+        if channel_mode:
+            self.status_label.setText("当前歌曲：音效已生效")
+        else:
+            self.status_label.setText("当前歌曲没有通过解码缓存播放，音效从下一首或拖动进度条后生效")
+
+    def done(self, result):
+        self.player.engine.channel_mode_changed.disconnect(self.update_status)
+        super().done(result)
+
+    def gains(self):
+        return [float(slider.value()) for slider in self.sliders]
+
+    def update_labels(self):
+        for slider, label in zip(self.sliders, self.value_labels):
+            label.setText(f"{slider.value():+d} dB")
+
+    def on_slider_changed(self):
+        self.update_labels()
+        self.player.set_eq_gains(self.gains())
+
+    def reset(self):
+        for slider in self.sliders:
+            slider.blockSignals(True)
+            slider.setValue(0)
+            slider.blockSignals(False)
+        self.update_labels()
+        self.player.set_eq_gains(self.gains())
+
+
 class MusicPlayer(QMainWindow):
     def get_resource_path(self, relative_path):
         """获取资源文件路径，支持PyInstaller打包"""
@@ -673,27 +4770,33 @@ class MusicPlayer(QMainWindow):
         # 设置窗口初始大小（用于非最大化状态）
         self.setGeometry(100, 100, 800, 600)
 
-        # 初始化 pygame 音频
-        try:
-            if not pygame.mixer.get_init():
-                pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=2048)
-        except Exception:
-            try:
-                pygame.mixer.init()
-            except Exception:
-                pass
+        # 播放引擎：独立线程持有 pygame 混音器，界面操作不会因为打开文件而卡住
+        self.engine = PlaybackEngine(self)
+        self.engine.track_started.connect(self.on_engine_track_started)
+        self.engine.load_failed.connect(self.on_engine_load_failed)
+        self.engine.queue_failed.connect(self.on_engine_queue_failed)
+        self.engine.ended.connect(self.on_engine_ended)
+        self.engine.position_changed.connect(self.update_progress)
+        self.engine.channel_mode_changed.connect(self.on_engine_channel_mode_changed)
+        self.engine.error.connect(lambda message: print(f"播放引擎错误: {message}"))
+        self.engine.start()
 
         # 播放状态
         self.is_playing = False
+        self.channel_mode = False       # 当前歌曲是否通过声道播放（音效和频谱只在此时有效）
         self.current_position = 0
         self.duration = 0
         self.volume = 70
         self.current_index = -1  # 当前播放的歌曲索引
         self.music_loaded = False  # 标记是否已加载音乐文件
-        self.seek_offset = 0  # 跳转偏移量，用于修正 pygame.mixer.music.get_pos()
+        self.slider_dragging = False  # 拖动进度条时不接收位置更新
+        # 播放时钟按单调时钟推算位置，进度条按显示帧率刷新；引擎每秒送来的位置只用来校正
+        self.playback_clock = PlaybackClock()
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self.animate_progress)
 
         # 设置初始音量 (pygame 音量范围 0.0-1.0)
-        pygame.mixer.music.set_volume(self.volume / 100.0)
+        self.engine.set_volume(self.volume / 100.0)
         
         # 播放模式 0:顺序播放 1:单曲循环 2:随机播放
         self.play_mode = 0
@@ -701,12 +4804,28 @@ class MusicPlayer(QMainWindow):
         # 单曲循环模式下的用户操作标记
         self.user_manual_skip = False
         
-        # 歌曲信息列表
-        self.song_list = []
+        # 歌曲信息列表（由播放列表模型持有，self.song_list 即 playlist_model.tracks）
+        self.playlist_model = PlaylistModel(self)
+        # 搜索索引自动跟随模型的增删改；视图显示的是过滤模型
+        self.search_index = SearchIndex(self.playlist_model)
+        self.fuzzy_index = FuzzySearchIndex(self.playlist_model)
+        self.playlist_filter = PlaylistFilterModel(self.playlist_model, self)
+
+        # 后台元数据扫描器（打开文件/文件夹时在后台解析标签）
+        self.metadata_scanner = MetadataScanner(self)
+        self.scan_id = 0
+
+        # 后台文件存在性检查（启动时不再同步检查每个文件）
+        self.existence_checker = ExistenceChecker(self)
+        self.existence_check_id = 0
+        self.scan_from_folder = False
         
-        # 播放历史记录（用于上一曲功能）
-        self.play_history = []
-        self.history_index = -1
+        # 播放历史（环形缓冲，支持多次上一曲/下一曲）和随机播放袋
+        self.play_history = HistoryRing(500)
+        self.shuffle_bag = ShuffleBag()
+        self.playlist_model.modelReset.connect(self.on_playlist_reset)
+        self.playlist_model.rowsInserted.connect(self.on_playlist_rows_inserted)
+        self.playlist_model.rowsRemoved.connect(self.on_playlist_rows_removed)
         
         # 初始化设置
         # 设置文件保存到程序所在目录
@@ -715,14 +4834,94 @@ class MusicPlayer(QMainWindow):
         else:
             app_dir = os.path.dirname(os.path.abspath(__file__))
         settings_path = os.path.join(app_dir, "settings.ini")
-        self.settings = QSettings(settings_path, QSettings.IniFormat)
-        self.settings.setIniCodec("UTF-8")
+        qsettings = QSettings(settings_path, QSettings.IniFormat)
+        qsettings.setIniCodec("UTF-8")
+        # 修改先缓存在内存中，合并后再写盘
+        self.settings = DeferredSettings(qsettings, self)
+
+        # 元数据缓存（与设置文件放在同一目录）
+        self.metadata_cache = None
+        try:
+            self.metadata_cache = MetadataCache(os.path.join(app_dir, "metadata_cache.db"))
+        except sqlite3.Error as e:
+            print(f"无法打开元数据缓存: {e}")
+        self.metadata_scanner.cache = self.metadata_cache
+
+        # MP3 帧索引：后台建立，缓存在元数据缓存数据库中，用于快速准确的跳转
+        self.seek_index_builder = SeekIndexBuilder(self.metadata_cache, self)
+        self.seek_index_builder.built.connect(self.on_seek_index_built)
+        self.seek_indexes = OrderedDict()   # 规范化路径 -> Mp3SeekIndex（只保留最近几首）
+
+        # 播放列表数据库（settings.ini 只保留真正的设置项）
+        self.library = LibraryStore(os.path.join(app_dir, "library.db"))
+
+        # 播放统计和加权随机抽样
+        self.play_stats = PlayStats(os.path.join(app_dir, "play_stats.log"))
+        self.play_stats.maybe_compact()
+        self.weighted_sampler = AliasSampler(self.shuffle_weights)
+        self.weighted_shuffle = self.settings.value("weighted_shuffle", True, type=bool)
+
+        # 无缝播放：queued_index 是已经交给混音器排队的下一首
+        self.gapless = self.settings.value("gapless_playback", True, type=bool)
+        self.queued_index = None
+        self.track_ended_at = None      # 上一首自然结束的时刻（用于计算切歌间隙）
+        self.next_random_index = None   # 随机模式下预先抽好的下一首
+        self.gap_stats = GapStats(budget_ms=20.0)
+
+        # 预读缓存：提前把接下来的歌读进内存，播放时不必等待网络盘（预算为 0 时关闭）
+        memory_mb = self.settings.value("readahead_budget_mb", 256, type=int)
+        spill_mb = self.settings.value("readahead_spill_mb", 2048, type=int)
+        self.readahead = ReadAheadCache(
+            memory_mb * 1024 * 1024, spill_mb * 1024 * 1024,
+            os.path.join(tempfile.gettempdir(), "music_player_readahead"), self
+        )
+        self.readahead.finished.connect(self.on_readahead_finished)
+        self.engine.readahead = self.readahead
+        self.pending_queue_index = None  # 等待预读完成后再交给混音器排队的下一首
+
+        # 响度均衡：按分析出的积分响度给每首歌设置增益（分析在进程池中进行，结果存入元数据缓存）
+        self.replay_gain = self.settings.value("replay_gain", True, type=bool)
+        # 目标取得较低（EBU R128 的 -23 LUFS），几乎所有歌曲都只需要衰减，均衡不受音量上限影响
+        self.replay_gain_target = self.settings.value("replay_gain_target", -23.0, type=float)
+        self.track_gains = {}   # 规范化路径 -> 线性增益
+        self.loudness_analyzer = None
+        if NUMPY_AVAILABLE:
+            self.loudness_analyzer = LoudnessAnalyzer(self.metadata_cache, parent=self)
+            self.loudness_analyzer.analyzed.connect(self.on_loudness_analyzed)
+            self.loudness_analyzer.progress.connect(self.on_loudness_progress)
+            self.loudness_analyzer.waveform_ready.connect(self.on_waveform_ready)
+
+        # 解码缓存（可选）：解码一次保存为 PCM 文件，单曲循环重播和跳转都不必重新解码
+        self.pcm_cache_dir = os.path.join(app_dir, "pcm_cache")
+        self.pcm_cache = None
+        if self.settings.value("pcm_cache", False, type=bool):
+            self.set_pcm_cache(True)
+
+        # 均衡器和限幅器：在引擎线程中处理解码后的音频块，开启时自动打开解码缓存
+        self.eq_enabled = self.settings.value("eq_enabled", False, type=bool)
+        self.eq_gains = [0.0] * len(Equalizer.BANDS)
+        for i, value in enumerate(self.settings.value("eq_gains", "", type=str).split(',')[:len(self.eq_gains)]):
+            try:
+                self.eq_gains[i] = max(-12.0, min(12.0, float(value)))
+            except ValueError:
+                pass
+        self.limiter_enabled = self.settings.value("limiter_enabled", False, type=bool)
+        # 频谱显示：取自声道模式下送给混音器的音频块，同样需要解码缓存
+        self.sample_tap = SampleTap(pygame.mixer.get_init())
+        self.engine.tap = self.sample_tap
+        self.spectrum_enabled = self.sample_tap.usable and self.settings.value("spectrum_enabled", False, type=bool)
+        if NUMPY_AVAILABLE:
+            self.apply_dsp()
         
         # 全局快捷键进程管理器
         self.global_hotkey_process = None
         self.hotkey_failed_shown = False  # 防止重复弹出对话框
         if GLOBAL_HOTKEY_AVAILABLE:
-            self.global_hotkey_process = GlobalHotkeyProcess()
+            self.global_hotkey_process = GlobalHotkeyProcess(parent=self)
+            self.global_hotkey_process.triggered.connect(self.on_global_hotkey)
+            self.global_hotkey_process.registration_failed.connect(
+                lambda items: QTimer.singleShot(500, lambda: self.show_hotkey_failed_dialog(items))
+            )
             
             # 从设置中加载快捷键（默认使用 Ctrl+Alt+Shift 避免冲突）
             hotkeys = {
@@ -745,10 +4944,8 @@ class MusicPlayer(QMainWindow):
         # 连接信号
         self.connect_signals()
         
-        # 定时器更新进度 - 减少更新频率以优化蓝牙播放
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_progress)
-        self.timer.start(1000)  # 保持1秒更新一次进度条
+        # 播放进度由播放引擎每秒送来一次（减少更新频率以优化蓝牙播放），
+        # 播放结束由引擎的事件通知，都不需要在界面线程轮询
         
         # 音频状态监控定时器（已禁用，因为会导致播放循环问题）
         # self.audio_monitor_timer = QTimer()
@@ -758,6 +4955,10 @@ class MusicPlayer(QMainWindow):
         # 加载上次的播放列表
         self.load_last_playlist()
         
+        # 延迟在后台清理元数据缓存中已经不存在的文件
+        if self.metadata_cache:
+            QTimer.singleShot(10000, self.start_cache_eviction)
+
         # 延迟初始化全局快捷键进程（避免与窗口初始化冲突）
         if self.global_hotkey_process:
             QTimer.singleShot(500, self.start_global_hotkey_process)
@@ -765,60 +4966,26 @@ class MusicPlayer(QMainWindow):
         # 设置窗口最大化（在所有初始化完成后）
         self.setWindowState(Qt.WindowMaximized)
 
+    def start_cache_eviction(self):
+        """在后台线程清理元数据缓存（网络盘上检查文件是否存在可能很慢）"""
+        threading.Thread(target=self.metadata_cache.maybe_evict_missing, daemon=True).start()
+
     def start_global_hotkey_process(self):
-        """延迟启动全局快捷键进程"""
+        """延迟启动全局快捷键进程（按键事件通过 triggered 信号送来，不需要定时检查）"""
         if self.global_hotkey_process:
             self.global_hotkey_process.start()
-            # 启动事件监听定时器
-            self.hotkey_event_timer = QTimer()
-            self.hotkey_event_timer.timeout.connect(self.check_hotkey_events)
-            self.hotkey_event_timer.start(50)  # 每50ms检查一次事件
-
-    def event(self, event):
-        """处理自定义事件"""
-        if event.type() == QEvent.User + 1:  # ShowWindowEvent
-            self.show_window()
-            return True
-        elif event.type() == QEvent.User + 2:  # TogglePlayEvent
-            self.toggle_play()
-            return True
-        elif event.type() == QEvent.User + 3:  # PreviousSongEvent
-            self.previous_song()
-            return True
-        elif event.type() == QEvent.User + 4:  # NextSongEvent
-            self.next_song()
-            return True
-        return super().event(event)
-    
-    def check_hotkey_events(self):
-        """检查全局快捷键事件"""
-        if not self.global_hotkey_process:
-            return
-
-        try:
-            events = self.global_hotkey_process.get_events()
-        except Exception as e:
-            return
 
-        for event in events:
-            # 处理元组事件（如热键注册失败通知）
-            if isinstance(event, tuple):
-                if event[0] == 'hotkey_failed':
-                    # 兼容旧格式（数字）和新格式（明细列表）
-                    payload = event[1] if len(event) > 1 else None
-                    failed_items = payload if isinstance(payload, list) else None
-                    QTimer.singleShot(
-                        500,
-                        lambda items=failed_items: self.show_hotkey_failed_dialog(items)
-                    )
-            elif event == 'show_window':
-                self.show_window()
-            elif event == 'toggle_play':
-                self.toggle_play()
-            elif event == 'previous_song':
-                self.previous_song()
-            elif event == 'next_song':
-                self.next_song()
+    def on_global_hotkey(self, action):
+        """全局快捷键被按下"""
+        handlers = {
+            'show_window': self.show_window,
+            'toggle_play': self.toggle_play,
+            'previous_song': self.previous_song,
+            'next_song': self.next_song,
+        }
+        handler = handlers.get(action)
+        if handler:
+            handler()
 
     def show_hotkey_failed_dialog(self, failed_items=None):
         """显示热键注册失败对话框，列出具体被占用的快捷键。
@@ -893,6 +5060,58 @@ class MusicPlayer(QMainWindow):
         self.mode_combo.currentIndexChanged.connect(self.change_play_mode)
         self.mode_combo.setToolTip("播放模式: Alt+M(循环切换) Alt+L(打开下拉菜单)\n智能单曲循环: 自然播放结束时循环，手动切换时随机跳转")
         top_layout.addWidget(self.mode_combo)
+
+        # 无缝播放：提前打开下一首交给混音器排队
+        self.gapless_checkbox = QCheckBox("无缝播放")
+        self.gapless_checkbox.setChecked(self.gapless)
+        self.gapless_checkbox.toggled.connect(self.set_gapless)
+        self.update_gap_tooltip()
+        top_layout.addWidget(self.gapless_checkbox)
+
+        # 解码缓存：已解码的歌曲通过声道播放
+        self.pcm_cache_checkbox = QCheckBox("解码缓存")
+        self.pcm_cache_checkbox.setChecked(self.pcm_cache is not None)
+        self.pcm_cache_checkbox.toggled.connect(self.set_pcm_cache)
+        self.pcm_cache_checkbox.setToolTip("把播放过的歌解码后保存在磁盘上（按预算淘汰），"
+                                           "单曲循环重播不再解码，跳转精确到采样")
+        top_layout.addWidget(self.pcm_cache_checkbox)
+
+        # 响度均衡
+        self.replay_gain_checkbox = QCheckBox("音量均衡")
+        self.replay_gain_checkbox.setChecked(self.replay_gain)
+        self.replay_gain_checkbox.toggled.connect(self.set_replay_gain)
+        self.replay_gain_checkbox.setToolTip(
+            f"按每首歌的响度自动调整音量：比 {self.replay_gain_target:.0f} LUFS 响的歌调低到这个响度\n"
+            "新播放的歌会在后台自动分析（单个进程），“分析音量”用全部核心分析整个列表"
+        )
+        top_layout.addWidget(self.replay_gain_checkbox)
+
+        self.analyze_loudness_btn = QPushButton("分析音量")
+        self.analyze_loudness_btn.clicked.connect(self.analyze_library_loudness)
+        self.analyze_loudness_btn.setToolTip("用所有 CPU 核心分析播放列表中所有歌曲的响度")
+        top_layout.addWidget(self.analyze_loudness_btn)
+        # 均衡器
+        self.equalizer_btn = QPushButton("均衡器")
+        self.equalizer_btn.clicked.connect(self.show_equalizer)
+        self.equalizer_btn.setToolTip("五段均衡器和防削波限幅器（作用于解码缓存播放的歌曲）")
+        top_layout.addWidget(self.equalizer_btn)
+        # 频谱显示
+        self.spectrum_checkbox = QCheckBox("频谱")
+        self.spectrum_checkbox.setChecked(self.spectrum_enabled)
+        self.spectrum_checkbox.toggled.connect(self.set_spectrum_enabled)
+        self.spectrum_checkbox.setToolTip("显示正在播放的声音的频谱（作用于解码缓存播放的歌曲，窗口隐藏或最小化时不计算）")
+        top_layout.addWidget(self.spectrum_checkbox)
+        if not NUMPY_AVAILABLE:
+            for widget in (self.replay_gain_checkbox, self.analyze_loudness_btn, self.equalizer_btn,
+                           self.spectrum_checkbox):
+                widget.setEnabled(False)
+                widget.setToolTip("需要安装 numpy")
+
+        # 随机播放权重查看
+        self.play_stats_btn = QPushButton("随机权重")
+        self.play_stats_btn.clicked.connect(self.show_play_stats)
+        self.play_stats_btn.setToolTip("查看每首歌的播放/听完/跳过次数和随机播放权重")
+        top_layout.addWidget(self.play_stats_btn)
         
         # 快捷键设置按钮（包含本地和全局两个分页）
         self.shortcut_btn = QPushButton("快捷键设置")
@@ -923,8 +5142,20 @@ class MusicPlayer(QMainWindow):
         search_layout.addWidget(QLabel("搜索 (Alt+D):"))
         self.search_box = SearchLineEdit(self) # Pass self as parent
         self.search_box.setPlaceholderText("输入歌曲名称或艺术家...")
-        self.search_box.textChanged.connect(self.filter_playlist)
+        self.search_box.textChanged.connect(self.on_search_text_changed)
+        # 输入停顿后再过滤，连续输入时不重复计算
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.filter_playlist)
         search_layout.addWidget(self.search_box)
+
+        # 模糊搜索：容忍错字，结果按匹配程度排序
+        self.fuzzy_checkbox = QCheckBox("模糊")
+        self.fuzzy_checkbox.setToolTip("容忍错字和漏字，结果按匹配程度排序")
+        self.fuzzy_checkbox.setChecked(self.settings.value("fuzzy_search", False, type=bool))
+        self.fuzzy_checkbox.toggled.connect(self.on_fuzzy_search_toggled)
+        search_layout.addWidget(self.fuzzy_checkbox)
         
         # 定位按钮
         locate_btn = QPushButton("定位 (Alt+G)")
@@ -946,12 +5177,31 @@ class MusicPlayer(QMainWindow):
         self.folder_label.setVisible(False)
         left_layout.addWidget(self.folder_label)
 
+        # 扫描进度（后台解析标签时显示，可取消）
+        self.scan_status_widget = QWidget()
+        scan_status_layout = QHBoxLayout()
+        scan_status_layout.setContentsMargins(0, 0, 0, 0)
+        self.scan_status_widget.setLayout(scan_status_layout)
+        self.scan_status_label = QLabel("")
+        self.scan_status_label.setStyleSheet("color: gray; font-size: 11px;")
+        scan_status_layout.addWidget(self.scan_status_label)
+        self.scan_progress_bar = QProgressBar()
+        self.scan_progress_bar.setMaximumHeight(14)
+        self.scan_progress_bar.setTextVisible(False)
+        scan_status_layout.addWidget(self.scan_progress_bar)
+        self.scan_cancel_btn = QPushButton("取消")
+        self.scan_cancel_btn.clicked.connect(self.cancel_scan)
+        scan_status_layout.addWidget(self.scan_cancel_btn)
+        self.scan_status_widget.setVisible(False)
+        left_layout.addWidget(self.scan_status_widget)
+
         # 播放列表
-        self.playlist_widget = PlaylistWidget(self) # Pass self as parent
-        self.playlist_widget.itemDoubleClicked.connect(self.play_selected_song)
-        self.playlist_widget.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.playlist_widget.customContextMenuRequested.connect(self.show_context_menu)
-        left_layout.addWidget(self.playlist_widget)
+        self.playlist_view = PlaylistView(self) # Pass self as parent
+        self.playlist_view.setModel(self.playlist_filter)
+        self.playlist_view.doubleClicked.connect(self.play_selected_song)
+        self.playlist_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.playlist_view.customContextMenuRequested.connect(self.show_context_menu)
+        left_layout.addWidget(self.playlist_view)
         
         # 播放列表快捷键提示
         playlist_hint_label = QLabel("提示: ↓(从搜索框进入) Enter(播放) Alt+G(定位正在播放) Ctrl+R(重命名) Delete(删除) 双击播放")
@@ -975,7 +5225,7 @@ class MusicPlayer(QMainWindow):
         # 进度条
         progress_layout = QHBoxLayout()
         self.time_label = QLabel("00:00")
-        self.progress_slider = QSlider(Qt.Horizontal)
+        self.progress_slider = WaveformSlider(Qt.Horizontal)
         self.progress_slider.sliderPressed.connect(self.slider_pressed)
         self.progress_slider.sliderReleased.connect(self.slider_released)
         self.progress_slider.setToolTip("进度条 (←后退5秒, →前进5秒)")
@@ -991,6 +5241,11 @@ class MusicPlayer(QMainWindow):
         seek_hint_label.setStyleSheet("color: gray; font-size: 10px;")
         seek_hint_label.setAlignment(Qt.AlignCenter)
         right_layout.addWidget(seek_hint_label)
+
+        # 频谱
+        self.spectrum_widget = SpectrumWidget(self.sample_tap)
+        self.spectrum_widget.setVisible(self.spectrum_enabled)
+        right_layout.addWidget(self.spectrum_widget)
         
         # 控制按钮
         control_layout = QHBoxLayout()
@@ -1172,7 +5427,11 @@ class MusicPlayer(QMainWindow):
     def connect_signals(self):
         """连接信号和槽"""
         # 已改用 pygame，不再使用 QMediaPlayer 的信号
-        pass
+        # 后台扫描器的信号（跨线程，Qt 会自动排队到 GUI 线程执行）
+        self.metadata_scanner.batch_ready.connect(self.on_scan_batch)
+        self.metadata_scanner.progress.connect(self.on_scan_progress)
+        self.metadata_scanner.finished.connect(self.on_scan_finished)
+        self.existence_checker.missing_found.connect(self.on_missing_songs_found)
 
     def open_file(self):
         """打开音频文件"""
@@ -1184,57 +5443,52 @@ class MusicPlayer(QMainWindow):
         if file_paths:
             # 清空旧的播放列表
             self.clear_playlist()
+            # 后台扫描，扫描结束后保存播放列表
             self.add_files_to_playlist(file_paths)
-            # 保存播放列表
-            self.save_playlist()
 
     def open_folder(self):
         """打开文件夹"""
         folder_path = QFileDialog.getExistingDirectory(self, "选择文件夹")
         
         if folder_path:
-            audio_extensions = ['.mp3', '.wav', '.m4a', '.flac', '.ogg']
-            file_paths = []
-
-            for root, dirs, files in os.walk(folder_path, followlinks=True):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in audio_extensions):
-                        file_paths.append(os.path.join(root, file))
-
-            if file_paths:
-                # 清空旧的播放列表
-                self.clear_playlist()
-                self.add_files_to_playlist(file_paths)
-                # 显示文件夹名
-                folder_name = os.path.basename(folder_path)
-                self.folder_label.setText(f"文件夹: {folder_name}")
-                self.folder_label.setVisible(True)
-                # 保存播放列表
-                self.save_playlist()
-            else:
-                QMessageBox.information(self, "提示", "所选文件夹中没有找到音频文件")
+            # 清空旧的播放列表
+            self.clear_playlist()
+            # 显示文件夹名（需在扫描结束保存播放列表之前设置好）
+            folder_name = os.path.basename(folder_path)
+            self.folder_label.setText(f"文件夹: {folder_name}")
+            self.folder_label.setVisible(True)
+            # 边遍历文件夹边在后台解析，扫描结束后保存播放列表
+            exclude_globs = self.settings.value("scan_exclude_globs", "", type=str)
+            self.add_files_to_playlist(iter_audio_files(folder_path, exclude_globs))
+            self.scan_from_folder = True
 
     def clear_playlist(self):
         """清空播放列表"""
+        # 停止正在进行的后台扫描和文件检查
+        self.cancel_scan()
+        self.existence_checker.cancel()
+        self.existence_check_id = 0
+
         # 停止播放
-        pygame.mixer.music.stop()
+        self.engine.stop()
 
         # 清空所有播放列表相关数据
-        self.song_list.clear()
-        self.playlist_widget.clear()
+        self.playlist_model.clear()
         self.play_history.clear()
+        self.library.clear()
 
         # 重置播放状态
         self.current_position = 0
-        self.seek_offset = 0
         self.duration = 0
         self.is_playing = False
         self.current_index = -1
         self.music_loaded = False
+        self.playback_clock.stop()
 
         # 更新UI显示
         self.current_song_label.setText("没有正在播放的歌曲")
         self.progress_slider.setValue(0)
+        self.progress_slider.set_waveform(None)
         self.time_label.setText("00:00")
         self.total_time_label.setText("00:00")
         self.play_btn.setText("播放 (Alt+P/空格)")
@@ -1246,71 +5500,113 @@ class MusicPlayer(QMainWindow):
         # 清空当前播放列表
         self.clear_playlist()
 
-        # 删除保存的播放列表设置
-        self.settings.remove("playlist_full")
-        self.settings.remove("playlist")
+        # 删除保存的播放位置（播放列表数据库已在 clear_playlist 中清空）
         self.settings.remove("current_index")
-        self.settings.remove("folder_label")
 
 
     def add_files_to_playlist(self, file_paths):
-        """添加文件到播放列表"""
-        for file_path in file_paths:
-            # 规范化路径
-            file_path = os.path.normpath(file_path)
+        """添加文件到播放列表（后台解析标签，结果分批插入）"""
+        self.scan_id = self.metadata_scanner.start(file_paths)
+        self.scan_from_folder = False
+        self.scan_cache_stats = self.metadata_cache.stats() if self.metadata_cache else None
+        self.scan_total = len(file_paths) if hasattr(file_paths, '__len__') else 0
+        self.scan_progress_bar.setRange(0, self.scan_total)
+        self.scan_progress_bar.setValue(0)
+        self.scan_status_label.setText("正在读取歌曲信息...")
+        self.scan_status_widget.setVisible(True)
+
+    def on_scan_batch(self, scan_id, songs):
+        """后台扫描送回一批歌曲，追加到播放列表"""
+        if scan_id != self.scan_id:
+            return
 
-            # 获取歌曲信息
-            song_info = self.get_song_info(file_path)
-            self.song_list.append(song_info)
+        # 先写入数据库，拿到每首歌的 id
+        self.library.insert_tracks(songs)
 
-            # 添加到UI列表
-            display_text = song_info.get('display_name', f"{song_info['title']} - {song_info['artist']}")
-            item = QListWidgetItem(display_text)
-            self.playlist_widget.addItem(item)
+        first = len(self.song_list)
+        self.playlist_model.append_tracks(songs)
 
+        # 新加入的行也要应用当前的搜索过滤
+        if self.playlist_filter.is_filtered() and self.fuzzy_checkbox.isChecked():
+            # 模糊搜索的结果有排序，等这批歌曲到齐后重新搜索一次
+            self.search_timer.start()
+        elif self.playlist_filter.is_filtered():
+            self.playlist_filter.append_filtered_rows(self.search_index.match_rows(
+                self.search_box.text(), range(first, len(self.song_list))
+            ))
 
-    def get_song_info(self, file_path):
-        """获取歌曲信息"""
-        song_info = {
-            'path': file_path,
-            'title': os.path.basename(file_path),
-            'artist': '未知艺术家',
-            'album': '未知专辑',
-            'duration': 0
-        }
-        
-        try:
-            audio_file = mutagen.File(file_path)
-            if audio_file is not None:
-                # 获取标题
-                if 'TIT2' in audio_file:
-                    song_info['title'] = str(audio_file['TIT2'])
-                elif 'TITLE' in audio_file:
-                    song_info['title'] = str(audio_file['TITLE'][0])
-                
-                # 获取艺术家
-                if 'TPE1' in audio_file:
-                    song_info['artist'] = str(audio_file['TPE1'])
-                elif 'ARTIST' in audio_file:
-                    song_info['artist'] = str(audio_file['ARTIST'][0])
-                
-                # 获取专辑
-                if 'TALB' in audio_file:
-                    song_info['album'] = str(audio_file['TALB'])
-                elif 'ALBUM' in audio_file:
-                    song_info['album'] = str(audio_file['ALBUM'][0])
-                
-                # 获取时长
-                if hasattr(audio_file, 'info') and hasattr(audio_file.info, 'length'):
-                    song_info['duration'] = int(audio_file.info.length)
-        except Exception:
-            pass
-        
-        return song_info
+    def on_scan_progress(self, scan_id, done, total):
+        """更新扫描进度"""
+        if scan_id != self.scan_id:
+            return
+        if total:
+            self.scan_progress_bar.setRange(0, total)
+            self.scan_progress_bar.setValue(done)
+            self.scan_status_label.setText(f"正在读取歌曲信息 {done}/{total}")
+        else:
+            self.scan_progress_bar.setRange(0, 0)
+            self.scan_status_label.setText(f"正在读取歌曲信息 {done}")
+
+    def on_scan_finished(self, scan_id, completed):
+        """扫描结束（完成或取消）"""
+        if scan_id != self.scan_id:
+            return
+        self.scan_status_widget.setVisible(False)
+
+        # 在提示框里显示本次扫描的缓存命中情况
+        if self.metadata_cache and self.scan_cache_stats:
+            stats = self.metadata_cache.stats()
+            hits = stats['hits'] - self.scan_cache_stats['hits']
+            misses = stats['misses'] - self.scan_cache_stats['misses']
+            self.statusBar().showMessage(
+                f"读取完成: 缓存命中 {hits}，重新解析 {misses}（缓存共 {stats['entries']} 条）", 5000
+            )
+
+        # 文件夹里一首音频都没有
+        if completed and self.scan_from_folder and not self.song_list:
+            self.folder_label.setText("")
+            self.folder_label.setVisible(False)
+            QMessageBox.information(self, "提示", "所选文件夹中没有找到音频文件")
+            return
+
+        # 保存播放列表（取消时保存已经读取到的部分）
+        self.save_playlist()
+
+    def cancel_scan(self):
+        """取消正在进行的后台扫描，已插入的歌曲保留"""
+        if not self.metadata_scanner.is_running():
+            return
+        self.metadata_scanner.cancel()
+        # 之后到达的旧扫描信号都会被忽略
+        self.scan_id = 0
+        self.scan_status_widget.setVisible(False)
+        self.save_playlist()
 
-    def play_selected_song(self, item):
+    def get_song_info(self, file_path):
+        """获取歌曲信息（优先使用元数据缓存）"""
+        return read_song_info(file_path, self.metadata_cache)
+
+    @property
+    def song_list(self):
+        """当前播放列表的歌曲字典列表（只读引用，修改请通过 playlist_model）"""
+        return self.playlist_model.tracks
+
+    def _row_from_view_index(self, view_index):
+        """把视图中的索引转换为 song_list 中的行号"""
+        if not view_index.isValid():
+            return -1
+        return self.playlist_filter.map_to_source(view_index.row())
+
+    def _view_index_for_row(self, row):
+        """把 song_list 中的行号转换为视图中的索引（被过滤掉时返回无效索引）"""
+        view_row = self.playlist_filter.map_from_source(row)
+        return self.playlist_filter.index(view_row) if view_row >= 0 else QModelIndex()
+
+    def play_selected_song(self, view_index):
         """播放选中的歌曲"""
-        index = self.playlist_widget.row(item)
+        index = self._row_from_view_index(view_index)
+        if index < 0:
+            return
         self.play_song_at_index(index)
         # 重置手动跳转标记
         self.user_manual_skip = False
@@ -1320,34 +5616,304 @@ class MusicPlayer(QMainWindow):
     def play_song_at_index(self, index):
         """播放指定索引的歌曲"""
         if 0 <= index < len(self.song_list):
+            self.record_skip()
             song_info = self.song_list[index]
-            file_path = song_info['path']
-            try:
-                pygame.mixer.music.load(file_path)
-                self.music_loaded = True
-                pygame.mixer.music.play()
-                self.current_index = index
-                self.is_playing = True
-                self.current_position = 0
-                self.seek_offset = 0  # 重置跳转偏移量
-                self.duration = song_info.get('duration', 0) * 1000
-                self.update_current_song_display()
-                self.play_btn.setText("暂停 (Alt+P/空格)")
-            except Exception as e:
-                print(f"播放失败: {e}")
+            # 打开文件交给播放引擎线程；界面先按开始播放更新，打开失败时再标记
+            self.engine.play(song_info, song_info['path'], ended_at=self.track_ended_at,
+                             gain=self.track_gain(song_info))
+            self.track_ended_at = None
+            self.queued_index = None
+            self.music_loaded = True
+            self.begin_track(index)
+
+    def begin_track(self, index):
+        """一首歌开始播放后更新状态（直接播放和无缝衔接共用），并准备好下一首"""
+        song_info = self.song_list[index]
+        self.current_index = index
+        self.is_playing = True
+        self.current_position = 0
+        self.duration = song_info.get('duration', 0) * 1000
+        self.playback_clock.start(0, self.duration)
+        self.update_current_song_display()
+        self.start_progress_animation()
+        self.play_btn.setText("暂停 (Alt+P/空格)")
+        self.prefetch_upcoming()
+        self.prepare_next_track()
+        if MetadataCache.make_key(song_info['path']) not in self.seek_indexes:
+            self.seek_index_builder.request(song_info['path'])
+        self.request_decoding()
+        self.show_waveform(song_info)
+
+    def upcoming_indices(self):
+        """接下来可能播放的歌曲（用于预读）：顺序播放时多看一首"""
+        next_index = self.peek_next_index()
+        if next_index is None:
+            return []
+        indices = [next_index]
+        if self.play_mode == 0 and next_index + 1 < len(self.song_list):
+            indices.append(next_index + 1)
+        return indices
+
+    def prefetch_upcoming(self):
+        self.readahead.prefetch([self.song_list[i]['path'] for i in self.upcoming_indices()])
+
+    def peek_next_index(self):
+        """自然播放结束后将要播放的下一首（不改变任何状态），没有时返回 None"""
+        if not 0 <= self.current_index < len(self.song_list):
+            return None
+        if self.play_mode == 0:  # 顺序播放
+            next_index = self.current_index + 1
+            return next_index if next_index < len(self.song_list) else None
+        if self.play_mode == 1:  # 单曲循环
+            return self.current_index
+        # 随机播放：预先抽好，真正切歌时直接使用
+        if self.next_random_index is None:
+            self.next_random_index = self.pick_random_index()
+        return self.next_random_index
+
+    def prepare_next_track(self):
+        """无缝播放：提前打开下一首交给混音器排队，当前歌曲一结束就接着播放"""
+        if not (self.gapless and self.is_playing):
+            return
+        next_index = self.peek_next_index()
+        self.pending_queue_index = None
+        if next_index is None or not 0 <= next_index < len(self.song_list):
+            if self.queued_index is not None:
+                self.engine.clear_queue()
+            self.queued_index = None
+            return
+        song_info = self.song_list[next_index]
+        if self.readahead.enabled and not self.readahead.contains(song_info['path']):
+            # 等预读完成后再排队，避免混音器播放下一首时直接从网络盘读取
+            if self.queued_index is not None:
+                self.engine.clear_queue()
+            self.queued_index = None
+            self.pending_queue_index = next_index
+            self.readahead.prefetch([self.song_list[i]['path'] for i in self.upcoming_indices()])
+            return
+        self.engine.queue(song_info, song_info['path'], self.track_gain(song_info))
+        self.queued_index = next_index
+
+    def on_readahead_finished(self, file_path, cached):
+        """预读完成（或无法缓存）：如果正等着它排队，现在交给混音器"""
+        index = self.pending_queue_index
+        if index is None or not 0 <= index < len(self.song_list):
+            return
+        song_info = self.song_list[index]
+        if ReadAheadCache.key(song_info['path']) != ReadAheadCache.key(file_path):
+            return
+        self.pending_queue_index = None
+        if self.gapless and self.is_playing and self.peek_next_index() == index:
+            self.engine.queue(song_info, song_info['path'], self.track_gain(song_info))
+            self.queued_index = index
+
+    def requeue_next_track(self):
+        """播放模式或播放列表变化后重新决定排队的下一首"""
+        self.next_random_index = None
+        if self.is_playing:
+            self.prefetch_upcoming()
+        if self.is_playing and (self.queued_index is not None or self.gapless):
+            self.prepare_next_track()
+
+    def set_gapless(self, enabled):
+        self.gapless = enabled
+        self.settings.setValue("gapless_playback", enabled)
+        if enabled:
+            self.prepare_next_track()
+        else:
+            self.pending_queue_index = None
+            if self.queued_index is not None:
+                self.queued_index = None
+                self.engine.clear_queue()
+
+    def set_pcm_cache(self, enabled):
+        self.settings.setValue("pcm_cache", enabled)
+        if enabled and self.pcm_cache is None and pygame.mixer.get_init():
+            budget_mb = self.settings.value("pcm_cache_mb", 4096, type=int)
+            self.pcm_cache = PcmCache(self.pcm_cache_dir, budget_mb * 1024 * 1024, pygame.mixer.get_init(), self)
+            self.pcm_cache.decoded.connect(self.on_pcm_decoded)
+            if self.is_playing:
+                self.request_decoding()
+        elif not enabled and self.pcm_cache is not None:
+            self.pcm_cache.close()
+            self.pcm_cache = None
+        self.engine.pcm_cache = self.pcm_cache
+
+    def request_decoding(self):
+        """在后台解码当前歌曲；开启音效或频谱时把接下来的歌也解码好，切歌后不会中断"""
+        if self.pcm_cache is None or not 0 <= self.current_index < len(self.song_list):
+            return
+        indices = [self.current_index]
+        if self.needs_channel():
+            indices += self.upcoming_indices()
+        for index in indices:
+            song_info = self.song_list[index]
+            if self.pcm_cache.fits(song_info.get('duration', 0)):
+                self.pcm_cache.request(song_info['path'])
+
+    def on_pcm_decoded(self, file_path):
+        """开启音效或频谱时，排队的下一首解码完成后重新排队，接上时改用声道播放。
+        正在播放的歌不在中途切换（换播放方式会有一次停顿），下一次跳转或重播时才用上解码缓存"""
+        if not (self.needs_channel() and self.is_playing):
+            return
+        key = MetadataCache.make_key(file_path)
+        if self.queued_index is not None and 0 <= self.queued_index < len(self.song_list) and \
+                MetadataCache.make_key(self.song_list[self.queued_index]['path']) == key:
+            self.prepare_next_track()
+
+    def dsp_active(self):
+        return (self.eq_enabled and any(self.eq_gains)) or self.limiter_enabled
+
+    def needs_channel(self):
+        """音效和频谱都只能作用于通过声道播放的已解码歌曲"""
+        return self.dsp_active() or self.spectrum_enabled
+
+    def apply_dsp(self):
+        """把均衡器/限幅器设置交给引擎；需要时打开解码缓存并开始解码"""
+        self.engine.set_dsp(self.eq_gains if self.eq_enabled else None, self.limiter_enabled)
+        if not self.needs_channel():
+            return
+        if self.pcm_cache is None:
+            self.set_pcm_cache(True)
+            if hasattr(self, 'pcm_cache_checkbox'):
+                self.pcm_cache_checkbox.setChecked(self.pcm_cache is not None)
+        if self.is_playing:
+            self.request_decoding()
+
+    def set_eq_enabled(self, enabled):
+        self.eq_enabled = enabled
+        self.settings.setValue("eq_enabled", enabled)
+        self.apply_dsp()
+
+    def set_eq_gains(self, gains_db):
+        self.eq_gains = list(gains_db)
+        self.settings.setValue("eq_gains", ",".join(f"{gain:g}" for gain in self.eq_gains))
+        self.apply_dsp()
+
+    def set_limiter_enabled(self, enabled):
+        self.limiter_enabled = enabled
+        self.settings.setValue("limiter_enabled", enabled)
+        self.apply_dsp()
+
+    def show_equalizer(self):
+        dialog = EqualizerDialog(self, self)
+        dialog.exec_()
+
+    def set_spectrum_enabled(self, enabled):
+        self.spectrum_enabled = enabled
+        self.settings.setValue("spectrum_enabled", enabled)
+        self.spectrum_widget.setVisible(enabled)
+        self.apply_dsp()
+
+    def track_gain(self, song_info):
+        """这首歌的音量增益（线性）；还没有分析过时返回 1.0 并在后台分析"""
+        if not self.replay_gain or self.loudness_analyzer is None:
+            return 1.0
+        key = MetadataCache.make_key(song_info['path'])
+        gain = self.track_gains.get(key)
+        if gain is None:
+            result = self.metadata_cache.lookup_loudness(song_info['path']) if self.metadata_cache else None
+            if result is None:
+                self.loudness_analyzer.analyze(self.loudness_items([song_info]))
+                return 1.0
+            gain = self.track_gains[key] = self.loudness_gain(*result)
+        return gain
+
+    def loudness_gain(self, loudness, peak):
+        """把响度调到目标值所需的增益。
+
+        只衰减不提升：pygame 的音量不能超过 1.0，提升会被音量上限截掉，
+        响亮的歌被压低而安静的歌却提不上去。衰减也不会削波，不需要再参考峰值。"""
+        gain_db = self.replay_gain_target - loudness
+        return 10 ** (max(-24.0, min(0.0, gain_db)) / 20)
+
+    def loudness_items(self, songs):
+        # 解码缓存与分析进程的格式相同时，分析直接读取缓存文件而不必重新解码
+        use_pcm = self.pcm_cache is not None and self.pcm_cache.mixer_format == LOUDNESS_FORMAT
+        return [(song['path'], self.pcm_cache.cache_path(song['path']) if use_pcm else None)
+                for song in songs]
+
+    def analyze_library_loudness(self):
+        if self.loudness_analyzer is not None and self.song_list:
+            self.statusBar().showMessage("正在检查需要分析的歌曲…", 3000)
+            self.loudness_analyzer.analyze(self.loudness_items(self.song_list), batch=True)
+
+    def on_loudness_analyzed(self, file_path, loudness, peak):
+        key = MetadataCache.make_key(file_path)
+        self.track_gains[key] = self.loudness_gain(loudness, peak)
+        if not self.replay_gain:
+            return
+        if 0 <= self.current_index < len(self.song_list) and \
+                MetadataCache.make_key(self.song_list[self.current_index]['path']) == key:
+            self.engine.set_gain(self.track_gains[key])
+        if self.queued_index is not None and 0 <= self.queued_index < len(self.song_list) and \
+                MetadataCache.make_key(self.song_list[self.queued_index]['path']) == key:
+            self.prepare_next_track()
+
+    def show_waveform(self, song_info):
+        """进度条显示这首歌的波形：已经分析过的直接从缓存读取，否则交给分析进程（不影响播放）"""
+        waveform = self.metadata_cache.lookup_waveform(song_info['path']) if self.metadata_cache else None
+        self.progress_slider.set_waveform(waveform)
+        if waveform is None and self.loudness_analyzer is not None:
+            self.loudness_analyzer.analyze(self.loudness_items([song_info]))
+
+    def on_waveform_ready(self, file_path, waveform):
+        if 0 <= self.current_index < len(self.song_list) and \
+                MetadataCache.make_key(self.song_list[self.current_index]['path']) == MetadataCache.make_key(file_path):
+            self.progress_slider.set_waveform(waveform)
+
+    def on_loudness_progress(self, done, total):
+        if total > 1:
+            message = "音量分析完成" if done >= total else f"音量分析 {done}/{total}"
+            self.statusBar().showMessage(message, 3000)
+
+    def set_replay_gain(self, enabled):
+        self.replay_gain = enabled
+        self.settings.setValue("replay_gain", enabled)
+        if 0 <= self.current_index < len(self.song_list):
+            self.engine.set_gain(self.track_gain(self.song_list[self.current_index]))
+        if self.queued_index is not None:
+            self.prepare_next_track()
+
+    def record_gap(self, gap_ms):
+        """记录切歌间隙；超出预算时在状态栏提示"""
+        gap_ms = self.gap_stats.record(gap_ms)
+        if gap_ms > self.gap_stats.budget_ms:
+            self.statusBar().showMessage(
+                f"切歌间隙 {gap_ms:.0f} ms（超过 {self.gap_stats.budget_ms:.0f} ms）", 3000
+            )
+        self.update_gap_tooltip()
+
+    def update_gap_tooltip(self):
+        summary = self.gap_stats.summary()
+        text = "提前打开下一首交给混音器排队，切歌时没有停顿"
+        if summary['count']:
+            text += (f"\n最近切歌间隙: 平均 {summary['mean']:.1f} ms, 95% {summary['p95']:.1f} ms, "
+                     f"最大 {summary['max']:.1f} ms; 超过 {self.gap_stats.budget_ms:.0f} ms 的 "
+                     f"{summary['over_budget']}/{summary['count']} 次")
+        if self.readahead.enabled:
+            stats = self.readahead.stats()
+            text += (f"\n预读缓存: 命中率 {stats['hit_rate']:.0%} ({stats['hits']}/{stats['hits'] + stats['misses']}), "
+                     f"内存 {stats['memory_used'] / 1048576:.0f}/{self.readahead.memory_budget / 1048576:.0f} MB, "
+                     f"溢出 {stats['spill_used'] / 1048576:.0f} MB")
+        self.gapless_checkbox.setToolTip(text)
 
     def toggle_play(self):
         """切换播放/暂停"""
         try:
             if self.is_playing:
-                pygame.mixer.music.pause()
+                self.engine.pause()
                 self.is_playing = False
+                self.playback_clock.pause()
+                self.show_position(self.playback_clock.position())
                 self.play_btn.setText("播放 (Alt+P/空格)")
             else:
                 # 如果音乐已加载，恢复播放
                 if self.music_loaded and self.current_index >= 0:
-                    pygame.mixer.music.unpause()
+                    self.engine.resume()
                     self.is_playing = True
+                    self.playback_clock.resume()
+                    self.start_progress_animation()
                     self.play_btn.setText("暂停 (Alt+P/空格)")
                 # 如果音乐未加载但有歌曲列表，播放当前索引或第一首
                 elif len(self.song_list) > 0:
@@ -1357,39 +5923,44 @@ class MusicPlayer(QMainWindow):
             print(f"toggle_play 错误: {e}")
 
     def previous_song(self):
-        """上一曲 - 从历史记录中获取上一曲"""
-        # 尝试从历史记录获取上一曲
+        """上一曲 - 在播放历史中后退"""
         prev_index = self.get_previous_from_history()
         if prev_index is not None:
             self.play_song_at_index(prev_index)
         else:
-            # 如果没有历史记录，随机播放一首歌
-            if len(self.song_list) > 0:
-                random_index = random.randint(0, len(self.song_list) - 1)
-                # 避免选择相同的歌曲
-                while random_index == self.current_index and len(self.song_list) > 1:
-                    random_index = random.randint(0, len(self.song_list) - 1)
-                self.play_song_at_index(random_index)
+            # 已经退到最早的记录，随机播放一首歌
+            self.play_random_song()
 
     def next_song(self):
-        """下一曲 - 随机播放下一曲"""
+        """下一曲 - 之前后退过就在历史中前进，否则从随机播放袋中取下一首"""
         if len(self.song_list) > 0:
-            # 记录当前播放的歌曲到历史记录
-            if self.current_index >= 0:
-                self.add_to_history(self.current_index)
-
-            # 随机选择下一曲
-            random_index = random.randint(0, len(self.song_list) - 1)
-            # 避免选择相同的歌曲（如果列表中有多首歌）
-            while random_index == self.current_index and len(self.song_list) > 1:
-                random_index = random.randint(0, len(self.song_list) - 1)
-
-            self.play_song_at_index(random_index)
+            next_index = self.play_history.forward()
+            if next_index is not None:
+                self.play_song_at_index(next_index)
+                self.save_shuffle_state()
+            else:
+                self.play_random_song()
+
+    def pick_random_index(self):
+        """抽取一首随机歌曲（加权抽取，或一轮之内不重复）"""
+        if self.weighted_shuffle:
+            # 最近播放过的歌不马上重复
+            recent = set(self.play_history.recent(min(len(self.song_list) // 2, 20)))
+            recent.add(self.current_index)
+            index = self.weighted_sampler.pick(reject=recent.__contains__)
+            if index >= 0:
+                return index
+            # 所有歌都刚放过（列表很短），退回一轮之内不重复的抽取
+        return self.shuffle_bag.next_index(avoid=self.current_index)
 
     def play_random_song(self):
         """播放随机歌曲"""
         if len(self.song_list) > 0:
-            random_index = random.randint(0, len(self.song_list) - 1)
+            # 无缝播放时已经预先抽好了下一首
+            random_index = self.next_random_index
+            self.next_random_index = None
+            if random_index is None or not 0 <= random_index < len(self.song_list):
+                random_index = self.pick_random_index()
             self.play_song_at_index(random_index)
             self.add_to_history(random_index)
 
@@ -1402,10 +5973,13 @@ class MusicPlayer(QMainWindow):
         # 保存播放模式
         self.settings.setValue("play_mode", self.play_mode)
 
+        # 自然结束后的下一首变了
+        self.requeue_next_track()
+
     def change_volume(self, value):
         """改变音量"""
         self.volume = value
-        pygame.mixer.music.set_volume(value / 100.0)
+        self.engine.set_volume(value / 100.0)
         self.volume_label.setText(f"{value}%")
 
         # 保存音量设置
@@ -1415,16 +5989,11 @@ class MusicPlayer(QMainWindow):
         """更新当前歌曲显示"""
         if 0 <= self.current_index < len(self.song_list):
             song_info = self.song_list[self.current_index]
-            display_text = song_info.get('display_name', f"{song_info['title']} - {song_info['artist']}")
+            display_text = PlaylistModel.display_text(song_info)
             self.current_song_label.setText(display_text)
 
             # 高亮当前播放的歌曲
-            for i in range(self.playlist_widget.count()):
-                item = self.playlist_widget.item(i)
-                if i == self.current_index:
-                    item.setBackground(Qt.lightGray)
-                else:
-                    item.setBackground(Qt.white)
+            self.playlist_model.set_highlight_row(self.current_index)
 
             # 更新进度条范围
             self.progress_slider.setRange(0, self.duration)
@@ -1461,26 +6030,28 @@ class MusicPlayer(QMainWindow):
         """后退5秒"""
         if self.is_playing and self.current_index >= 0:
             # pygame 不支持直接 seek，需要重新播放并跳转
-            new_position = max(0, self.current_position - 5000)
+            new_position = max(0, self.playback_clock.position() - 5000)
             self.seek_to_position(new_position)
 
     def seek_forward(self):
         """前进5秒"""
         if self.is_playing and self.current_index >= 0:
-            new_position = min(self.duration, self.current_position + 5000)
+            new_position = min(self.duration, self.playback_clock.position() + 5000)
             self.seek_to_position(new_position)
 
     def seek_to_position(self, position_ms):
         """跳转到指定位置（毫秒）"""
-        if self.current_index >= 0:
-            try:
-                # pygame.mixer.music.play(start=) 使用秒为单位
-                pygame.mixer.music.play(start=position_ms / 1000.0)
-                # 设置跳转偏移量，因为 get_pos() 会从 0 开始计算
-                self.seek_offset = position_ms
-                self.current_position = position_ms
-            except Exception as e:
-                print(f"跳转失败: {e}")
+        if 0 <= self.current_index < len(self.song_list):
+            # 播放引擎负责重新播放并修正 get_pos() 的偏移；MP3 有帧索引时直接定位到目标帧
+            path = self.song_list[self.current_index]['path']
+            self.engine.seek(position_ms, self.seek_indexes.get(MetadataCache.make_key(path)))
+            self.playback_clock.seek(position_ms)
+            self.show_position(self.playback_clock.position())
+
+    def on_seek_index_built(self, file_path, index):
+        self.seek_indexes[MetadataCache.make_key(file_path)] = index
+        while len(self.seek_indexes) > 8:
+            self.seek_indexes.popitem(last=False)
 
     def smart_next_shortcut(self):
         """Alt+右方向键: 智能单曲循环模式下的随机下一曲"""
@@ -1493,42 +6064,123 @@ class MusicPlayer(QMainWindow):
 
     def slider_pressed(self):
         """进度条被按下"""
-        self.timer.stop()
+        self.slider_dragging = True
 
     def slider_released(self):
         """进度条被释放"""
+        self.slider_dragging = False
         position = self.progress_slider.value()
         self.seek_to_position(position)
-        self.timer.start()
 
-    def update_progress(self):
-        """更新进度"""
+    def update_progress(self, position, measured_at):
+        """播放引擎送来的播放位置（毫秒）：校正播放时钟"""
         if self.is_playing:
-            # 使用 pygame 获取当前播放位置
-            try:
-                # 先检查歌曲是否播放结束
-                if not pygame.mixer.music.get_busy():
-                    self.on_song_finished()
-                    return
+            self.playback_clock.sync(position, measured_at)
+            if not self.progress_timer.isActive():
+                self.show_position(self.playback_clock.position())
+
+    def start_progress_animation(self):
+        """按进度条移动一个像素所需的时间刷新（16-250 毫秒），窗口隐藏或最小化时不刷新"""
+        if not (self.is_playing and self.isVisible() and not self.isMinimized()):
+            self.progress_timer.stop()
+            return
+        pixels = max(1, self.progress_slider.width())
+        interval = int(min(250, max(16, self.duration / pixels))) if self.duration > 0 else 250
+        self.progress_timer.start(interval)
 
-                pos = pygame.mixer.music.get_pos()  # 返回毫秒（从当前play()调用开始）
-                if pos >= 0:
-                    # 加上跳转偏移量得到实际位置
-                    actual_pos = pos + self.seek_offset
-                    self.current_position = actual_pos
-                    self.progress_slider.setValue(actual_pos)
-                    self.time_label.setText(self.format_time(actual_pos))
-            except:
-                pass
+    def animate_progress(self):
+        if not (self.is_playing and self.isVisible() and not self.isMinimized()):
+            self.progress_timer.stop()
+            return
+        self.show_position(self.playback_clock.position())
+
+    def show_position(self, position):
+        """显示播放位置；只有滑块会移动、时间文字会变化时才更新控件"""
+        position = int(position)
+        self.current_position = position
+        if self.slider_dragging:
+            return
+        step = max(1, (self.progress_slider.maximum() - self.progress_slider.minimum())
+                   // max(1, self.progress_slider.width()))
+        if abs(position - self.progress_slider.value()) >= step:
+            self.progress_slider.setValue(position)
+        text = self.format_time(position)
+        if text != self.time_label.text():
+            self.time_label.setText(text)
+
+    def _row_of_song(self, song_info, hint=-1):
+        """播放引擎回传的歌曲字典对应的行号（先看 hint，行号变过时由模型查找）"""
+        if 0 <= hint < len(self.song_list) and self.song_list[hint] is song_info:
+            return hint
+        return self.playlist_model.row_of(song_info)
+
+    def on_engine_track_started(self, song_info, from_queue, gap_ms):
+        """播放引擎开始播放一首歌：直接播放的确认，或排队的下一首已经无缝接上"""
+        if from_queue:
+            self.on_queued_track_started(song_info)
+        else:
+            self.play_stats.record(song_info['path'], 'p')
+        if gap_ms >= 0:
+            self.record_gap(gap_ms)
+        else:
+            self.update_gap_tooltip()
+
+    def on_engine_load_failed(self, song_info, message):
+        """播放引擎打不开文件：标记为不可用"""
+        print(f"播放失败: {message}")
+        row = self._row_of_song(song_info, self.current_index)
+        if row >= 0:
+            self.mark_song_unavailable(row)
+        if row == self.current_index:
+            self.is_playing = False
+            self.music_loaded = False
+            self.play_btn.setText("播放 (Alt+P/空格)")
+
+    def on_engine_queue_failed(self, song_info, message):
+        """无法预先打开下一首：不排队，结束时按普通方式打开"""
+        print(f"无法预先打开下一首: {message}")
+        if self.queued_index is not None and self._row_of_song(song_info, self.queued_index) == self.queued_index:
+            self.queued_index = None
+
+    def on_engine_ended(self, ended_at):
+        """自然播放结束（没有排队的下一首）"""
+        if not self.is_playing:
+            return
+        # 下一首由 on_song_finished 打开，引擎据此计算切歌间隙
+        self.track_ended_at = ended_at
+        self.on_song_finished()
+        self.track_ended_at = None
+
+    def on_engine_channel_mode_changed(self, channel_mode):
+        """音效和频谱只对通过声道播放的已解码歌曲有效：频谱在其他时候显示提示"""
+        self.channel_mode = channel_mode
+        self.spectrum_widget.set_source_active(channel_mode)
+
+    def on_queued_track_started(self, song_info):
+        """无缝衔接：上一首自然结束，混音器已经开始播放排队的下一首"""
+        index = self._row_of_song(song_info, self.queued_index)
+        self.queued_index = None
+        if index < 0:
+            return
+        if 0 <= self.current_index < len(self.song_list):
+            self.record_play_event(self.current_index, 'f')
+        if self.play_mode == 2:
+            self.next_random_index = None
+        self.play_stats.record(song_info['path'], 'p')
+        self.begin_track(index)
+        self.add_to_history(index)
 
     def on_song_finished(self):
         """歌曲播放结束"""
         self.is_playing = False
+        if 0 <= self.current_index < len(self.song_list):
+            self.record_play_event(self.current_index, 'f')
         if self.play_mode == 0:  # 顺序播放
             # 播放下一首（顺序）
             next_index = self.current_index + 1
             if next_index < len(self.song_list):
                 self.play_song_at_index(next_index)
+                self.add_to_history(next_index)
             else:
                 self.play_btn.setText("播放 (Alt+P/空格)")
         elif self.play_mode == 1:  # 单曲循环
@@ -1573,6 +6225,18 @@ class MusicPlayer(QMainWindow):
             self.raise_()
             self.activateWindow()
 
+    def changeEvent(self, event):
+        # 最小化时停止频谱计算和进度刷新（最小化不会触发子控件的 hideEvent）
+        if event.type() == QEvent.WindowStateChange and hasattr(self, 'spectrum_widget'):
+            self.spectrum_widget.update_running()
+            self.start_progress_animation()
+        super().changeEvent(event)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if hasattr(self, 'progress_timer'):
+            self.start_progress_animation()
+
     def closeEvent(self, event):
         """关闭事件"""
         if self.tray_icon and self.tray_icon.isVisible():
@@ -1583,18 +6247,8 @@ class MusicPlayer(QMainWindow):
             event.accept()
 
     def save_playlist(self):
-        """保存当前播放列表"""
+        """保存播放状态（歌曲本身在增删改时已逐行写入播放列表数据库）"""
         if self.song_list:
-            # 保存完整的歌曲信息（包括自定义名称）
-            # 保存前将路径中的反斜杠转为正斜杠，避免双重转义
-            songs_to_save = []
-            for song in self.song_list:
-                song_copy = dict(song)
-                if 'path' in song_copy:
-                    song_copy['path'] = song_copy['path'].replace('\\', '/')
-                songs_to_save.append(song_copy)
-            self.settings.setValue("playlist_full", json.dumps(songs_to_save, ensure_ascii=False))
-
             # 保存当前播放位置
             self.settings.setValue("current_index", self.current_index)
 
@@ -1605,10 +6259,13 @@ class MusicPlayer(QMainWindow):
 
             # 保存当前文件夹名
             folder_name = self.folder_label.text()
-            self.settings.setValue("folder_label", folder_name)
+            self.library.set_meta("folder_label", folder_name)
+
+    def migrate_legacy_playlist(self):
+        """一次性把旧版 settings.ini 中的 playlist_full / playlist 迁移到播放列表数据库"""
+        if not (self.settings.contains("playlist_full") or self.settings.contains("playlist")):
+            return
 
-    def load_last_playlist(self):
-        """加载上次的播放列表"""
         saved_songs_raw = self.settings.value("playlist_full", "")
         saved_songs = []
         if saved_songs_raw and isinstance(saved_songs_raw, str):
@@ -1620,62 +6277,111 @@ class MusicPlayer(QMainWindow):
             # 兼容旧格式
             saved_songs = saved_songs_raw
 
-        if saved_songs and isinstance(saved_songs, list):
-            existing_songs = []
-            for song_info in saved_songs:
-                if isinstance(song_info, dict) and 'path' in song_info:
-                    if os.path.exists(song_info['path']):
-                        existing_songs.append(song_info)
-
-            if existing_songs:
-                self.song_list = existing_songs
-                for song_info in existing_songs:
-                    display_text = song_info.get('display_name', f"{song_info['title']} - {song_info['artist']}")
-                    item = QListWidgetItem(display_text)
-                    self.playlist_widget.addItem(item)
-
-                current_index = self.settings.value("current_index", 0, type=int)
-                if 0 <= current_index < len(self.song_list):
-                    self.current_index = current_index
-
-                play_mode = self.settings.value("play_mode", 0, type=int)
-                if 0 <= play_mode <= 2:
-                    self.mode_combo.setCurrentIndex(play_mode)
-
-                volume = self.settings.value("volume", 70, type=int)
-                if 0 <= volume <= 100:
-                    self.volume_slider.setValue(volume)
-                    pygame.mixer.music.set_volume(volume / 100.0)
-
-                folder_name = self.settings.value("folder_label", "")
-                if folder_name:
-                    self.folder_label.setText(folder_name)
-                    self.folder_label.setVisible(True)
-        else:
+        legacy_paths = []
+        if not saved_songs:
             song_paths = self.settings.value("playlist", [])
             if song_paths and isinstance(song_paths, list):
-                existing_paths = [p for p in song_paths if os.path.exists(p)]
-                if existing_paths:
-                    self.add_files_to_playlist(existing_paths)
+                legacy_paths = song_paths
+
+        if self.library.is_empty():
+            if isinstance(saved_songs, list):
+                songs = [dict(song_info) for song_info in saved_songs
+                         if isinstance(song_info, dict) and 'path' in song_info]
+                self.library.insert_tracks(songs)
+            if legacy_paths:
+                # 最老的格式只有路径，需要补读标签
+                self.library.insert_tracks(
+                    [self.get_song_info(os.path.normpath(p)) for p in legacy_paths]
+                )
+            folder_name = self.settings.value("folder_label", "")
+            if folder_name:
+                self.library.set_meta("folder_label", folder_name)
+
+        self.settings.remove("playlist_full")
+        self.settings.remove("playlist")
+        self.settings.remove("folder_label")
+
+    def load_last_playlist(self):
+        """加载上次的播放列表"""
+        self.migrate_legacy_playlist()
+
+        # 直接按快照显示，不在这里检查文件是否存在（网络盘可能很慢）
+        saved_songs = self.library.load_tracks()
+        if saved_songs:
+            without_pinyin = [song_info for song_info in saved_songs if 'pinyin' not in song_info]
+            # 建立搜索索引时会补算缺少的拼音键
+            self.playlist_model.set_tracks(saved_songs)
+            if without_pinyin:
+                self.library.update_pinyin(without_pinyin)
+
+            # 文件是否还存在交给后台线程检查，不存在的标记为不可用
+            self.existence_check_id = self.existence_checker.start(saved_songs)
+
+            current_index = self.settings.value("current_index", 0, type=int)
+            if 0 <= current_index < len(self.song_list):
+                self.current_index = current_index
+
+            self.restore_shuffle_state()
+
+            play_mode = self.settings.value("play_mode", 0, type=int)
+            if 0 <= play_mode <= 2:
+                self.mode_combo.setCurrentIndex(play_mode)
+
+            volume = self.settings.value("volume", 70, type=int)
+            if 0 <= volume <= 100:
+                self.volume_slider.setValue(volume)
+                self.engine.set_volume(volume / 100.0)
+
+            folder_name = self.library.get_meta("folder_label", "")
+            if folder_name:
+                self.folder_label.setText(folder_name)
+                self.folder_label.setVisible(True)
+
+    def on_missing_songs_found(self, check_id, track_ids):
+        """后台检查发现文件不存在的歌曲，原地标记为不可用"""
+        if check_id != self.existence_check_id:
+            return
+        missing_ids = set(track_ids)
+        self.playlist_model.set_missing(
+            [i for i, song_info in enumerate(self.song_list) if song_info.get('id') in missing_ids]
+        )
+
+    def mark_song_unavailable(self, index):
+        """把播放列表中的一首歌标记为不可用（文件不存在或无法打开），保留在列表中"""
+        self.playlist_model.set_missing([index])
+
+    def on_search_text_changed(self, text):
+        """搜索框内容变化：清空时立即恢复，否则等输入停顿后再过滤"""
+        if text.strip():
+            self.search_timer.start()
+        else:
+            self.search_timer.stop()
+            self.filter_playlist()
 
     def filter_playlist(self):
-        """过滤播放列表"""
-        search_text = self.search_box.text().lower()
-        
-        for i in range(self.playlist_widget.count()):
-            item = self.playlist_widget.item(i)
-            if search_text in item.text().lower():
-                item.setHidden(False)
-            else:
-                item.setHidden(True)
+        """过滤播放列表（使用预先计算的搜索索引）"""
+        text = self.search_box.text()
+        if self.fuzzy_checkbox.isChecked() and len(normalize_search_text(text).strip()) >= FuzzySearchIndex.N:
+            rows = self.fuzzy_index.search(text)
+        else:
+            # 关键字太短时三元组没有区分度，仍按子串匹配
+            rows = self.search_index.search(text)
+        if rows is None and not self.playlist_filter.is_filtered():
+            return
+        self.playlist_filter.set_filter_rows(rows)
+
+    def on_fuzzy_search_toggled(self, checked):
+        """切换模糊搜索，按新的方式重新过滤"""
+        self.settings.setValue("fuzzy_search", checked)
+        self.search_timer.stop()
+        self.filter_playlist()
 
     def clear_search(self):
         """清除搜索"""
         self.search_box.clear()
         # 显示所有项目
-        for i in range(self.playlist_widget.count()):
-            item = self.playlist_widget.item(i)
-            item.setHidden(False)
+        self.search_timer.stop()
+        self.filter_playlist()
 
     def focus_search_box(self):
         """聚焦搜索框"""
@@ -1684,109 +6390,191 @@ class MusicPlayer(QMainWindow):
     
     def focus_playlist_from_search(self):
         """从搜索框聚焦到播放列表"""
-        self.playlist_widget.setFocus()
+        self.playlist_view.setFocus()
         
+        # 如果还在等待过滤，先立即完成过滤
+        if self.search_timer.isActive():
+            self.search_timer.stop()
+            self.filter_playlist()
+
         # 如果没有选中项，选择第一个可见项
-        if not self.playlist_widget.currentItem():
-            for i in range(self.playlist_widget.count()):
-                item = self.playlist_widget.item(i)
-                if not item.isHidden():
-                    self.playlist_widget.setCurrentItem(item)
-                    break
+        if not self.playlist_view.currentIndex().isValid() and self.playlist_filter.rowCount() > 0:
+            self.playlist_view.setCurrentIndex(self.playlist_filter.index(0))
     
     def locate_current_song(self):
         """定位到正在播放的歌曲"""
-        if self.current_index >= 0 and self.current_index < self.playlist_widget.count():
+        if self.current_index >= 0 and self.current_index < len(self.song_list):
             # 清除搜索框，显示所有歌曲
             self.clear_search()
 
             # 选中并滚动到当前播放的歌曲
-            current_item = self.playlist_widget.item(self.current_index)
-            if current_item:
-                self.playlist_widget.setCurrentItem(current_item)
-                self.playlist_widget.scrollToItem(current_item, QListWidget.PositionAtCenter)
-                self.playlist_widget.setFocus()
+            current_view_index = self._view_index_for_row(self.current_index)
+            if current_view_index.isValid():
+                self.playlist_view.setCurrentIndex(current_view_index)
+                self.playlist_view.scrollTo(current_view_index, QAbstractItemView.PositionAtCenter)
+                self.playlist_view.setFocus()
         else:
             # 如果没有正在播放的歌曲，显示提示
             QMessageBox.information(self, "提示", "当前没有正在播放的歌曲")
     
     def add_to_history(self, index):
-        """记录上一曲 - 只保存最后一首歌曲"""
-        # 只保存当前歌曲作为"上一曲"
-        self.play_history = [index]
-        self.history_index = 0
+        """记录开始播放的歌曲"""
+        self.play_history.push(index)
+        self.save_shuffle_state()
     
     def get_previous_from_history(self):
-        """获取上一曲"""
-        if len(self.play_history) > 0:
-            # 返回保存的上一曲，并清空历史记录避免重复返回
-            prev_index = self.play_history[0]
-            self.play_history = []
-            self.history_index = -1
-            return prev_index
-        return None
+        """获取上一曲（可以连续后退，直到最早的记录）"""
+        prev_index = self.play_history.back()
+        if prev_index is not None:
+            self.save_shuffle_state()
+        return prev_index
+
+    def save_shuffle_state(self):
+        """保存随机播放袋（种子 + 已抽取数 + 本轮的大小变化）和播放历史（歌曲 id），重启后接着原来的顺序"""
+        seed, count, sizes = self.shuffle_bag.state()
+        self.settings.setValue(
+            "shuffle_state", ",".join([str(seed), str(count)] + [f"{drawn}:{size}" for drawn, size in sizes])
+        )
+        history_ids = [self.song_list[i].get('id', -1) for i in self.play_history.items()]
+        self.settings.setValue("play_history", ",".join(map(str, history_ids)))
+        self.settings.setValue("play_history_position", self.play_history.position())
+
+    def restore_shuffle_state(self):
+        """启动时恢复随机播放袋和播放历史"""
+        size = len(self.song_list)
+        try:
+            # 旧版本只保存了 "种子,已抽取数"，这时按现在的大小重放
+            seed, count, *sizes = self.settings.value("shuffle_state", "", type=str).split(",")
+            sizes = [tuple(int(x) for x in item.split(":")) for item in sizes]
+            self.shuffle_bag.restore(size, int(seed), int(count), sizes)
+        except ValueError:
+            self.shuffle_bag.reset(size)
+
+        history_ids = self.settings.value("play_history", "", type=str)
+        if history_ids:
+            row_of_id = {song_info.get('id'): i for i, song_info in enumerate(self.song_list)}
+            items = []
+            position = self.settings.value("play_history_position", -1, type=int)
+            for i, track_id in enumerate(history_ids.split(",")):
+                row = row_of_id.get(int(track_id)) if track_id.lstrip('-').isdigit() else None
+                if row is not None:
+                    items.append(row)
+                elif i <= position:
+                    position -= 1
+            self.play_history.load(items, position)
+
+        if self.play_history.current() is None and self.current_index >= 0:
+            # 没有历史时以上次的当前歌曲作为起点，第一次上一曲能回到它
+            self.play_history.push(self.current_index)
+
+    def on_playlist_reset(self):
+        """播放列表整体替换：历史失效，随机播放袋重新开始"""
+        self.play_history.clear()
+        self.shuffle_bag.reset(len(self.song_list))
+        self.weighted_sampler.invalidate()
+        self.requeue_next_track()
+
+    def on_playlist_rows_inserted(self, parent, first, last):
+        """追加的歌曲直接加入本轮随机播放袋"""
+        self.shuffle_bag.grow(len(self.song_list))
+        self.weighted_sampler.append(
+            [self.play_stats.weight(song_info['path']) for song_info in self.song_list[first:last + 1]]
+        )
+        # 顺序播放到了列表末尾时，新加入的歌就是下一首
+        if self.play_mode == 0 and self.queued_index is None:
+            self.prepare_next_track()
+
+    def on_playlist_rows_removed(self, parent, first, last):
+        """删除歌曲：历史中的行号前移，随机播放袋开始新的一轮"""
+        self.play_history.remove_rows(first, last)
+        self.shuffle_bag.reset(len(self.song_list))
+        self.weighted_sampler.invalidate()
+        self.save_shuffle_state()
+        # 当前歌曲的行号由调用方调整后再重新排队
+        QTimer.singleShot(0, self.requeue_next_track)
+
+    def shuffle_weights(self):
+        """所有歌曲的随机播放权重（别名表重建时调用）"""
+        weight = self.play_stats.weight
+        return [weight(song_info['path']) for song_info in self.song_list]
+
+    def record_play_event(self, index, event):
+        """记录播放统计，并更新这首歌的抽样权重"""
+        file_path = self.song_list[index]['path']
+        self.play_stats.record(file_path, event)
+        self.weighted_sampler.set_weight(index, self.play_stats.weight(file_path))
+
+    def record_skip(self):
+        """正在播放的歌还没放到一半就被切走，记为一次跳过"""
+        if (self.is_playing and 0 <= self.current_index < len(self.song_list)
+                and self.duration > 0 and self.playback_clock.position() < self.duration / 2):
+            self.record_play_event(self.current_index, 's')
+
+    def set_weighted_shuffle(self, enabled):
+        self.weighted_shuffle = enabled
+        self.settings.setValue("weighted_shuffle", enabled)
+
+    def show_play_stats(self):
+        """显示随机播放权重"""
+        dialog = PlayStatsDialog(self, self)
+        dialog.exec_()
     
     def smart_next_song(self):
-        """智能下一曲 - 在智能单曲循环模式下使用"""
+        """智能下一曲 - 在智能单曲循环模式下使用：总是换一首不同于当前的随机歌曲"""
         if len(self.song_list) > 0:
-            # 将当前播放的歌曲加入历史记录
-            if self.current_index >= 0:
-                self.add_to_history(self.current_index)
-
-            random_index = random.randint(0, len(self.song_list) - 1)
-            # 避免选择相同的歌曲
-            while random_index == self.current_index and len(self.song_list) > 1:
-                random_index = random.randint(0, len(self.song_list) - 1)
+            random_index = self.shuffle_bag.next_index(avoid=self.current_index)
             self.play_song_at_index(random_index)
+            self.add_to_history(random_index)
 
     def rename_current_item(self):
         """重命名当前选中的项目"""
-        current_item = self.playlist_widget.currentItem()
-        if current_item:
-            self.rename_playlist_item(current_item)
+        current_index = self.playlist_view.currentIndex()
+        if current_index.isValid():
+            self.rename_playlist_item(current_index)
 
     def delete_current_item(self):
         """删除当前选中的项目"""
-        current_item = self.playlist_widget.currentItem()
-        if current_item:
-            self.delete_playlist_item(current_item)
+        current_index = self.playlist_view.currentIndex()
+        if current_index.isValid():
+            self.delete_playlist_item(current_index)
 
     def show_context_menu(self, position):
         """显示右键菜单"""
-        item = self.playlist_widget.itemAt(position)
-        if item is None:
+        view_index = self.playlist_view.indexAt(position)
+        if not view_index.isValid():
             return
         
         menu = QMenu()
         
         # 重命名动作
         rename_action = QAction("重命名 (Ctrl+R)", self)
-        rename_action.triggered.connect(lambda: self.rename_playlist_item(item))
+        rename_action.triggered.connect(lambda: self.rename_playlist_item(view_index))
         menu.addAction(rename_action)
         
         # 删除动作
         delete_action = QAction("从列表中删除 (Delete)", self)
-        delete_action.triggered.connect(lambda: self.delete_playlist_item(item))
+        delete_action.triggered.connect(lambda: self.delete_playlist_item(view_index))
         menu.addAction(delete_action)
         
         menu.addSeparator()
         
         # 播放动作
         play_action = QAction("播放", self)
-        play_action.triggered.connect(lambda: self.play_selected_song(item))
+        play_action.triggered.connect(lambda: self.play_selected_song(view_index))
         menu.addAction(play_action)
         
         # 显示菜单
-        menu.exec_(self.playlist_widget.mapToGlobal(position))
+        menu.exec_(self.playlist_view.viewport().mapToGlobal(position))
 
-    def rename_playlist_item(self, item):
+    def rename_playlist_item(self, view_index):
         """重命名播放列表项目"""
-        current_text = item.text()
-        
         # 获取当前项目的索引
-        item_index = self.playlist_widget.row(item)
+        item_index = self._row_from_view_index(view_index)
         if item_index < 0 or item_index >= len(self.song_list):
             return
+
+        song_info = self.song_list[item_index]
+        current_text = PlaylistModel.display_text(song_info)
         
         # 显示输入对话框
         new_name, ok = QInputDialog.getText(
@@ -1795,21 +6583,21 @@ class MusicPlayer(QMainWindow):
         )
         
         if ok and new_name.strip():
-            # 更新列表项显示
-            item.setText(new_name.strip())
-
-            # 更新歌曲信息中的标题
-            song_info = self.song_list[item_index]
+            # 更新歌曲信息中的标题，并刷新列表中的这一行
             song_info['display_name'] = new_name.strip()
+            song_info['pinyin'] = track_pinyin(song_info)
+            self.playlist_model.track_changed(item_index)
 
             # 如果是当前播放的歌曲，更新显示
             if self.current_index == item_index:
                 self.current_song_label.setText(new_name.strip())
 
-            # 保存播放列表
-            self.save_playlist()
+            # 只更新数据库中的这一行
+            self.library.update_display_name(
+                song_info['id'], song_info['display_name'], song_info['pinyin']
+            )
 
-    def delete_playlist_item(self, item):
+    def delete_playlist_item(self, view_index):
         """从播放列表中删除项目"""
         reply = QMessageBox.question(
             self, "确认删除", "确定要从播放列表中删除这首歌曲吗？",
@@ -1817,18 +6605,15 @@ class MusicPlayer(QMainWindow):
         )
 
         if reply == QMessageBox.Yes:
-            item_index = self.playlist_widget.row(item)
-            if item_index >= 0:
-                # 从UI列表中删除
-                self.playlist_widget.takeItem(item_index)
-
-                # 从歌曲信息列表中删除
-                if item_index < len(self.song_list):
-                    del self.song_list[item_index]
+            item_index = self._row_from_view_index(view_index)
+            if 0 <= item_index < len(self.song_list):
+                # 从数据库和列表模型中删除
+                self.library.delete_tracks([self.song_list[item_index]['id']])
+                self.playlist_model.remove_track(item_index)
 
                 # 如果删除的是当前播放的歌曲，调整索引
                 if item_index == self.current_index:
-                    pygame.mixer.music.stop()
+                    self.engine.stop()
                     self.is_playing = False
                     self.current_index = -1
                 elif item_index < self.current_index:
@@ -1885,20 +6670,28 @@ class MusicPlayer(QMainWindow):
         if self.global_hotkey_process:
             self.global_hotkey_process.stop()
 
-        # 停止事件监听定时器
-        if hasattr(self, 'hotkey_event_timer'):
-            self.hotkey_event_timer.stop()
-
-        # 停止 pygame
-        try:
-            pygame.mixer.music.stop()
-            pygame.mixer.quit()
-        except:
-            pass
+        # 停止播放引擎（关闭混音器并等待线程退出）
+        self.engine.shutdown()
+        self.readahead.close()
+        self.seek_index_builder.close()
+        if self.pcm_cache is not None:
+            self.pcm_cache.close()
+        if self.loudness_analyzer is not None:
+            self.loudness_analyzer.close()
 
         # 保存当前播放列表
         self.save_playlist()
 
+        # 把尚未写盘的设置立即写盘
+        self.settings.flush()
+
+        # 关闭元数据缓存（提交未写入的记录）
+        if self.metadata_cache:
+            self.metadata_scanner.cancel()
+            self.metadata_cache.close()
+        self.library.close()
+        self.play_stats.close()
+
         # 隐藏系统托盘图标
         if self.tray_icon:
             self.tray_icon.hide()
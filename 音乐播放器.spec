@@ -5,7 +5,7 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('1024x1024.png', '.')],
+    datas=[('1024x1024.png', '.'), ('pinyin_table.txt', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},